@@ -0,0 +1,398 @@
+"""Бенчмарк traytodo без экрана (QT_QPA_PLATFORM=offscreen).
+
+Генерирует синтетические tasks_small.json (1k..1M тасков), гоняет по ним
+чтение/запись файла, загрузку окна, архив, ресайз, полночную архивацию и
+действия по клику. Для каждого замера пишет время, пиковый RSS и сколько
+байт ушло на диск. Отчет - JSON, его можно сравнить с сохраненным baseline:
+
+    python bench_traytodo.py --sizes 1000,10000 --output bench_report.json
+    python bench_traytodo.py --baseline bench_baseline.json
+
+Каждый размер считается в отдельном процессе, чтобы пиковый RSS одного
+прогона не перетекал в следующий.
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import uuid
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+ARCHIVE_RATIO = 0.97     # Доля архивных тасков в реальном файле
+ACTIVE_CHECKED_RATIO = 0.3
+IMPORTANT_RATIO = 0.05
+DATE_SPAN_DAYS = 3 * 365
+CLICK_SAMPLES = 20       # Сколько раз повторять каждое действие по клику
+PAINT_SAMPLES = 20       # Сколько кадров перерисовки мерить в каждом режиме тени
+REGRESSION_THRESHOLD = 0.2   # +20% к baseline - регрессия
+REGRESSION_MIN_SECONDS = 0.005   # Разница меньше этого - шум, не регрессия
+
+WORDS = ("buy", "call", "fix", "write", "read", "check", "send", "plan", "book",
+         "milk", "report", "mom", "bug", "email", "review", "doctor", "tickets",
+         "invoice", "meeting", "notes", "garden", "car", "bank", "draft", "slides")
+SEARCH_QUERIES = ("re", "rep", "repo", "report", "bug f", "bug fix", "in", "inv")   # Ввод по буквам
+
+
+# --- Генераторы ---
+
+def random_text(rng):
+    """Текст таска: чаще 2-6 слов, изредка длинная заметка"""
+    count = max(1, int(rng.lognormvariate(1.3, 0.6)))
+    return " ".join(rng.choice(WORDS) for _ in range(count)).capitalize()
+
+
+def generate_tasks(count, seed=0, archive_ratio=ARCHIVE_RATIO, today=None):
+    """Список тасков в формате tasks_small.json (как у старой версии - все в одном файле)"""
+    rng = random.Random(seed)
+    today = today or date.today()
+    active_count = max(1, min(count, int(round(count * (1 - archive_ratio)))))
+    tasks = []
+    for i in range(count):
+        archived = i >= active_count
+        if archived:
+            day = today - timedelta(days=rng.randrange(1, DATE_SPAN_DAYS))
+        else:
+            day = today - timedelta(days=rng.randrange(0, 14))
+        tasks.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "text": random_text(rng),
+            "date": day.isoformat(),
+            "checked": archived or rng.random() < ACTIVE_CHECKED_RATIO,
+            "archive": archived,
+            "important": rng.random() < IMPORTANT_RATIO,
+        })
+    return tasks
+
+
+def write_task_file(path, tasks):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tasks, f, indent=2, ensure_ascii=False)
+
+
+# --- Замеры ---
+
+def peak_rss_kb():
+    """Пиковый RSS процесса в КБ (None, если платформа не дает)"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset // 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+def bytes_written():
+    """Сколько байт процесс записал через write() (включая поток записи TaskStore)"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().io_counters().write_bytes
+    except (ImportError, AttributeError):
+        return None
+
+
+def measure(fn, repeat=1, after=None):
+    """Гоняет fn() repeat раз. after() (сброс очереди на диск) входит в байты, но не во время"""
+    timings = []
+    start_bytes = bytes_written()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+        if after:
+            after()
+    end_bytes = bytes_written()
+    return {
+        "wall_s": min(timings),
+        "median_s": statistics.median(timings),
+        "runs": repeat,
+        "peak_rss_kb": peak_rss_kb(),
+        "bytes_written": None if start_bytes is None else (end_bytes - start_bytes) // repeat,
+    }
+
+
+def record_memory(tasks):
+    """Память под таски: словари из json.loads против записей Task (tracemalloc)"""
+    from taskrecord import tasks_from_dicts
+
+    raw = json.dumps(tasks)
+    del tasks
+    tracemalloc.start()
+    dicts = json.loads(raw)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    records = tasks_from_dicts(dicts)
+    del dicts
+    record_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return {"dict_bytes": dict_bytes, "task_bytes": record_bytes,
+            "ratio": round(dict_bytes / max(record_bytes, 1), 2)}
+
+
+def run_worker(size, engine, repeat, seed):
+    """Все замеры для одного размера файла. Возвращает {имя: метрики}"""
+    from taskstore import read_tasks, write_tasks
+    import traytodo
+    from PySide6 import QtWidgets, QtCore
+
+    work_dir = tempfile.mkdtemp(prefix="traytodo-bench-")
+    results = {}
+    try:
+        tasks_file = os.path.join(work_dir, "tasks_small.json")
+        tasks = generate_tasks(size, seed=seed)
+        write_task_file(tasks_file, tasks)
+        results["file_size_bytes"] = os.path.getsize(tasks_file)
+
+        scratch_file = os.path.join(work_dir, "scratch.json")
+        results["read_tasks"] = measure(lambda: read_tasks(tasks_file), repeat)
+        # tasks - через аргумент: ниже список удаляется, чтобы не занимать память в замерах окна
+        results["write_tasks"] = measure(lambda tasks=tasks: write_tasks(scratch_file, tasks), repeat)
+        results["memory"] = record_memory(tasks)
+        del tasks
+
+        app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        app.setQuitOnLastWindowClosed(False)
+
+        def settle():
+            app.processEvents()
+            app.processEvents()
+
+        traytodo.TASKS_FILE = tasks_file
+        traytodo.STORAGE_ENGINE = engine
+        windows = []
+
+        def start_app():
+            traytodo.STARTUP_T0 = time.perf_counter()
+            windows.append(traytodo.SimpleTodo())
+            settle()
+
+        def startup_marks(prefix):
+            # Этапы запуска из отчета SimpleTodo: до иконки, до тасков, до окна
+            window = windows[-1]
+            for stage, elapsed_ms in window.startup_marks.items():
+                results[f"{prefix}_{stage}"] = {"wall_s": elapsed_ms / 1000, "median_s": elapsed_ms / 1000,
+                                                "runs": 1, "peak_rss_kb": None, "bytes_written": None}
+
+        # Первый запуск - со старым однофайловым форматом (миграция архива)
+        results["startup_first"] = measure(start_app, after=lambda: windows[-1].store.flush())
+        window = windows[0]
+        store = window.store
+        store.flush()
+        results["build_ui"] = measure(window.ensure_ui)
+        window.show_and_position()
+        settle()
+        startup_marks("startup_first")
+
+        # Полное обновление списка (store рассылает None): модель перечитывается, окно - по высоте
+        results["reload_model"] = measure(
+            lambda: (window.model.reload(), window.on_store_changed(None), settle()), repeat)
+        results["resize_window_to_content"] = measure(window.resize_window_to_content, repeat)
+
+        results["show_archive_first"] = measure(lambda: (window.show_archive_window(), settle()))
+        archive_window = window.archive_window
+        results["load_archive"] = measure(lambda: (archive_window.load_archive(), settle()), repeat)
+
+        # Поиск: первый запрос строит индекс, дальше - запросы по мере ввода
+        results["search_index_build"] = measure(lambda: store.search("report"), after=store.flush)
+        results["search_archive"] = measure(
+            lambda: [store.search(query, traytodo.ARCHIVE_FETCH_CHUNK) for query in SEARCH_QUERIES], repeat)
+
+        # Действия по клику: медиана по CLICK_SAMPLES строкам
+        model = window.model
+        rows = min(CLICK_SAMPLES, model.rowCount())
+
+        def click_check():
+            index = model.index(rng.randrange(model.rowCount()))
+            state = index.data(QtCore.Qt.CheckStateRole)
+            new_state = QtCore.Qt.Unchecked if QtCore.Qt.CheckState(state) == QtCore.Qt.Checked else QtCore.Qt.Checked
+            model.setData(index, new_state, QtCore.Qt.CheckStateRole)
+            settle()
+
+        # Пункты контекстного меню - те же обработчики, что вызывает show_main_list_menu
+        def click_important():
+            index = model.index(rng.randrange(model.rowCount()))
+            window.set_important([index.data(traytodo.TASK_ID_ROLE)], not index.data(traytodo.IMPORTANT_ROLE))
+            settle()
+
+        def click_delete():
+            index = model.index(model.rowCount() - 1)
+            window.delete_tasks([index.data(traytodo.TASK_ID_ROLE)])
+            settle()
+
+        rng = random.Random(seed)
+        if rows:
+            results["on_item_changed"] = measure(click_check, rows, after=store.flush)
+            results["set_important"] = measure(click_important, rows, after=store.flush)
+            results["delete_tasks"] = measure(click_delete, min(rows, model.rowCount() - 1), after=store.flush)
+
+        # Кадр в каждом режиме тени: всё окно (и архив) и одна строка списка, как при
+        # клике по галочке. offscreen рисует программно - как удаленный рабочий стол
+        for mode in traytodo.WINDOW_SHADOWS:
+            for w in (window, archive_window):
+                traytodo.set_window_shadow(w, mode)
+            settle()
+            results[f"paint_window_{mode}"] = measure(
+                lambda: (window.repaint(), archive_window.repaint()), PAINT_SAMPLES)
+            if model.rowCount():
+                row_rect = window.list_widget.visualRect(model.index(0))
+                results[f"paint_row_{mode}"] = measure(
+                    lambda: window.list_widget.viewport().repaint(row_rect), PAINT_SAMPLES)
+        for w in (window, archive_window):
+            traytodo.set_window_shadow(w, traytodo.WINDOW_SHADOW)
+
+        # Полночь: отмечаем все и архивируем разом
+        store.update_many([t.id for t in store.active_tasks()], checked=True)
+        store.flush()
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        results["run_midnight_archive"] = measure(
+            lambda: (window.run_midnight_archive(yesterday), settle()), after=store.flush)
+
+        # Повторный запуск - уже мигрированные файлы
+        store.close()
+        results["startup_warm"] = measure(start_app, after=lambda: windows[-1].store.flush())
+        windows[-1].show_and_position()
+        settle()
+        startup_marks("startup_warm")
+        results["search_index_load"] = measure(lambda: windows[-1].store.search("report"))
+        windows[-1].store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+# --- Отчет и сравнение ---
+
+def run_size(size, engine, repeat, seed, json_backend=None):
+    """Запускает замеры одного размера в дочернем процессе"""
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+           "--engine", engine, "--repeat", str(repeat), "--seed", str(seed)]
+    if json_backend:
+        cmd += ["--json-backend", json_backend]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        raise RuntimeError(f"Benchmark worker for {size} tasks failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def environment_info():
+    try:
+        import PySide6
+        qt_version = PySide6.__version__
+    except ImportError:
+        qt_version = None
+    return {
+        "python": platform.python_version(),
+        "pyside6": qt_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    """Список регрессий по времени: (размер, замер, было, стало)"""
+    regressions = []
+    for size, cases in report["results"].items():
+        base_cases = baseline.get("results", {}).get(size, {})
+        for name, metrics in cases.items():
+            base = base_cases.get(name)
+            if not isinstance(metrics, dict) or not isinstance(base, dict) or "wall_s" not in base:
+                continue
+            old, new = base["wall_s"], metrics["wall_s"]
+            if new > old * (1 + threshold) and new - old > REGRESSION_MIN_SECONDS:
+                regressions.append((size, name, old, new))
+    return regressions
+
+
+def print_table(report):
+    for size, cases in report["results"].items():
+        print(f"\n=== {int(size):,} tasks ({report['engine']}) ===")
+        for name, m in cases.items():
+            if not isinstance(m, dict):
+                continue
+            if "task_bytes" in m:
+                print(f"  {'memory (dict -> Task)':<26} {m['dict_bytes'] / 2**20:7.1f} MB -> "
+                      f"{m['task_bytes'] / 2**20:.1f} MB  (x{m['ratio']})")
+                continue
+            written = "-" if m["bytes_written"] is None else f"{m['bytes_written']:,} B"
+            rss = "-" if m["peak_rss_kb"] is None else f"{m['peak_rss_kb'] // 1024} MB"
+            print(f"  {name:<26} {m['wall_s'] * 1000:10.2f} ms   rss {rss:>8}   written {written}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless traytodo benchmark")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated task counts")
+    parser.add_argument("--engine", default="json", choices=("json", "sqlite"))
+    parser.add_argument("--json-backend", help="orjson, msgspec or stdlib (default: fastest installed)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--baseline", help="report to compare against; exit code 1 on regression")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        if args.json_backend:
+            import serializer
+            serializer.set_backend(args.json_backend)
+        # Вывод приложения (print) не должен попасть в результат и в счетчик записи
+        with redirect_stdout(io.StringIO()):
+            results = run_worker(args.worker, args.engine, args.repeat, args.seed)
+        sys.__stdout__.write(json.dumps(results) + "\n")
+        return 0
+
+    report = {"engine": args.engine, "json_backend": args.json_backend or "auto",
+              "environment": environment_info(), "results": {}}
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Running {size:,} tasks...", flush=True)
+        report["results"][str(size)] = run_size(size, args.engine, args.repeat, args.seed, args.json_backend)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_table(report)
+    print(f"\nReport: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for size, name, old, new in regressions:
+            print(f"REGRESSION {size} {name}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
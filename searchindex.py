@@ -0,0 +1,285 @@
+"""Полнотекстовый поиск по архиву: инвертированный индекс слово -> таски.
+
+Слова - последовательности букв и цифр (кириллица, латиница), без учета
+регистра, "ё" = "е". Запрос "отч янв" находит таски, в которых есть слово,
+начинающееся на "отч", и слово, начинающееся на "янв" (однобуквенные слова
+запроса ищутся только целиком). Префиксы - bisect по отсортированному
+словарю, так что поиск не перебирает таски.
+
+Индекс лежит рядом с файлом тасков:
+    tasks_small.search.json   - снимок: {"version": 1,
+                                         "ids": [id, ...], "days": [день, ...],
+                                         "words": {слово: [номер в ids, ...]}}
+    tasks_small.search.jsonl  - изменения после снимка, по строке на таск
+Изменения архива только дописываются в журнал (через DiskWriter хранилища),
+даже если индекс еще не читался; в память он читается при первом поиске
+(или при поиске архивного таска по id) и тогда же проигрывает журнал. Если
+число документов не сходится с размером архива (индекса еще не было, архив
+переносили), поиск строит индекс заново; поиск по id - никогда.
+"""
+import os
+import re
+import heapq
+from bisect import bisect_left, insort
+
+import serializer
+from tracing import log, span
+
+SEARCH_FORMAT_VERSION = 1
+SEARCH_JOURNAL_MAX_OPS = 2000   # После стольких изменений журнал сворачивается в снимок
+SEARCH_MIN_PREFIX = 2           # Более короткие слова запроса - только точное совпадение
+
+_WORD = re.compile(r"\w+")
+
+
+def search_index_path(path):
+    """tasks_small.json -> tasks_small.search.json"""
+    base, _ = os.path.splitext(path)
+    return base + ".search.json"
+
+
+def words_of(text):
+    """Слова текста для индекса (и для запроса)"""
+    return set(_WORD.findall(text.casefold().replace("ё", "е")))
+
+
+class SearchIndex:
+    def __init__(self, path, writer):
+        self.path = search_index_path(path)
+        self.journal_path = self.path + "l"
+        self.writer = writer
+        self.loaded = False
+        self._docs = []       # номер документа -> id таска (None - удален)
+        self._days = []       # номер документа -> день архивации (Task.day)
+        self._docno = {}      # id таска -> номер документа
+        self._postings = {}   # слово -> set(номеров документов)
+        self._vocab = None    # Отсортированные слова (для префиксов); None - собрать заново
+        self._newest = None   # Номера документов от новых к старым; None - собрать заново
+        self._dead = set()    # Номера удаленных документов (до следующего снимка)
+        self._journal_ops = 0
+
+    def __len__(self):
+        return len(self._docno)
+
+    # --- Изменения ---
+
+    def add_tasks(self, tasks):
+        """(Пере)индексирует архивные таски"""
+        if not tasks:
+            return
+        lines = []
+        for task in tasks:
+            lines.append(serializer.dumps({"id": task.id, "day": task.day, "text": task.text}))
+            if self.loaded:
+                self._add(task.id, task.day, task.text)
+        self._journal(lines)
+
+    def remove(self, task_ids):
+        """Убирает таски из индекса (удалены или вернулись из архива)"""
+        if not task_ids:
+            return
+        lines = []
+        for task_id in task_ids:
+            lines.append(serializer.dumps({"del": task_id}))
+            if self.loaded:
+                self._remove(task_id)
+        self._journal(lines)
+
+    def day_of(self, task_id):
+        """День архивации таска по индексу (None - таска в индексе нет)"""
+        docno = self._docno.get(task_id)
+        return None if docno is None else self._days[docno]
+
+    def unload(self):
+        """Забывает прочитанное: при следующем поиске индекс читается с диска заново"""
+        self._reset()
+        self._journal_ops = 0
+        self.loaded = False
+
+    def _add(self, task_id, day, text):
+        self._remove(task_id)
+        docno = len(self._docs)
+        self._docs.append(task_id)
+        self._days.append(day)
+        self._docno[task_id] = docno
+        self._newest = None
+        postings = self._postings
+        for word in words_of(text):
+            docs = postings.get(word)
+            if docs is None:
+                docs = postings[word] = set()
+                if self._vocab is not None:
+                    insort(self._vocab, word)
+            docs.add(docno)
+
+    def _remove(self, task_id):
+        # Номер остается в списках слов до следующего снимка, поиск его пропускает
+        docno = self._docno.pop(task_id, None)
+        if docno is not None:
+            self._docs[docno] = None
+            self._dead.add(docno)
+
+    def _apply(self, op):
+        if "del" in op:
+            self._remove(op["del"])
+        else:
+            self._add(op["id"], op.get("day") or 0, op.get("text") or "")
+
+    def _journal(self, lines):
+        self.writer.append(self.journal_path, b"\n".join(lines) + b"\n")
+        self._journal_ops += len(lines)
+        if self.loaded and self._journal_ops >= SEARCH_JOURNAL_MAX_OPS:
+            self.save()
+
+    # --- Поиск ---
+
+    def _sorted_vocab(self):
+        if self._vocab is None:
+            self._vocab = sorted(self._postings)
+        return self._vocab
+
+    def _match(self, word):
+        """Номера документов со словом, начинающимся на word"""
+        if len(word) < SEARCH_MIN_PREFIX:
+            return self._postings.get(word, set())
+        vocab = self._sorted_vocab()
+        lo = bisect_left(vocab, word)
+        hi = bisect_left(vocab, word + "\U0010ffff", lo)
+        if hi - lo == 1:
+            return self._postings[vocab[lo]]
+        found = set()
+        for i in range(lo, hi):
+            found |= self._postings[vocab[i]]
+        return found
+
+    def search(self, query, limit=None):
+        """-> (сколько найдено, id первых limit тасков от новых к старым)"""
+        # Длинные слова обычно реже - с них пересечение быстрее сужается
+        words = sorted(words_of(query), key=len, reverse=True)
+        if not words:
+            return 0, []
+        hits = None
+        for word in words:
+            found = self._match(word)
+            hits = found if hits is None else hits & found
+            if not hits:
+                return 0, []
+        docs = self._docs
+        total = len(hits) - len(self._dead & hits) if self._dead else len(hits)
+        if limit is not None and len(hits) ** 2 > limit * len(docs):
+            # Находок много: дешевле идти по всем таскам от новых к старым до limit находок
+            top = []
+            for docno in self._newest_first():
+                if docno in hits and docs[docno] is not None:
+                    top.append(docno)
+                    if len(top) >= limit:
+                        break
+        else:
+            top = heapq.nlargest(limit or total, (docno for docno in hits if docs[docno] is not None),
+                                 key=self._days.__getitem__)
+        return total, [docs[docno] for docno in top]
+
+    def _newest_first(self):
+        if self._newest is None:
+            self._newest = sorted(range(len(self._docs)), key=self._days.__getitem__, reverse=True)
+        return self._newest
+
+    # --- Файлы ---
+
+    def load(self, archive_size, all_archived=None):
+        """Читает снимок и журнал. archive_size - число тасков в архиве;
+        all_archived() - весь архив, если индекс придется строить заново.
+        Без all_archived отставший индекс не перестраивается: прочитанное
+        годится только как подсказка day_of, loaded остается False"""
+        with span("search.load") as sp:
+            self.writer.flush()   # Журнал мог еще стоять в очереди записи
+            self._read_snapshot()
+            replayed = self._replay()
+            if len(self) != archive_size:
+                if all_archived is None:
+                    sp.set(stale=True)
+                    return
+                log.info(f"Search index out of date ({len(self)} of {archive_size} tasks), rebuilding.")
+                self.rebuild(all_archived())
+            elif replayed:
+                self.save()
+            self.loaded = True
+            self._newest_first()   # Порядок для первого запроса - заранее, а не на первой букве
+            sp.set(docs=len(self), words=len(self._postings))
+
+    def _reset(self):
+        self._docs, self._days, self._docno, self._postings = [], [], {}, {}
+        self._vocab = self._newest = None
+        self._dead = set()
+
+    def _read_snapshot(self):
+        self._reset()
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                data = serializer.loads(f.read())
+            if data.get("version") != SEARCH_FORMAT_VERSION:
+                return   # Чужая версия - индекс будет построен заново
+            docs, days = data["ids"], data["days"]
+            postings = {word: set(docnos) for word, docnos in data["words"].items()}
+        except (OSError, KeyError, AttributeError, *serializer.DECODE_ERRORS) as e:
+            log.warning(f"Search index {self.path} is unreadable ({e}), rebuilding.")
+            return
+        self._docs, self._days, self._postings = docs, days, postings
+        self._docno = {task_id: docno for docno, task_id in enumerate(docs)}
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        replayed = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    op = serializer.loads(line)
+                except serializer.DECODE_ERRORS:
+                    continue   # Оборванная последняя строка
+                self._apply(op)
+                replayed += 1
+        return replayed
+
+    def rebuild(self, tasks_list):
+        with span("search.rebuild", tasks=len(tasks_list)):
+            self._reset()
+            for task in tasks_list:
+                self._add(task.id, task.day, task.text)
+            self.save()
+
+    def save(self):
+        """Снимок без удаленных документов (номера уплотняются), журнал - очищается"""
+        renumber = {}
+        docs, days = [], []
+        for docno, task_id in enumerate(self._docs):
+            if task_id is not None:
+                renumber[docno] = len(docs)
+                docs.append(task_id)
+                days.append(self._days[docno])
+        postings = {}
+        for word, docnos in self._postings.items():
+            kept = {renumber[docno] for docno in docnos if docno in renumber}
+            if kept:
+                postings[word] = kept
+        self._docs, self._days, self._postings = docs, days, postings
+        self._docno = {task_id: docno for docno, task_id in enumerate(docs)}
+        self._vocab = self._newest = None
+        self._dead = set()
+
+        # Списки копируются: запись идет в другом потоке, а GUI продолжает менять индекс
+        snapshot = {
+            "version": SEARCH_FORMAT_VERSION,
+            "ids": list(docs),
+            "days": list(days),
+            "words": {word: sorted(docnos) for word, docnos in postings.items()},
+        }
+        self.writer.replace(self.path, snapshot)
+        self.writer.call(self._drop_journal)
+        self._journal_ops = 0
+
+    def _drop_journal(self):
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
@@ -0,0 +1,177 @@
+"""Чтение/запись JSON для файлов тасков.
+
+Формат файла (версия 2):
+    {"version": 2, "tasks": [{...}, {...}]}
+Компактный (без отступов); с отступами - только явный экспорт (pretty=True).
+Файлы старых версий - просто список [{...}, ...] - читаются как раньше.
+
+Бэкенд выбирается сам: orjson, если установлен, потом msgspec, иначе
+stdlib json. Большие файлы (от STREAM_READ_BYTES) читаются потоково:
+таски отдаются по одному, и в памяти нет одновременно всего текста файла
+и всех разобранных словарей.
+"""
+import os
+import json
+
+from tracing import log
+
+FORMAT_VERSION = 2
+STREAM_READ_BYTES = 32 * 1024 * 1024   # Файлы больше этого читаются потоково
+STREAM_CHUNK = 1024 * 1024
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+BACKENDS = tuple(name for name, module in (("orjson", orjson), ("msgspec", msgspec)) if module) + ("stdlib",)
+DECODE_ERRORS = (ValueError, UnicodeDecodeError, TypeError) + ((msgspec.DecodeError,) if msgspec else ())
+
+backend = BACKENDS[0]
+
+
+def set_backend(name):
+    """Переключает бэкенд ("orjson", "msgspec", "stdlib"), если он установлен"""
+    global backend
+    if name not in BACKENDS:
+        raise ValueError(f"JSON backend {name!r} is not available (have {BACKENDS})")
+    backend = name
+
+
+def dumps(data, pretty=False):
+    """Объект -> bytes (UTF-8, без экранирования не-ASCII)"""
+    if backend == "orjson":
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if backend == "msgspec":
+        encoded = msgspec.json.encode(data)
+        return msgspec.json.format(encoded, indent=2) if pretty else encoded
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """bytes/str -> объект"""
+    if backend == "orjson":
+        return orjson.loads(data)
+    if backend == "msgspec":
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def task_file(tasks_list):
+    """Список тасков -> содержимое файла текущей версии"""
+    return {"version": FORMAT_VERSION, "tasks": tasks_list}
+
+
+def tasks_of(data):
+    """Содержимое файла (любой версии) -> список тасков ([] если не похоже на файл тасков)"""
+    if isinstance(data, list):
+        return data   # Версия 1: просто список
+    if isinstance(data, dict) and isinstance(data.get("tasks"), list):
+        check_version(data.get("version"))
+        return data["tasks"]
+    return []
+
+
+def check_version(version):
+    if isinstance(version, int) and version > FORMAT_VERSION:
+        # Файл от более новой версии: читаем то, что понимаем
+        log.warning(f"Task file format {version} is newer than supported {FORMAT_VERSION}.")
+
+
+def iter_tasks(path):
+    """Таски файла по одному. Маленький файл читается целиком быстрым бэкендом,
+    большой - потоково. Ошибки разбора - DECODE_ERRORS"""
+    if os.path.getsize(path) < STREAM_READ_BYTES:
+        with open(path, "rb") as f:
+            yield from tasks_of(loads(f.read()))
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _StreamReader(f).tasks()
+
+
+class _StreamReader:
+    """Потоковый разбор файла тасков: json.JSONDecoder.raw_decode по кускам текста"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(STREAM_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Следующий непробельный символ (не сдвигая позицию)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of task file")
+
+    def _expect(self, chars):
+        ch = self._peek()
+        if ch not in chars:
+            raise ValueError(f"Expected one of {chars!r} in task file, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Значение не поместилось в буфер - дочитываем
+                if self._fill():
+                    continue
+                raise
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue   # Число на границе куска могло оборваться
+            self.pos = end
+            return value
+
+    def _array(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def tasks(self):
+        if self._peek() == "[":
+            yield from self._array()   # Версия 1
+            return
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "tasks":
+                yield from self._array()
+            elif key == "version":
+                check_version(self._value())
+            else:
+                self._value()
+            if self._expect(",}") == "}":
+                return
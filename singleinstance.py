@@ -0,0 +1,106 @@
+"""Канал к уже запущенному traytodo: один экземпляр на пользователя и файл данных.
+
+Первый запуск слушает локальный сокет (QLocalServer в traytodo.py: на
+Windows - именованный канал, иначе - Unix-сокет в XDG_RUNTIME_DIR или во
+временной папке). Следующие запуски и команды taskcli отправляют туда
+запрос и сразу выходят, так что файлы данных пишет только один процесс.
+
+Протокол: одна строка JSON запроса -> одна строка JSON ответа, соединение
+закрывается. Запрос - {"cmd": "show" | "open-archive" | команда taskcli, ...};
+ответ - словарь, при ошибке с ключом "error". Клиент здесь - без Qt.
+"""
+import os
+import sys
+import socket
+import getpass
+import hashlib
+import tempfile
+
+import serializer
+
+CONNECT_TIMEOUT = 0.5   # Сек.: столько ждем подключения (живой сервер отвечает сразу)
+REPLY_TIMEOUT = 60.0    # Сек.: ответ на import/export большого файла может идти долго
+PIPE_PREFIX = "\\\\.\\pipe\\"   # Windows: имя канала QLocalServer -> путь для open()
+
+
+def server_name(path):
+    """Имя канала для файла данных path (то же, что слушает QLocalServer)"""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "user"
+    key = hashlib.blake2b(os.path.normcase(os.path.abspath(path)).encode("utf-8"), digest_size=6).hexdigest()
+    name = f"traytodo-{user}-{key}"
+    if sys.platform == "win32":
+        return name
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, name + ".sock")
+
+
+def lock_path(path):
+    """Файл блокировки запуска: проверка "уже запущен?" и listen идут под ней"""
+    name = server_name(path)
+    if sys.platform == "win32":
+        return os.path.join(tempfile.gettempdir(), name + ".lock")
+    return name + ".lock"
+
+
+def connect(path):
+    """Канал к экземпляру, открывшему path, или None, если никто не слушает"""
+    if sys.platform == "win32":
+        try:
+            pipe = open(PIPE_PREFIX + server_name(path), "r+b", buffering=0)
+        except OSError:
+            return None
+        return Channel(pipe.write, pipe.read, pipe.close)
+    address = server_name(path)
+    if not os.path.exists(address):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(CONNECT_TIMEOUT)
+    try:
+        conn.connect(address)
+    except OSError:
+        conn.close()
+        return None   # Сокет остался от упавшего процесса
+    conn.settimeout(REPLY_TIMEOUT)
+    return Channel(conn.send, conn.recv, conn.close)
+
+
+def send(path, request):
+    """Отправляет запрос экземпляру, открывшему path. -> ответ или None, если никто не слушает"""
+    channel = connect(path)
+    return None if channel is None else channel.call(request)
+
+
+class Channel:
+    """Одно соединение - один запрос. write/read/close - сокета или файла канала Windows"""
+
+    def __init__(self, write, read, close):
+        self._write = write
+        self._read = read
+        self._close = close
+
+    def call(self, request):
+        """Запрос -> ответ; соединение после этого закрыто"""
+        try:
+            data = memoryview(serializer.dumps(request) + b"\n")
+            while data:
+                data = data[self._write(data):]   # Большой bulk-add уходит не за один раз
+            reply = bytearray()
+            while not reply.endswith(b"\n"):
+                chunk = self._read(65536)
+                if not chunk:
+                    break
+                reply += chunk
+        except OSError as e:
+            return {"error": f"No reply from the running traytodo ({e})"}
+        finally:
+            self._close()
+        try:
+            response = serializer.loads(bytes(reply))
+        except serializer.DECODE_ERRORS:
+            return {"error": "Broken reply from the running traytodo"}
+        if not isinstance(response, dict):
+            return {"error": "Unexpected reply from the running traytodo"}
+        return response
@@ -0,0 +1,191 @@
+"""Команды для скриптов: таски без окна и без Qt.
+
+    traytodo.py add "текст" ["текст" ...]     - по таску на аргумент, печатает их id
+    traytodo.py bulk-add < tasks.txt          - по таску на строку stdin
+    traytodo.py list [--archived] [--limit N] [--json]
+    traytodo.py archive [--date YYYY-MM-DD]   - унести отмеченные в архив
+    traytodo.py export FILE [--pretty]
+    traytodo.py import FILE
+    traytodo.py show | open-archive | flush   - окну уже запущенного traytodo
+
+Если traytodo уже запущен, команда уходит ему (singleinstance.send) и
+выполняется там - файлы данных пишет один процесс, а клиенту не нужно
+читать таски. Иначе она выполняется здесь же, над файлами напрямую.
+Все изменения одной команды - одна транзакция TaskStore.batch(): одна
+строка журнала (или одна перезапись файла), сколько бы тасков ни пришло.
+"""
+import io
+import os
+import sys
+import argparse
+from datetime import date
+
+import serializer
+import singleinstance
+import tracing
+from tracing import span
+from taskrecord import Task, tasks_to_dicts
+
+COMMANDS = ("add", "bulk-add", "list", "archive", "export", "import", "show", "open-archive", "flush")
+WINDOW_COMMANDS = ("show", "open-archive")   # Только для запущенного экземпляра
+
+
+def is_cli(argv):
+    """argv (без имени программы) - команда, а не запуск окна?"""
+    args = list(argv)
+    tracing.pop_trace_arg(args)
+    return bool(args) and args[0] in COMMANDS
+
+
+def iso_date(value):
+    """Аргумент --date: "2025-03-14" как есть, иначе ошибка argparse"""
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {value!r}")
+
+
+def stdin_lines():
+    """Непустые строки stdin по одной (UTF-8, BOM в начале пропускается)"""
+    for line in io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", errors="replace"):
+        line = line.strip()
+        if line:
+            yield line
+
+
+def format_task(task):
+    mark = "[x]" if task.checked else "[ ]"
+    important = "!" if task.important else " "
+    return f"{mark} {important} {task.date or '':10}  {task.text}"
+
+
+# --- Запросы: argparse -> словарь (его же выполняет запущенный экземпляр) ---
+
+def request_of(args, local):
+    """local=True - выполняем сами: строки stdin можно не собирать в список"""
+    cmd = args.command
+    if cmd == "add":
+        return {"cmd": "add", "texts": [text.strip() for text in args.text if text.strip()], "date": args.date}
+    if cmd == "bulk-add":
+        texts = stdin_lines()
+        return {"cmd": "add", "texts": texts if local else list(texts), "date": args.date}
+    if cmd == "list":
+        return {"cmd": "list", "archived": args.archived, "limit": args.limit}
+    if cmd == "archive":
+        return {"cmd": "archive", "date": args.date or date.today().isoformat()}
+    if cmd == "export":
+        return {"cmd": "export", "file": os.path.abspath(args.file), "pretty": args.pretty}
+    if cmd == "import":
+        return {"cmd": "import", "file": os.path.abspath(args.file)}
+    return {"cmd": cmd}
+
+
+def execute(store, request):
+    """Выполняет запрос над TaskStore. -> ответ (словарь; при ошибке - с "error")"""
+    cmd = request.get("cmd")
+    with span("cli." + str(cmd)):
+        if cmd == "add":
+            return {"ids": store.add_many(request["texts"], request.get("date"))}
+        if cmd == "list":
+            if request.get("archived"):
+                tasks_list = store.archived_range(limit=request.get("limit"))
+            else:
+                tasks_list = store.active_tasks()[:request.get("limit")]
+            return {"tasks": tasks_to_dicts(tasks_list)}
+        if cmd == "archive":
+            return {"archived": len(store.archive_done(request["date"]))}
+        if cmd == "export":
+            return {"exported": store.export_json(request["file"], pretty=request.get("pretty", False))}
+        if cmd == "import":
+            if not os.path.isfile(request["file"]):
+                return {"error": f"No such file: {request['file']}"}
+            return {"imported": store.import_json(request["file"])}
+        if cmd == "flush":
+            store.flush()
+            return {}
+    return {"error": f"Unknown command: {cmd}"}
+
+
+def report(args, response):
+    """Печатает ответ. -> код выхода"""
+    if "error" in response:
+        print(response["error"], file=sys.stderr)
+        return 1
+    cmd = args.command
+    if cmd == "add":
+        for task_id in response["ids"]:
+            print(task_id)
+    elif cmd == "bulk-add":
+        print(f"Added {len(response['ids'])} task(s).")
+    elif cmd == "list" and args.json:
+        sys.stdout.buffer.write(serializer.dumps(response["tasks"], pretty=True) + b"\n")
+    elif cmd == "list":
+        for data in response["tasks"]:
+            print(format_task(Task.from_dict(data)))
+    elif cmd == "archive":
+        print(f"Archived {response['archived']} task(s).")
+    elif cmd == "export":
+        print(f"Exported {response['exported']} task(s) to {args.file}.")
+    elif cmd == "import":
+        print(f"Imported {response['imported']} task(s) from {args.file}.")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="traytodo", description="traytodo tasks from the command line")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add tasks, one per argument; prints their ids")
+    add.add_argument("text", nargs="+")
+    add.add_argument("--date", type=iso_date, help="task date (default: today)")
+
+    bulk_add = commands.add_parser("bulk-add", help="add a task per non-empty line of stdin")
+    bulk_add.add_argument("--date", type=iso_date, help="task date (default: today)")
+
+    list_ = commands.add_parser("list", help="print active (or archived) tasks")
+    list_.add_argument("--archived", action="store_true", help="archive instead, newest first")
+    list_.add_argument("--limit", type=int)
+    list_.add_argument("--json", action="store_true", help="task file format instead of text")
+
+    archive = commands.add_parser("archive", help="move checked tasks to the archive")
+    archive.add_argument("--date", type=iso_date, help="archive date (default: today)")
+
+    export = commands.add_parser("export", help="write all tasks, archive included, to FILE")
+    export.add_argument("file")
+    export.add_argument("--pretty", action="store_true")
+
+    import_ = commands.add_parser("import", help="add tasks from FILE (same ids are replaced)")
+    import_.add_argument("file")
+
+    commands.add_parser("show", help="show the window of the running traytodo")
+    commands.add_parser("open-archive", help="open the archive in the running traytodo")
+    commands.add_parser("flush", help="make the running traytodo write everything to disk")
+    return parser
+
+
+def main(argv, path, engine="json", journal=False):
+    """Выполняет команду из argv (без имени программы) над файлом path. -> код выхода"""
+    argv = list(argv)
+    trace_arg = tracing.pop_trace_arg(argv)
+    args = build_parser().parse_args(argv)
+    # Лог - в stderr: stdout остается под вывод команды (list --json и т.п.)
+    tracing.setup(os.path.dirname(path), trace_arg, stream=sys.stderr)
+
+    channel = singleinstance.connect(path)
+    if channel is not None:
+        return report(args, channel.call(request_of(args, local=False)))
+    if args.command in WINDOW_COMMANDS:
+        print("traytodo is not running.", file=sys.stderr)
+        return 1
+    if args.command == "flush":
+        return 0   # Без запущенного экземпляра писать нечего
+
+    from taskstore import TaskStore   # Только здесь: клиенту запущенного экземпляра она не нужна
+    store = TaskStore(path, journal=journal, engine=engine)
+    try:
+        store.load()
+        return report(args, execute(store, request_of(args, local=True)))
+    finally:
+        store.close()
+        if tracing.enabled():
+            tracing.export()
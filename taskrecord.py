@@ -0,0 +1,260 @@
+"""Компактная запись таска в памяти.
+
+В файле таск - словарь из шести ключей:
+    {"id": "...", "text": "...", "date": "2025-03-14",
+     "checked": false, "archive": false, "important": false}
+
+В памяти - Task со __slots__: id хранится как 16 байт UUID, дата - как
+номер дня (date.toordinal()), три флага упакованы в одно число. На 100k+
+тасков архива это в несколько раз меньше памяти, чем словари, и даты
+сравниваются как числа, без разбора строк.
+
+"rev" - номер правки таска (растет при каждом изменении), "src" -
+instance_id экземпляра, который сделал эту правку. Версия таска -
+(rev, src): по ней экземпляры, открывшие один файл, решают, чья версия
+новее, и при равном rev все выбирают одну и ту же. В файле оба ключа
+пишутся, только если таск хоть раз меняли.
+
+Преобразование без потерь: всё, что не укладывается в компактную форму
+(id не в каноническом виде UUID, дата не "YYYY-MM-DD", лишние ключи,
+отсутствующие ключи), сохраняется в extra и возвращается в to_dict().
+"""
+from datetime import date
+
+CHECKED = 1
+ARCHIVE = 2
+IMPORTANT = 4
+FLAG_KEYS = (("checked", CHECKED), ("archive", ARCHIVE), ("important", IMPORTANT))
+FIELDS = ("id", "text", "date", "checked", "archive", "important")
+
+_MISSING = object()      # В extra: ключа в исходном словаре не было
+_days = {}               # Общие объекты int для одинаковых дат (их немного)
+_iso_days = {}           # Номер дня -> "YYYY-MM-DD" (тот же кеш, в обратную сторону)
+
+
+def uid_from_id(task_id):
+    """"2f1c...-..." -> 16 байт. Нестандартные id остаются строкой как есть"""
+    if (isinstance(task_id, str) and len(task_id) == 36 and task_id[8] == "-"
+            and task_id[13] == "-" and task_id[18] == "-" and task_id[23] == "-"
+            and task_id == task_id.lower()):
+        try:
+            uid = bytes.fromhex(task_id.replace("-", ""))
+        except ValueError:
+            return task_id
+        if len(uid) == 16:   # fromhex пропускает пробелы
+            return uid
+    return task_id
+
+
+def id_from_uid(uid):
+    if not isinstance(uid, bytes):
+        return uid
+    h = uid.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def day_from_iso(date_str):
+    """"2025-03-14" -> номер дня; 0 - нет даты или она не в этом формате"""
+    if (not isinstance(date_str, str) or len(date_str) != 10
+            or date_str[4] != "-" or date_str[7] != "-"):
+        return 0
+    try:
+        day = date.fromisoformat(date_str).toordinal()
+    except ValueError:
+        return 0
+    return _days.setdefault(day, day)
+
+
+def iso_from_day(day):
+    if not day:
+        return None
+    iso = _iso_days.get(day)
+    if iso is None:
+        iso = _iso_days[day] = date.fromordinal(day).isoformat()
+    return iso
+
+
+def month_of_day(day):
+    """Номер дня -> "2025-03" (0 -> "undated")"""
+    if not day:
+        return "undated"
+    return iso_from_day(day)[:7]
+
+
+class Task:
+    __slots__ = ("uid", "text", "day", "flags", "extra", "rev", "src")
+
+    def __init__(self, uid, text="", day=0, flags=0, extra=None, rev=0, src=None):
+        self.uid = uid       # bytes(16) или str для нестандартных id
+        self.text = text
+        self.day = day       # date.toordinal(), 0 - без даты
+        self.flags = flags
+        self.extra = extra   # None или {ключ: значение как в файле}
+        self.rev = rev       # Номер правки
+        self.src = src       # instance_id автора правки (None - правок не было)
+
+    # --- Поля ---
+
+    @property
+    def id(self):
+        return id_from_uid(self.uid)
+
+    @property
+    def date(self):
+        if self.extra is not None and "date" in self.extra:
+            value = self.extra["date"]
+            return None if value is _MISSING else value
+        return iso_from_day(self.day)
+
+    @date.setter
+    def date(self, value):
+        self._set("date", value)
+
+    @property
+    def month(self):
+        return month_of_day(self.day)
+
+    @property
+    def version(self):
+        """(rev, src) - см. record_version"""
+        return self.rev, self.src or ""
+
+    def _flag(self, bit):
+        return bool(self.flags & bit)
+
+    def _set_flag(self, bit, value):
+        self.flags = (self.flags | bit) if value else (self.flags & ~bit)
+
+    checked = property(lambda self: self._flag(CHECKED),
+                       lambda self, value: self._set("checked", value))
+    archive = property(lambda self: self._flag(ARCHIVE),
+                       lambda self, value: self._set("archive", value))
+    important = property(lambda self: self._flag(IMPORTANT),
+                         lambda self, value: self._set("important", value))
+
+    def field(self, key):
+        """Значение поля как в файле ("checked" -> bool, "date" -> строка)"""
+        if self.extra is not None and key in self.extra:
+            value = self.extra[key]
+            return None if value is _MISSING else value
+        if key == "id":
+            return self.id
+        if key == "text":
+            return self.text
+        if key == "date":
+            return self.date
+        for name, bit in FLAG_KEYS:
+            if key == name:
+                return self._flag(bit)
+        return None
+
+    def _set(self, key, value):
+        """Ставит поле из значения в формате файла"""
+        if self.extra is not None:
+            self.extra.pop(key, None)
+            if not self.extra:
+                self.extra = None
+        if key == "text" and isinstance(value, str):
+            self.text = value
+            return
+        if key == "rev" and type(value) is int:
+            self.rev = value
+            return
+        if key == "src" and type(value) is str:
+            self.src = value
+            return
+        if key == "date":
+            self.day = day_from_iso(value)
+            if iso_from_day(self.day) == value:
+                return
+        for name, bit in FLAG_KEYS:
+            if key == name and isinstance(value, bool):
+                self._set_flag(bit, value)
+                return
+            if key == name:
+                self._set_flag(bit, bool(value))
+        if key == "id":
+            self.uid = uid_from_id(value)
+            if self.id == value:
+                return
+        # Нестандартное значение или лишний ключ - храним как есть
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def update(self, fields):
+        for key, value in fields.items():
+            self._set(key, value)
+
+    # --- Формат файла ---
+
+    @classmethod
+    def from_dict(cls, data):
+        rev, src = data.get("rev", 0), data.get("src")
+        if (len(data) == 6 + ("rev" in data) + ("src" in data) and type(rev) is int
+                and (type(src) is str or "src" not in data)):
+            # Обычный таск: шесть ключей в каноническом виде (и, может быть, rev и src)
+            try:
+                uid = uid_from_id(data["id"])
+                text, date_str = data["text"], data["date"]
+                checked, archive, important = data["checked"], data["archive"], data["important"]
+            except KeyError:
+                pass
+            else:
+                day = day_from_iso(date_str)
+                if (type(uid) is bytes and type(text) is str and (day or date_str is None)
+                        and type(checked) is bool and type(archive) is bool and type(important) is bool):
+                    return cls(uid, text, day,
+                               (CHECKED if checked else 0) | (ARCHIVE if archive else 0)
+                               | (IMPORTANT if important else 0), None, rev, src)
+        task = cls(None)
+        for key in FIELDS:
+            if key in data:
+                task._set(key, data[key])
+            else:
+                if task.extra is None:
+                    task.extra = {}
+                task.extra[key] = _MISSING
+        for key, value in data.items():
+            if key not in FIELDS:
+                task._set(key, value)
+        return task
+
+    def to_dict(self):
+        flags = self.flags
+        data = {
+            "id": id_from_uid(self.uid),
+            "text": self.text,
+            "date": iso_from_day(self.day),
+            "checked": bool(flags & CHECKED),
+            "archive": bool(flags & ARCHIVE),
+            "important": bool(flags & IMPORTANT),
+        }
+        if self.rev:
+            data["rev"] = self.rev
+        if self.src is not None:
+            data["src"] = self.src
+        if self.extra is not None:
+            for key, value in self.extra.items():
+                if value is _MISSING:
+                    data.pop(key, None)
+                else:
+                    data[key] = value
+        return data
+
+    def __repr__(self):
+        return f"Task({self.to_dict()!r})"
+
+
+def record_version(data):
+    """Версия таска в формате файла: (rev, src). Больше - новее; при равном rev
+    побеждает больший src, так что все экземпляры выбирают одну версию"""
+    return data.get("rev", 0), data.get("src") or ""
+
+
+def tasks_from_dicts(dicts):
+    return [Task.from_dict(d) for d in dicts]
+
+
+def tasks_to_dicts(tasks):
+    return [t.to_dict() for t in tasks]
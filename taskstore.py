@@ -0,0 +1,1996 @@
+import os
+import gzip
+import lzma
+import zlib
+import uuid
+import errno
+import sqlite3
+import hashlib
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+import serializer
+from tracing import log, span, count
+from taskrecord import (Task, CHECKED, ARCHIVE, IMPORTANT, uid_from_id, day_from_iso, month_of_day,
+                        record_version, tasks_to_dicts)
+from searchindex import SearchIndex
+
+
+def read_tasks(path, convert=None):
+    """Читает файл тасков (любой версии формата) и возвращает список [..].
+
+    convert(словарь) применяется к каждому таску сразу после разбора -
+    большой файл читается потоково, и словари не копятся все разом.
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with span("read_tasks", file=os.path.basename(path), bytes=os.path.getsize(path)):
+            if convert is None:
+                return list(serializer.iter_tasks(path))
+            return [convert(d) for d in serializer.iter_tasks(path)]
+    except serializer.DECODE_ERRORS:
+        # Битый файл не затираем молча - откладываем копию рядом
+        backup_path = path + ".corrupt"
+        try:
+            os.replace(path, backup_path)
+            log.error(f"Error reading {path}. Moved it to {backup_path}, starting empty.")
+        except OSError:
+            log.error(f"Error reading {path}. File will be overwritten.")
+        return []
+
+
+def write_json_atomic(path, data, pretty=False):
+    """Пишет JSON во временный файл, fsync и os.replace поверх старого.
+
+    Падение посреди записи оставляет старый файл целым.
+    """
+    tmp_path = path + ".tmp"
+    with span("write_json", file=os.path.basename(path)) as sp:
+        encoded = serializer.dumps(data, pretty=pretty)
+        with open(tmp_path, "wb") as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        sp.set(bytes=len(encoded))
+    count("bytes_written", len(encoded))
+
+
+def write_tasks(path, tasks_list, pretty=False):
+    """Перезаписывает файл тасков (атомарно, в текущей версии формата)"""
+    try:
+        write_json_atomic(path, serializer.task_file(tasks_list), pretty=pretty)
+    except Exception as e:
+        log.error(f"---!!! CRITICAL WRITE ERROR in {path} !!!---")
+        log.error(f"---!!! Error: {e} !!!---")
+
+
+def lock_path(path):
+    """tasks_small.json -> tasks_small.lock (рядом с файлом)"""
+    base, _ = os.path.splitext(path)
+    return base + ".lock"
+
+
+def file_stamp(path):
+    """(mtime в нс, размер) - дешевая проверка, менялся ли файл; None - файла нет"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def file_digest(path):
+    """Хеш содержимого файла (None - не читается). Считается, только когда
+    штамп уже разошелся: синхронизация папок любит трогать mtime без изменений"""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.digest()
+
+
+class FileLock:
+    """Рекомендательная блокировка файлов данных между процессами.
+
+    fcntl.flock (Linux, macOS) или msvcrt.locking (Windows) на отдельном
+    файле tasks_small.lock. Поток записи держит ее на каждую пачку, чтение
+    чужих изменений - на время чтения, так что два экземпляра не пишут
+    вперемешку и не читают недописанное. Повторный вход из того же процесса
+    не блокирует. Если ФС блокировки не умеет (бывает на сетевых дисках),
+    работаем без нее, как раньше.
+
+    GUI-поток ждать не должен: acquire(blocking=False) сразу возвращает
+    False, если блокировку держит другой процесс или наш поток записи.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.RLock()
+        self._depth = 0
+        self._file = None
+        self._broken = False
+
+    def acquire(self, blocking=True):
+        """-> True, если блокировка взята (тогда - release()); False только при blocking=False"""
+        if not self._local.acquire(blocking):
+            return False
+        self._depth += 1
+        if self._depth == 1 and not self._broken:
+            try:
+                locked = self._acquire(blocking)
+            except OSError as e:
+                log.warning(f"Cannot lock {self.path} ({e}), sharing data files without a lock.")
+                self._broken = True
+                self._release()
+            else:
+                if not locked:
+                    self._depth -= 1
+                    self._local.release()
+                    return False
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._release()
+        self._local.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def _acquire(self, blocking):
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:   # LOCK_NB: держит другой процесс
+                self._release()
+                return False
+            return True
+        self._file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError as e:
+                if not blocking and e.errno in (errno.EACCES, errno.EDEADLOCK):
+                    self._release()   # LK_NBLCK: держит другой процесс
+                    return False
+                # LK_LOCK сдается через ~10 сек ожидания; другие ошибки - наверх
+                if e.errno != errno.EDEADLOCK:
+                    raise
+
+    def _release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError:
+            pass
+        finally:
+            self._file.close()
+            self._file = None
+
+
+WRITE_COALESCE_DELAY = 0.3   # Сек.: изменения внутри этого окна уходят на диск одной записью
+
+
+class DiskWriter:
+    """Фоновый поток записи на диск, чтобы GUI никогда не ждал диск.
+
+    replace(path, data) - перезаписать JSON-файл; если запись этого файла
+        ещё в очереди (и после нее не было call), она просто получает
+        новые данные (склейка).
+    append(path, data)  - дописать байты в конец файла (журнал).
+    call(fn)            - выполнить fn в потоке записи, по порядку с остальным.
+
+    Поток ждёт WRITE_COALESCE_DELAY после первого запроса, потом пишет всё
+    накопившееся пачкой. flush() дожидается, пока очередь не опустеет.
+    lock (FileLock) держится на время записи каждой пачки.
+    """
+
+    def __init__(self, delay=WRITE_COALESCE_DELAY, lock=None):
+        self.delay = delay
+        self.lock = lock
+        self._cond = threading.Condition()
+        self._queue = []         # [["replace", path, (data, pretty)] | ["append", path, bytes] | ["call", fn, None]]
+        self._replace_slots = {} # path -> запись replace, ещё стоящая в очереди
+        self._busy = False
+        self._hurry = False
+        self._closed = False
+        self._thread = None
+
+    def _put(self, entry):
+        with self._cond:
+            if self._closed:
+                # После close() пишем сразу, в вызывающем потоке
+                self._process([entry])
+                return
+            self._queue.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="traytodo-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def replace(self, path, data, pretty=False):
+        """data должен быть снимком (GUI продолжает менять свои объекты)"""
+        with self._cond:
+            entry = self._replace_slots.get(path)
+            if entry is not None:
+                entry[2] = (data, pretty)
+                return
+            entry = ["replace", path, (data, pretty)]
+            if not self._closed:
+                self._replace_slots[path] = entry
+        self._put(entry)
+
+    def append(self, path, text):
+        self._put(["append", path, text])
+
+    def call(self, fn):
+        with self._cond:
+            # Склейка не переносит запись файла через вызов: иначе более новые данные
+            # файла легли бы на диск раньше fn (например, удаления этого же файла)
+            self._replace_slots.clear()
+        self._put(["call", fn, None])
+
+    def idle(self):
+        """Очередь пуста и ничего не пишется (flush() не ждал бы)"""
+        with self._cond:
+            return not self._queue and not self._busy
+
+    def flush(self):
+        """Блокирует, пока всё из очереди не будет записано"""
+        with self._cond:
+            self._hurry = True
+            self._cond.notify_all()
+            while self._queue or self._busy:
+                self._cond.wait()
+            self._hurry = False
+
+    def close(self):
+        """Записывает остаток очереди и останавливает поток"""
+        if self._thread is None:
+            self._closed = True
+            return
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # Окно склейки: ждём, пока пачка правок не закончится
+                deadline = time.monotonic() + self.delay
+                while not self._hurry and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._queue
+                self._queue = []
+                self._replace_slots = {}
+                self._busy = True
+
+            self._process(batch)
+
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def _process(self, batch):
+        appended = {}   # path -> открытый файл; закрываются (с fsync) в конце пачки
+        with span("disk_writer.batch", entries=len(batch)), self.lock or nullcontext():
+            try:
+                for kind, target, payload in batch:
+                    try:
+                        if kind == "replace":
+                            data, pretty = payload
+                            write_json_atomic(target, data, pretty=pretty)
+                        elif kind == "append":
+                            f = appended.get(target)
+                            if f is None:
+                                f = appended[target] = open(target, "ab")
+                            f.write(payload)
+                            count("bytes_written", len(payload))
+                        else:
+                            # Вызов может переименовать файл журнала - дописанное сбрасываем до него
+                            self._close_files(appended)
+                            target()
+                    except Exception as e:
+                        log.error(f"---!!! CRITICAL WRITE ERROR ({kind} {target}) !!!---")
+                        log.error(f"---!!! Error: {e} !!!---")
+            finally:
+                self._close_files(appended)
+
+    def _close_files(self, files):
+        for path, f in list(files.items()):
+            try:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+            except Exception as e:
+                log.error(f"---!!! CRITICAL WRITE ERROR in {path} !!!---")
+                log.error(f"---!!! Error: {e} !!!---")
+        files.clear()
+
+
+JOURNAL_MAX_OPS = 500               # После стольких операций журнал сжимается в снимок
+JOURNAL_MAX_BYTES = 1024 * 1024     # ...или после такого размера журнала
+
+
+def journal_path(path):
+    """tasks_small.json -> tasks_small.journal.jsonl (рядом с файлом)"""
+    base, _ = os.path.splitext(path)
+    return base + ".journal.jsonl"
+
+
+def archive_dir(path):
+    """tasks_small.json -> tasks_small.archive/ (папка с помесячными файлами архива)"""
+    base, _ = os.path.splitext(path)
+    return base + ".archive"
+
+
+COLD_CODECS = {   # Сжатие холодных сегментов: имя -> (compress, decompress)
+    "xz": (lzma.compress, lzma.decompress),   # Плотнее
+    "gz": (gzip.compress, gzip.decompress),   # Быстрее
+}
+COLD_DEAD_SHARE = 0.5   # Сегмент переписывается, когда мертвые байты больше этой доли живых
+
+
+def cold_dir(path):
+    """tasks_small.json -> tasks_small.archive/cold/ (сжатые сегменты старых месяцев)"""
+    return os.path.join(archive_dir(path), "cold")
+
+
+def cold_segment(month):
+    """Сегмент, в который уходит месяц: по году ("2023"), "undated" - отдельно"""
+    return "undated" if month == "undated" else month[:4]
+
+
+def cold_cutoff(months, today=None):
+    """Ключ месяца: всё, что раньше него, старше months месяцев (октябрь 2026, 12 -> "2025-10")"""
+    today = today or date.today()
+    total = today.year * 12 + today.month - 1 - months
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+def partition_key(task):
+    """Месяц архива, в который попадает таск: "2025-03" (или "undated")"""
+    return task.month
+
+
+def month_sort_key(month):
+    """"undated" - раньше всех месяцев"""
+    return "" if month == "undated" else month
+
+
+def day_range(date_from=None, date_to=None):
+    """ISO-границы [date_from, date_to) -> номера дней (без даты = день 0, самый старый)"""
+    lo = day_from_iso(date_from) if date_from is not None else None
+    hi = day_from_iso(date_to) if date_to is not None else None
+    return lo, hi
+
+
+def tasks_by_id(tasks_list):
+    """[таски] -> {id: таск} в том же порядке (dict сохраняет порядок вставки)"""
+    return {t.id: t for t in tasks_list}
+
+
+def apply_op(tasks, op, newer_only=False):
+    """Применяет одну операцию журнала к {id: таск} (идемпотентно), за O(1) на таск.
+
+    newer_only=True - операция другого экземпляра (или журнала, куда писали
+    несколько экземпляров): правка таска, у которого у нас версия (rev, src)
+    уже больше, пропускается (наша версия новее).
+    Возвращает set id, которые затронула операция.
+    """
+    kind = op.get("op")
+
+    if kind == "add":
+        # Существующий id заменяется на месте, новый - в конец
+        task = Task.from_dict(op["task"])
+        old = tasks.get(task.id)
+        if newer_only and old is not None and old.version > task.version:
+            return set()
+        tasks[task.id] = task
+        return {task.id}
+
+    if kind == "update":
+        task = tasks.get(op["id"])
+        if task is None:
+            return set()
+        if newer_only and record_version(op["fields"]) < task.version:
+            return set()
+        task.update(op["fields"])
+        return {op["id"]}
+
+    if kind == "delete":
+        if tasks.pop(op["id"], None) is None:
+            return set()
+        return {op["id"]}
+
+    if kind == "batch":
+        ids = set()
+        for sub_op in op["ops"]:
+            ids |= apply_op(tasks, sub_op, newer_only)
+        return ids
+
+    if kind == "archive":
+        ids = set()
+        revs = op.get("revs")
+        for i, task_id in enumerate(op["ids"]):
+            task = tasks.get(task_id)
+            if task is not None:
+                task.archive = True
+                task.date = op["date"]
+                if revs:
+                    task.rev = revs[i]
+                    task.src = op.get("src")
+                ids.add(task_id)
+        return ids
+
+    log.warning(f"Unknown journal op: {kind}")
+    return set()
+
+
+def removed_ids(op):
+    """id, которые операция убирает из активного списка (удаление, архивация)"""
+    kind = op.get("op")
+    if kind == "delete":
+        return {op["id"]}
+    if kind == "archive":
+        return set(op["ids"])
+    if kind == "batch":
+        return set().union(*map(removed_ids, op["ops"]))
+    return set()
+
+
+def new_task_record(text, date_iso=None):
+    """Новый таск в формате файла (в операциях журнала таски - словари, как на диске)"""
+    return {
+        "id": str(uuid.uuid4()),
+        "text": text,
+        "date": date_iso or datetime.now().date().isoformat(),
+        "checked": False,
+        "archive": False,
+        "important": False
+    }
+
+
+class JsonEngine:
+    """Хранение в JSON-файлах.
+
+    journal=False: каждое изменение перезаписывает весь файл.
+    journal=True:  изменение - одна строка JSONL в журнале рядом с файлом;
+                   журнал проигрывается при старте и в фоне сжимается
+                   в снимок tasks_small.json, когда становится большим.
+
+    В tasks_small.json лежат только активные таски. Архив хранится
+    отдельно, по файлу на месяц (tasks_small.archive/2025-03.json), и
+    месяцы читаются с диска только когда их кто-то запрашивает.
+
+    Прочитанный месяц держится отсортированным по дню (номер дня считается
+    один раз, при чтении или архивации). Вместе с префиксными суммами
+    размеров месяцев это дает число тасков до любого дня за два bisect -
+    размеры периодов и страницы архива считаются за O(log n).
+    Старые файлы, где архив лежит вместе с активными, переносятся
+    автоматически при load().
+
+    Месяцы старше срока хранения (apply_retention) уходят в холодный
+    архив: сжатый поток на месяц, дописанный в сегмент года
+    (tasks_small.archive/cold/2023.1.seg), и запись о нем в индексе
+    сегмента (2023.index.json: смещение, длина, сжатие, число тасков,
+    первый и последний день). Число тасков месяца остается в index.json,
+    так что размеры периодов считаются без распаковки; месяц
+    распаковывается, только когда его показывают или в нем нашлось
+    что-то при поиске. Правка холодного месяца возвращает его в обычный
+    файл (горячий файл месяца всегда главнее записи в сегменте), а
+    сегмент переписывается, когда мертвых байт в нем становится больше,
+    чем живых.
+
+    Один набор файлов могут открыть несколько экземпляров (второй процесс,
+    другая машина через общую папку). Запись идет под FileLock; файлы,
+    которые переписываются целиком, перед записью сливаются с тем, что на
+    диске успел записать другой экземпляр (из двух версий таска остается
+    та, у которой больше (rev, src)), строки журнала помечены instance_id.
+    poll_external() отдает чужие изменения, не перечитывая то, что не менялось.
+    """
+
+    archive_on_demand = True   # get_archived() видит только прочитанные месяцы
+
+    def __init__(self, path, journal=False):
+        self.path = path
+        self.journal = journal
+        self.journal_path = journal_path(path)
+        self.archive_dir = archive_dir(path)
+        self.cold_dir = cold_dir(path)
+        self._active = {}           # Ссылка на активные таски TaskStore {id: таск}
+        self._archive = {}          # "2025-03" -> [Task] по возрастанию дня, только прочитанные месяцы
+        self._archive_days = {}     # "2025-03" -> [Task.day] того же месяца (для bisect)
+        self._month_prefix = None   # (месяцы по возрастанию, их ключи, префиксные суммы размеров)
+        self._archived_by_id = {}   # Task.uid -> таск, по прочитанным месяцам
+        self._counts = None         # "2025-03" -> число тасков (index.json в папке архива)
+        self._cold = None           # "2023" -> индекс холодного сегмента (читаются при первом обращении)
+
+        self.lock = FileLock(lock_path(path))
+        self.writer = DiskWriter(lock=self.lock)
+        self._journal_ops = 0
+        self._journal_bytes = 0
+        self._journal_pos = 0       # До какого байта журнал прочитан (дальше - чужие дописки)
+        self._synced = {}           # Путь -> (штамп, хеш или None) версии, которую мы читали/писали
+        self._synced_ids = {}       # Путь -> id тасков в этой версии (пропавшие с диска - удалены там)
+        self.instance_id = uuid.uuid4().hex[:12]   # Метка наших строк в общем журнале
+
+        # Файлы, которые пишутся целиком, ставятся в очередь снимками; поток записи
+        # сливает их с диском. Снимки и id, убранные нами (чтобы слияние не вернуло их)
+        self._pending_lock = threading.Lock()
+        self._pending_active = None
+        self._removed_active = set()
+        self._pending_partitions = {}   # "2025-03" -> (снимок, убранные id)
+        self._pending_counts = {}       # "2025-03" -> число тасков для index.json (0 - убрать)
+        self._archive_flush_queued = False
+        self._removed_archived = {}     # "2025-03" -> id, убранные из месяца с прошлой записи
+
+    def load(self):
+        """Читает активный файл и проигрывает журнал. Возвращает активные таски"""
+        with self.lock:
+            tasks = self._read_active()
+
+        # Миграция: архивные таски из общего файла (или из старого журнала)
+        # уезжают в помесячные файлы, активный файл перезаписывается без них
+        migrated_ids = [task_id for task_id, t in tasks.items() if t.archive]
+        migrated = [tasks.pop(task_id) for task_id in migrated_ids]
+        self._active = tasks
+        if migrated:
+            self._store_archived(migrated)
+            log.info(f"Moved {len(migrated)} archived task(s) to {self.archive_dir}")
+
+        if self.journal:
+            if (migrated or self._journal_ops >= JOURNAL_MAX_OPS
+                    or os.path.exists(self.journal_path + ".compacting")):
+                self.compact()
+        elif migrated:
+            self._write_active(migrated_ids)
+        return self._active
+
+    def last_modified(self):
+        """Время последней записи активных тасков (файл или журнал), None - данных нет"""
+        times = [os.path.getmtime(p) for p in (self.path, self.journal_path) if os.path.exists(p)]
+        return max(times) if times else None
+
+    def watch_paths(self):
+        """Что смотреть, чтобы заметить запись другого экземпляра: файлы меняются на месте
+        (журнал) или заменяются (os.replace), папки - ловят замену и появление файлов"""
+        return [os.path.dirname(os.path.abspath(self.path)), self.archive_dir,
+                self.path, self.journal_path]
+
+    # --- Общий доступ нескольких экземпляров ---
+
+    def _changed_on_disk(self, path):
+        """Файл менял кто-то другой с тех пор, как мы его читали или писали?
+        Сначала штамп (mtime, размер); если он разошелся, а хеш был запомнен, - хеш"""
+        synced = self._synced.get(path)
+        stamp = file_stamp(path)
+        if synced is None:
+            return stamp is not None
+        if synced[0] == stamp:
+            return False
+        if synced[1] is not None and stamp is not None and file_digest(path) == synced[1]:
+            self._synced[path] = (stamp, synced[1])
+            return False
+        return True
+
+    def _mark_synced(self, path, digest=False, ids=None):
+        """Запоминает версию файла как свою. digest=True - и хеш (для маленьких файлов);
+        ids - id тасков, которые в ней лежат"""
+        self._synced[path] = (file_stamp(path), file_digest(path) if digest else None)
+        if ids is not None:
+            self._synced_ids[path] = ids
+
+    def _read_active(self, remember=True):
+        """Снимок + журнал(ы) с диска -> {id: таск} (вызывать под self.lock).
+
+        remember=True - запомнить прочитанную версию: poll_external() дальше
+        читает только то, что добавилось.
+        """
+        if remember:
+            self._mark_synced(self.path, digest=True)
+        # Ключи - id из файла как есть (без обратного перевода из байт)
+        tasks = dict(read_tasks(self.path, lambda d: (d.get("id"), Task.from_dict(d))))
+        if remember:
+            self._synced_ids[self.path] = set(tasks)
+        if not self.journal:
+            return tasks
+        # Сначала журнал, оставшийся от прерванного сжатия, потом текущий
+        replayed = 0
+        for path in (self.journal_path + ".compacting", self.journal_path):
+            ops, end = self._read_journal(path)
+            with span("journal.replay", file=os.path.basename(path), ops=len(ops)):
+                for op in ops:
+                    # В общий журнал писали и другие экземпляры: порядок строк - не порядок версий
+                    apply_op(tasks, op, newer_only=True)
+            replayed += len(ops)
+        if remember:
+            self._journal_ops = replayed
+            self._journal_pos = self._journal_bytes = end
+        return tasks
+
+    def _read_journal(self, path, start=0):
+        """Операции журнала с байта start -> (операции, позиция после последней целой строки)"""
+        if not os.path.exists(path):
+            return [], start
+        ops = []
+        pos = start
+        with open(path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break   # Строку еще дописывают (или запись оборвалась) - дочитаем потом
+                if line.strip():
+                    try:
+                        ops.append(serializer.loads(line))
+                    except serializer.DECODE_ERRORS:
+                        # Недописанная строка после падения - дальше ничего нет
+                        log.warning(f"Journal {path}: skipping broken record.")
+                        break
+                pos += len(line)
+        return ops, pos
+
+    def _tail_journal(self):
+        """Чужие операции, дописанные в журнал после прочитанного -> (операции, новая позиция).
+        None - журнал стал короче (его сжали), читать нужно всё заново"""
+        stamp = file_stamp(self.journal_path)
+        if (stamp[1] if stamp else 0) < self._journal_pos:
+            return None
+        ops, end = self._read_journal(self.journal_path, self._journal_pos)
+        return [op for op in ops if op.get("src") != self.instance_id], end
+
+    def poll_external(self, wait=True):
+        """Изменения, которые другие экземпляры записали после load() (или прошлого вызова).
+
+        -> None, если ничего не менялось, иначе (операции, таски, archive_changed):
+        операции - чужие строки журнала; таски - все активные {id: таск}, если
+        файл переписан целиком (сжатие журнала, режим без журнала), иначе None;
+        archive_changed - менялся архив (прочитанные месяцы сброшены).
+        Неизменившиеся файлы не читаются: сначала штамп, потом хеш.
+        wait=False - не ждать записи: False, если файлы сейчас пишет наш поток
+        записи или другой экземпляр (тогда проверить позже).
+        """
+        if wait:
+            self.writer.flush()   # Свое - на диске, иначе оно выглядело бы чужим
+        elif not self.writer.idle():
+            return False
+        if not self.lock.acquire(wait):
+            return False
+        try:
+            ops, tasks = [], None
+            tail = self._tail_journal() if self.journal else ([], 0)
+            if tail is None or self._changed_on_disk(self.path):
+                tasks = {task_id: t for task_id, t in self._read_active().items() if not t.archive}
+            elif self.journal:
+                ops, self._journal_pos = tail
+            archive_changed = self._changed_on_disk(self._index_path())
+            if archive_changed:
+                self._mark_synced(self._index_path(), digest=True)
+        finally:
+            self.lock.release()
+        if archive_changed:
+            self.forget_archive()
+        if not ops and tasks is None and not archive_changed:
+            return None
+        count("external_changes")
+        return ops, tasks, archive_changed
+
+    def forget_archive(self):
+        """Сбрасывает прочитанные месяцы архива: их переписал другой экземпляр"""
+        self._archive, self._archive_days, self._archived_by_id = {}, {}, {}
+        self._counts = self._month_prefix = self._cold = None
+
+    def _merge_with_disk(self, path, snapshot, removed, read=read_tasks):
+        """Наш снимок файла + то, что туда успели записать другие экземпляры.
+
+        -> (словари для записи, были ли чужие изменения). Из двух версий таска
+        остается та, у которой больше (rev, src); removed - id, которые убрали
+        мы сами (их на диске не возвращаем), а таски, которые были в прочитанной
+        нами версии, но пропали с диска, удалил другой экземпляр (их не возвращаем
+        тоже). read(path) - версия на диске. Вызывается в потоке записи, под блокировкой.
+        """
+        if not self._changed_on_disk(path):
+            return snapshot, False
+        disk = read(path)
+        on_disk = {d.get("id") for d in disk}
+        known = self._synced_ids.get(path, set())
+        merged = [d for d in snapshot if d.get("id") in on_disk or d.get("id") not in known]
+        position = {d.get("id"): i for i, d in enumerate(merged)}
+        for d in disk:
+            i = position.get(d.get("id"))
+            if i is None:
+                if d.get("id") not in removed:
+                    merged.append(d)
+            elif record_version(d) > record_version(merged[i]):
+                merged[i] = d
+        count("merged_writes")
+        return merged, True
+
+    def persist(self, op, active, archived):
+        """Сохраняет операцию над активным списком.
+
+        archived - таски, которые эта операция унесла в архив. Месяцы пишутся
+        раньше, чем активный файл/журнал, поэтому при падении таск в худшем
+        случае окажется в двух местах, но не потеряется (при повторном
+        переносе дубликат заменяется по id).
+        """
+        self._active = active
+        if archived:
+            self._store_archived(archived)
+
+        if self.journal:
+            self._journal_append(op)
+            if archived and self._journal_ops:
+                # Ушедшие в архив таски дальше живут в месячных файлах (их там правят
+                # и удаляют). Журнал с ними при проигрывании вернул бы старые версии
+                self.compact()
+        else:
+            self._write_active(removed_ids(op))
+
+    def _write_active(self, removed=()):
+        # Снимок в формате файла: GUI-поток продолжает менять активный список
+        snapshot = tasks_to_dicts(self._active.values())
+        with self._pending_lock:
+            schedule = self._pending_active is None
+            self._pending_active = snapshot
+            self._removed_active.update(removed)
+        if schedule:
+            self.writer.call(self._flush_active)
+
+    def _flush_active(self):
+        # Поток DiskWriter, под блокировкой файла
+        with self._pending_lock:
+            snapshot, self._pending_active = self._pending_active, None
+            removed, self._removed_active = self._removed_active, set()
+        tasks_list, merged = self._merge_with_disk(self.path, snapshot, removed)
+        write_json_atomic(self.path, serializer.task_file(tasks_list))
+        if not merged:
+            self._mark_synced(self.path, digest=True, ids={d.get("id") for d in tasks_list})
+
+    # --- Архив по месяцам ---
+
+    def _partition_path(self, month):
+        return os.path.join(self.archive_dir, month + ".json")
+
+    def _index_path(self):
+        return os.path.join(self.archive_dir, "index.json")
+
+    def _month_counts(self):
+        """Число тасков в каждом месяце, без чтения самих месяцев.
+
+        Хранится в index.json рядом с месяцами; если индекса нет (или он
+        разошёлся со списком файлов), недостающие месяцы читаются один раз.
+        """
+        if self._counts is not None:
+            return self._counts
+
+        with self.lock:
+            self._mark_synced(self._index_path(), digest=True)
+            counts = self._read_index()
+
+        files = set()
+        if os.path.isdir(self.archive_dir):
+            files = {name[:-5] for name in os.listdir(self.archive_dir)
+                     if name.endswith(".json") and name != "index.json"}
+        for sidecar in list(self._cold_segments().values()):   # Поток записи может добавить сегмент
+            files.update(sidecar["months"])
+
+        fixed = {m: c for m, c in counts.items() if m in files}
+        for month in files - set(fixed):
+            fixed[month] = len(self._partition(month))
+
+        self._counts = fixed
+        self._month_prefix = None
+        if fixed != counts:
+            with self._pending_lock:
+                for month in set(counts) | set(fixed):
+                    if counts.get(month) != fixed.get(month):
+                        self._pending_counts[month] = fixed.get(month, 0)
+            self._schedule_archive_flush()
+        return self._counts
+
+    def _read_index(self):
+        path = self._index_path()
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "rb") as f:
+                data = serializer.loads(f.read())
+        except (OSError, *serializer.DECODE_ERRORS):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _partition(self, month):
+        """Список тасков месяца по возрастанию дня; файл читается один раз и кешируется"""
+        if month not in self._archive:
+            path = self._partition_path(month)
+            self._mark_synced(path)
+            tasks_list = None
+            if os.path.exists(path):
+                try:
+                    tasks_list = read_tasks(path, Task.from_dict)
+                except FileNotFoundError:
+                    pass   # Как раз ушел в холодный архив
+            if tasks_list is None:
+                tasks_list = [Task.from_dict(d) for d in self._read_cold(month)]
+            self._synced_ids[path] = {t.id for t in tasks_list}
+            tasks_list.sort(key=lambda t: t.day)
+            self._archive[month] = tasks_list
+            self._archive_days[month] = [t.day for t in tasks_list]
+            self._archived_by_id.update((t.uid, t) for t in tasks_list)
+        return self._archive[month]
+
+    def _insert_archived(self, task):
+        month = partition_key(task)
+        tasks_list = self._partition(month)
+        days = self._archive_days[month]
+        i = bisect_right(days, task.day)
+        days.insert(i, task.day)
+        tasks_list.insert(i, task)
+        self._archived_by_id[task.uid] = task
+        return month
+
+    def _discard_archived(self, task):
+        month = partition_key(task)
+        tasks_list, days = self._archive[month], self._archive_days[month]
+        for i in range(bisect_left(days, task.day), bisect_right(days, task.day)):
+            if tasks_list[i] is task:
+                break
+        else:
+            i = tasks_list.index(task)
+        del tasks_list[i]
+        del days[i]
+        del self._archived_by_id[task.uid]
+        self._removed_archived.setdefault(month, set()).add(task.id)
+        return month
+
+    def _write_partition(self, month):
+        # Снимок месяца в очередь; поток записи сольет его с диском и обновит index.json
+        snapshot = tasks_to_dicts(self._archive.get(month, []))
+        removed = self._removed_archived.pop(month, set())
+        with self._pending_lock:
+            queued = self._pending_partitions.get(month)
+            if queued is not None:
+                removed |= queued[1]
+            self._pending_partitions[month] = (snapshot, removed)
+        self._schedule_archive_flush()
+
+        counts = self._month_counts()
+        if snapshot:
+            counts[month] = len(snapshot)
+        else:
+            counts.pop(month, None)
+        self._month_prefix = None
+
+    def _schedule_archive_flush(self):
+        with self._pending_lock:
+            schedule = not self._archive_flush_queued
+            self._archive_flush_queued = True
+        if schedule:
+            self.writer.call(self._flush_archive)
+
+    def _flush_archive(self):
+        """Пишет месяцы из очереди и index.json (поток DiskWriter, под блокировкой).
+        В index.json меняются только счетчики этих месяцев: остальные мог
+        поменять другой экземпляр"""
+        with self._pending_lock:
+            partitions, self._pending_partitions = self._pending_partitions, {}
+            counts, self._pending_counts = self._pending_counts, {}
+            self._archive_flush_queued = False
+        index_path = self._index_path()
+        in_sync = not self._changed_on_disk(index_path)
+        for month, (snapshot, removed) in partitions.items():
+            path = self._partition_path(month)
+            tasks_list, merged = self._merge_with_disk(path, snapshot, removed, self._month_on_disk)
+            if tasks_list:
+                os.makedirs(self.archive_dir, exist_ok=True)
+                write_json_atomic(path, serializer.task_file(tasks_list))
+            elif os.path.exists(path):
+                os.remove(path)
+            self._drop_cold(month)   # Месяц снова в обычном файле (или пуст)
+            if merged:
+                in_sync = False
+            else:
+                self._mark_synced(path, ids={d.get("id") for d in tasks_list})
+            counts[month] = len(tasks_list)
+
+        index = self._read_index()
+        for month, n in counts.items():
+            if n:
+                index[month] = n
+            else:
+                index.pop(month, None)
+        if not index and not os.path.isdir(self.archive_dir):
+            return
+        os.makedirs(self.archive_dir, exist_ok=True)
+        write_json_atomic(index_path, dict(sorted(index.items())))
+        if in_sync:
+            # Иначе следующий poll_external() увидит чужой архив и сбросит прочитанное
+            self._mark_synced(index_path, digest=True)
+
+    def _store_archived(self, tasks_list):
+        touched = set()
+        for task in tasks_list:
+            self._partition(partition_key(task))
+            # Тот же id уже в архиве (повторный перенос) - заменяется
+            old = self._archived_by_id.get(task.uid)
+            if old is not None:
+                touched.add(self._discard_archived(old))
+            touched.add(self._insert_archived(task))
+        for month in touched:
+            self._write_partition(month)
+
+    def archive_months(self):
+        """Ключи месяцев архива, от новых к старым (без чтения файлов)"""
+        # "undated" - самый старый
+        return sorted(self._month_counts(), key=month_sort_key, reverse=True)
+
+    def _sorted_partition(self, month):
+        return self._partition(month)[::-1]
+
+    def _month_index(self):
+        """Месяцы по возрастанию и префиксные суммы их размеров (по index.json, без чтения месяцев)"""
+        if self._month_prefix is None:
+            counts = self._month_counts()
+            months = sorted(counts, key=month_sort_key)
+            prefix = [0]
+            for month in months:
+                prefix.append(prefix[-1] + counts[month])
+            self._month_prefix = (months, [month_sort_key(m) for m in months], prefix)
+        return self._month_prefix
+
+    def _count_before(self, day):
+        """Число архивных тасков с днем < day (None - все). Читается не больше одного месяца"""
+        months, keys, prefix = self._month_index()
+        if day is None:
+            return prefix[-1]
+        key = month_sort_key(month_of_day(day))
+        i = bisect_left(keys, key)
+        total = prefix[i]
+        if i < len(keys) and keys[i] == key:
+            self._partition(months[i])
+            total += bisect_left(self._archive_days[months[i]], day)
+        return total
+
+    def _slice(self, start, end):
+        """Таски с позициями [start, end) в архиве, упорядоченном по дню (по возрастанию)"""
+        months, _, prefix = self._month_index()
+        result = []
+        i = max(0, bisect_right(prefix, start) - 1)
+        while start < end and i < len(months):
+            month_start = prefix[i]
+            month_end = min(end, prefix[i + 1])
+            if start < month_end:
+                result.extend(self._partition(months[i])[start - month_start:month_end - month_start])
+                start = month_end
+            i += 1
+        return result
+
+    def archived_tasks(self, months=None):
+        """Архивные таски указанных месяцев, от новых к старым"""
+        if months is None:
+            months = self.archive_months()
+        result = []
+        for month in sorted(months, key=month_sort_key, reverse=True):
+            result.extend(self._sorted_partition(month))
+        return result
+
+    def archive_count(self, date_from=None, date_to=None):
+        """Число архивных тасков с датой в [date_from, date_to): два bisect"""
+        return self.archive_counts([(date_from, date_to)])[0]
+
+    def archive_counts(self, ranges):
+        """archive_count() для списка диапазонов [(date_from, date_to)]; каждая граница - один bisect"""
+        before = {}   # день -> _count_before(день): общие границы соседних диапазонов
+        result = []
+        for date_from, date_to in ranges:
+            lo, hi = day_range(date_from, date_to)
+            for day in (lo, hi):
+                if day not in before:
+                    before[day] = self._count_before(day)
+            start = before[lo] if lo is not None else 0
+            result.append(max(0, before[hi] - start))
+        return result
+
+    def archived_range(self, date_from=None, date_to=None, offset=0, limit=None):
+        """Страница архива с датой в [date_from, date_to), от новых к старым.
+        Читаются только месяцы, на которые попадает страница"""
+        lo, hi = day_range(date_from, date_to)
+        start = self._count_before(lo) if lo is not None else 0
+        end = self._count_before(hi) - offset
+        if limit is not None:
+            start = max(start, end - limit)
+        if end <= start:
+            return []
+        return self._slice(start, end)[::-1]
+
+    def get_archived(self, task_id):
+        """Ищет таск в уже прочитанных месяцах архива (по индексу id)"""
+        return self._archived_by_id.get(uid_from_id(task_id))
+
+    def archived_by_ids(self, task_ids, months=()):
+        """Архивные таски по id (в том же порядке); months - где их искать, если еще не прочитаны"""
+        for month in months:
+            if month in self._month_counts():
+                self._partition(month)
+        return [task for task in map(self.get_archived, task_ids) if task is not None]
+
+    def _remove_archived(self, task):
+        self._write_partition(self._discard_archived(task))
+
+    def update_archived(self, task_id, fields):
+        """Меняет архивный таск, переписывая только его месяц(ы)"""
+        task = self.get_archived(task_id)
+        if task is None:
+            return None
+        self._remove_archived(task)
+        task.update(fields)
+        if task.archive:
+            self._store_archived([task])
+        return task
+
+    def delete_archived(self, task_id):
+        task = self.get_archived(task_id)
+        if task is None:
+            return False
+        self._remove_archived(task)
+        return True
+
+    # --- Холодный архив ---
+
+    def _cold_index_path(self, segment):
+        return os.path.join(self.cold_dir, segment + ".index.json")
+
+    def _load_cold_index(self, segment):
+        """Индекс сегмента с диска; нет файла (или он битый) - пустой"""
+        path = self._cold_index_path(segment)
+        sidecar = None
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    sidecar = serializer.loads(f.read())
+            except (OSError, *serializer.DECODE_ERRORS):
+                log.error(f"Error reading {path}. Cold segment {segment} is skipped.")
+        if not isinstance(sidecar, dict) or not isinstance(sidecar.get("months"), dict):
+            sidecar = {"file": f"{segment}.1.seg", "generation": 1, "dead": 0, "months": {}}
+        return sidecar
+
+    def _cold_segments(self):
+        """Индексы всех сегментов {"2023": индекс} (читаются один раз, без самих сегментов)"""
+        if self._cold is None:
+            names = os.listdir(self.cold_dir) if os.path.isdir(self.cold_dir) else []
+            self._cold = {name[:-11]: self._load_cold_index(name[:-11])
+                          for name in names if name.endswith(".index.json")}
+        return self._cold
+
+    def _read_cold(self, month, fresh=False):
+        """Словари тасков холодного месяца ([] - его нет в сегментах); распаковывается
+        только поток этого месяца. fresh=True - индекс сегмента читается с диска (поток записи)"""
+        segment = cold_segment(month)
+        sidecar = None if fresh else self._cold_segments().get(segment)
+        for retry in (False, True):
+            if retry or sidecar is None or month not in sidecar["months"]:
+                # Кеш индекса мог отстать: месяц только что ушел в сегмент или сегмент переписан
+                sidecar = self._load_cold_index(segment)
+                if not fresh and self._cold is not None and sidecar["months"]:
+                    self._cold[segment] = sidecar
+            entry = sidecar["months"].get(month)
+            if entry is None:
+                return []
+            try:
+                with span("archive.cold_read", month=month, bytes=entry["length"]):
+                    with open(os.path.join(self.cold_dir, sidecar["file"]), "rb") as f:
+                        f.seek(entry["offset"])
+                        blob = f.read(entry["length"])
+                    data = serializer.loads(COLD_CODECS[entry["codec"]][1](blob))
+                    return serializer.tasks_of(data)
+            except FileNotFoundError:
+                if retry:
+                    log.error(f"Cold segment {sidecar['file']} is missing, month {month} is skipped.")
+            except (OSError, KeyError, EOFError, lzma.LZMAError, zlib.error, *serializer.DECODE_ERRORS) as e:
+                log.error(f"Error reading cold month {month} from {sidecar['file']}: {e}")
+                return []
+        return []
+
+    def _month_on_disk(self, path):
+        """Версия месяца на диске для слияния: обычный файл, а если его нет - холодный поток"""
+        if os.path.exists(path):
+            return read_tasks(path)
+        return self._read_cold(os.path.basename(path)[:-5], fresh=True)
+
+    def _save_cold_index(self, segment, sidecar):
+        """Пишет индекс сегмента (поток записи, под блокировкой). Когда мертвых байт
+        больше COLD_DEAD_SHARE живых, живые потоки копируются в новый файл сегмента
+        (без распаковки); пустой сегмент удаляется целиком"""
+        index_path = self._cold_index_path(segment)
+        old_file = os.path.join(self.cold_dir, sidecar["file"])
+        months = sidecar["months"]
+        live = sum(entry["length"] for entry in months.values())
+        if not months:
+            for path in (index_path, old_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            sidecar = None
+        elif sidecar["dead"] > live * COLD_DEAD_SHARE:
+            with span("archive.cold_rewrite", segment=segment, live=live, dead=sidecar["dead"]):
+                generation = sidecar.get("generation", 1) + 1
+                new_name = f"{segment}.{generation}.seg"
+                entries = sorted(months.items(), key=lambda item: item[1]["offset"])
+                new_months = {}
+                with open(old_file, "rb") as src, open(os.path.join(self.cold_dir, new_name), "wb") as dst:
+                    for month, entry in entries:
+                        src.seek(entry["offset"])
+                        new_months[month] = dict(entry, offset=dst.tell())
+                        dst.write(src.read(entry["length"]))
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                sidecar = {"file": new_name, "generation": generation, "dead": 0,
+                           "months": dict(sorted(new_months.items()))}
+                write_json_atomic(index_path, sidecar)
+                try:
+                    os.remove(old_file)   # Индекс уже указывает на новый файл
+                except OSError as e:
+                    log.warning(f"Could not remove old cold segment {old_file}: {e}")
+        else:
+            write_json_atomic(index_path, dict(sidecar, months=dict(sorted(months.items()))))
+        if self._cold is not None:
+            if sidecar is None:
+                self._cold.pop(segment, None)
+            else:
+                self._cold[segment] = sidecar
+
+    def _drop_cold(self, month):
+        """Запись о месяце из сегмента убирается: месяц переписан обычным файлом
+        (поток записи, под блокировкой). Его байты в сегменте становятся мертвыми"""
+        segment = cold_segment(month)
+        if not os.path.exists(self._cold_index_path(segment)):
+            return
+        sidecar = self._load_cold_index(segment)
+        entry = sidecar["months"].pop(month, None)
+        if entry is not None:
+            sidecar["dead"] += entry["length"]
+            self._save_cold_index(segment, sidecar)
+
+    def apply_retention(self, cutoff, codec="xz"):
+        """Месяцы архива раньше cutoff ("2025-10") уходят в холодные сегменты (в потоке записи)"""
+        if codec not in COLD_CODECS:
+            raise ValueError(f"Unknown cold codec: {codec}")
+        self.writer.call(lambda: self._move_to_cold(cutoff, codec))
+
+    def _move_to_cold(self, cutoff, codec):
+        # Поток DiskWriter, под блокировкой файла. Сначала поток дописывается в сегмент,
+        # потом пишется индекс, и только потом удаляется обычный файл месяца: при падении
+        # месяц в худшем случае окажется в двух местах (главный - обычный файл)
+        if not os.path.isdir(self.archive_dir):
+            return
+        months = sorted(name[:-5] for name in os.listdir(self.archive_dir)
+                        if name.endswith(".json") and name != "index.json"
+                        and month_sort_key(name[:-5]) < cutoff)
+        if not months:
+            return
+        compress = COLD_CODECS[codec][0]
+        with span("archive.move_to_cold", months=len(months), codec=codec) as sp:
+            os.makedirs(self.cold_dir, exist_ok=True)
+            by_segment = {}
+            for month in months:
+                by_segment.setdefault(cold_segment(month), []).append(month)
+            moved = []
+            raw_bytes = cold_bytes = 0
+            for segment, segment_months in by_segment.items():
+                sidecar = self._load_cold_index(segment)
+                compressed = []
+                with open(os.path.join(self.cold_dir, sidecar["file"]), "ab") as f:
+                    f.seek(0, os.SEEK_END)
+                    for month in segment_months:
+                        with open(self._partition_path(month), "rb") as src:
+                            raw = src.read()
+                        try:
+                            tasks_list = serializer.tasks_of(serializer.loads(raw))
+                        except serializer.DECODE_ERRORS:
+                            log.error(f"Archive month {month} is unreadable, left as is.")
+                            continue
+                        days = sorted(d.get("date") for d in tasks_list if isinstance(d.get("date"), str))
+                        blob = compress(raw)
+                        old = sidecar["months"].get(month)
+                        if old is not None:
+                            sidecar["dead"] += old["length"]   # Устаревшая копия месяца
+                        sidecar["months"][month] = {
+                            "offset": f.tell(), "length": len(blob), "codec": codec,
+                            "count": len(tasks_list),
+                            "first": days[0] if days else None, "last": days[-1] if days else None,
+                        }
+                        f.write(blob)
+                        compressed.append(month)
+                        raw_bytes += len(raw)
+                        cold_bytes += len(blob)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._save_cold_index(segment, sidecar)
+                for month in compressed:
+                    path = self._partition_path(month)
+                    os.remove(path)
+                    self._synced[path] = (None, None)   # Наша же версия, только сжатая
+                moved += compressed
+            sp.set(moved=len(moved), raw_bytes=raw_bytes, cold_bytes=cold_bytes)
+        if moved:
+            log.info(f"Moved {len(moved)} archive month(s) before {cutoff} to {self.cold_dir}")
+
+    # --- Журнал ---
+
+    def _journal_append(self, op):
+        # src - чтобы poll_external() других экземпляров отличал свои строки от чужих
+        line = serializer.dumps(dict(op, src=self.instance_id)) + b"\n"
+        self.writer.append(self.journal_path, line)
+
+        self._journal_ops += 1
+        self._journal_bytes += len(line)
+        if self._journal_ops >= JOURNAL_MAX_OPS or self._journal_bytes >= JOURNAL_MAX_BYTES:
+            self.compact()
+
+    def compact(self):
+        """Сжимает журнал в снимок tasks_small.json (в потоке записи).
+
+        Текущий журнал переименовывается в *.compacting, новые операции идут
+        в свежий журнал. Если процесс упадёт во время сжатия, load() проиграет
+        оба журнала поверх старого снимка - операции идемпотентны.
+        Если в журнале есть операции других экземпляров, снимок собирается
+        с диска (под блокировкой), а не из памяти - в памяти их еще нет.
+        """
+        self._journal_ops = 0
+        self._journal_bytes = 0
+
+        # Копия словарей: GUI-поток продолжает менять активный список
+        snapshot = tasks_to_dicts(self._active.values())
+        compacting_path = self.journal_path + ".compacting"
+
+        def run():
+            with span("journal.compact") as sp:
+                # Все дописывания, поставленные до сжатия, к этому моменту уже в журнале
+                tail = self._tail_journal()
+                in_sync = (tail is not None and not tail[0] and not os.path.exists(compacting_path)
+                           and not self._changed_on_disk(self.path))
+                if os.path.exists(self.journal_path):
+                    if os.path.exists(compacting_path):
+                        # Остался от прерванного сжатия - он старше текущего журнала
+                        with open(compacting_path, "ab") as dst, open(self.journal_path, "rb") as src:
+                            dst.write(src.read())
+                        os.remove(self.journal_path)
+                    else:
+                        os.replace(self.journal_path, compacting_path)
+                if in_sync:
+                    tasks_list = snapshot
+                else:
+                    tasks = self._read_active(remember=False)
+                    tasks_list = [task.to_dict() for task in tasks.values() if not task.archive]
+                write_json_atomic(self.path, serializer.task_file(tasks_list))
+                if os.path.exists(compacting_path):
+                    os.remove(compacting_path)
+                if in_sync:
+                    # На диске ровно то, что у нас в памяти - poll_external() нечего перечитывать
+                    self._mark_synced(self.path, digest=True)
+                    self._journal_pos = 0
+                sp.set(tasks=len(tasks_list))
+
+        self.writer.call(run)
+
+    def flush(self):
+        """Дожидается записи всех изменений на диск"""
+        self.writer.flush()
+
+    def close(self):
+        """Записывает всё, что в очереди, и останавливает поток записи"""
+        self.writer.close()
+
+
+class SqliteEngine:
+    """Хранение в SQLite (tasks_small.db рядом с tasks_small.json).
+
+    Каждая операция - один UPDATE/INSERT/DELETE по первичному ключу,
+    архив читается упорядоченным запросом по индексу (archive, date).
+    Если базы ещё нет, а tasks_small.json есть - он импортируется.
+
+    Запись идёт в потоке DiskWriter через своё соединение: операции,
+    накопившиеся за окно склейки, уходят одной транзакцией. Чтение
+    (GUI-поток) сначала дожидается записи очереди.
+
+    Базу могут открыть несколько экземпляров сразу (блокировки - у SQLite).
+    Правка и добавление пишутся, только если их версия (rev, src) не старше
+    строки в базе - как слияние у JsonEngine. Чужие записи видны по PRAGMA
+    data_version; изменения архива считает триггер (meta.archive_version),
+    так что архив перечитывается, только если его менял кто-то другой.
+    """
+
+    archive_on_demand = False   # get_archived() ищет по всей базе
+    COLUMNS = ("id", "text", "date", "checked", "archive", "important", "rev", "src")
+    BOOL_COLUMNS = ("checked", "archive", "important")
+    _INSERT = f"INSERT OR REPLACE INTO tasks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    # Строка в базе не новее правки с версией ({rev}, {src}) - правку можно писать
+    _NOT_NEWER = "(rev < {rev} OR (rev = {rev} AND coalesce(src, '') <= {src}))"
+    _UPSERT = (f"INSERT INTO tasks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+               f" ON CONFLICT (id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:])}"
+               " WHERE " + _NOT_NEWER.format(rev="excluded.rev", src="coalesce(excluded.src, '')"))
+
+    def __init__(self, path):
+        self.json_path = path
+        self.path = os.path.splitext(path)[0] + ".db"
+        self.conn = None         # Чтение, GUI-поток
+        self.write_conn = None   # Запись, поток DiskWriter
+        self.writer = DiskWriter()
+        self.instance_id = uuid.uuid4().hex[:12]   # src наших правок
+        self._pending_lock = threading.Lock()
+        self._pending_ops = []
+        self._data_version = None      # PRAGMA data_version соединения чтения на прошлой проверке
+        self._archive_version = None   # meta.archive_version, до которой архив у нас актуален
+
+    def load(self):
+        is_new = not os.path.exists(self.path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS tasks (
+                id        TEXT PRIMARY KEY,
+                text      TEXT NOT NULL DEFAULT '',
+                date      TEXT,
+                checked   INTEGER NOT NULL DEFAULT 0,
+                archive   INTEGER NOT NULL DEFAULT 0,
+                important INTEGER NOT NULL DEFAULT 0,
+                rev       INTEGER NOT NULL DEFAULT 0,
+                src       TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_archive_date ON tasks (archive, date);
+            CREATE INDEX IF NOT EXISTS idx_tasks_checked ON tasks (checked);
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(tasks)")}
+        with self.conn:
+            # База от версии без номеров правок (или без их авторов)
+            if "rev" not in columns:
+                self.conn.execute("ALTER TABLE tasks ADD COLUMN rev INTEGER NOT NULL DEFAULT 0")
+            if "src" not in columns:
+                self.conn.execute("ALTER TABLE tasks ADD COLUMN src TEXT")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta VALUES ('archive_version', 0);
+            CREATE TRIGGER IF NOT EXISTS archive_insert AFTER INSERT ON tasks WHEN NEW.archive = 1
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'archive_version'; END;
+            CREATE TRIGGER IF NOT EXISTS archive_update AFTER UPDATE ON tasks
+                WHEN OLD.archive = 1 OR NEW.archive = 1
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'archive_version'; END;
+            CREATE TRIGGER IF NOT EXISTS archive_delete AFTER DELETE ON tasks WHEN OLD.archive = 1
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'archive_version'; END;
+        """)
+
+        if is_new and (os.path.exists(self.json_path)
+                       or os.path.isdir(archive_dir(self.json_path))):
+            # Первый запуск на SQLite: забираем данные из JSON-хранилища
+            json_engine = JsonEngine(self.json_path, journal=True)
+            tasks_list = list(json_engine.load().values()) + json_engine.archived_tasks()
+            json_engine.close()
+            self.import_tasks(tasks_list)
+            log.info(f"Imported {len(tasks_list)} task(s) from {self.json_path}")
+
+        self._data_version = self._version(self.conn, "PRAGMA data_version")
+        self._archive_version = self._version(self.conn)
+        return tasks_by_id(self._select("WHERE archive = 0 ORDER BY rowid"))
+
+    def last_modified(self):
+        """Время последней записи в базу (с WAL), None - базы нет"""
+        times = [os.path.getmtime(p) for p in (self.path, self.path + "-wal") if os.path.exists(p)]
+        return max(times) if times else None
+
+    def watch_paths(self):
+        return [os.path.dirname(os.path.abspath(self.path)), self.path, self.path + "-wal"]
+
+    @staticmethod
+    def _version(conn, sql="SELECT value FROM meta WHERE key = 'archive_version'"):
+        return conn.execute(sql).fetchone()[0]
+
+    def poll_external(self, wait=True):
+        """Изменения, которые другие экземпляры закоммитили после load() (или прошлого вызова).
+        -> None, False или ([], активные таски, archive_changed) - как у JsonEngine.
+        Чужая запись чтение в WAL не блокирует - ждать можно только свою очередь"""
+        if not wait and not self.writer.idle():
+            return False
+        self.writer.flush()
+        data_version = self._version(self.conn, "PRAGMA data_version")
+        if data_version == self._data_version:
+            return None
+        # data_version меняется и от наших коммитов (другое соединение) - сверяем содержимое
+        self._data_version = data_version
+        archive_version = self._version(self.conn)
+        archive_changed = archive_version != self._archive_version
+        self._archive_version = archive_version
+        return [], tasks_by_id(self._select("WHERE archive = 0 ORDER BY rowid")), archive_changed
+
+    def forget_archive(self):
+        pass   # Архив не кешируется: каждый запрос идет в базу
+
+    def _row_to_task(self, row):
+        task_id, text, date_str, checked, archive, important, rev, src = row
+        return Task(uid_from_id(task_id), text, day_from_iso(date_str),
+                    (CHECKED if checked else 0) | (ARCHIVE if archive else 0)
+                    | (IMPORTANT if important else 0), None, rev, src)
+
+    def _task_to_row(self, task):
+        return (task.id, task.text, task.date,
+                int(task.checked), int(task.archive), int(task.important), task.rev, task.src)
+
+    def _select(self, where, params=()):
+        self.writer.flush()
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM tasks {where}", params)
+        return [self._row_to_task(row) for row in cursor]
+
+    def import_tasks(self, tasks_list):
+        """Вставляет/заменяет таски (по id) одной транзакцией"""
+        with self.conn:
+            self.conn.executemany(self._INSERT, [self._task_to_row(t) for t in tasks_list if t.id])
+
+    def persist(self, op, active, archived):
+        """Ставит операцию в очередь; пачка пишется одной транзакцией"""
+        with self._pending_lock:
+            self._pending_ops.append(op)
+            schedule = len(self._pending_ops) == 1
+        if schedule:
+            self.writer.call(self._write_pending)
+
+    def _write_pending(self):
+        # Поток DiskWriter
+        with self._pending_lock:
+            ops = self._pending_ops
+            self._pending_ops = []
+        if not ops:
+            return
+        if self.write_conn is None:
+            self.write_conn = sqlite3.connect(self.path)
+        conn = self.write_conn
+        with span("sqlite.write", ops=len(ops)), conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = self._version(conn)
+            for op in ops:
+                self._apply_sql(conn, op)
+            if before == self._archive_version:
+                # Архив с нашей прошлой проверки меняли только мы - перечитывать его незачем
+                self._archive_version = self._version(conn)
+
+    def _apply_sql(self, conn, op):
+        kind = op.get("op")
+        if kind == "batch":
+            for sub_op in op["ops"]:
+                self._apply_sql(conn, sub_op)
+        elif kind == "add":
+            conn.execute(self._UPSERT, self._task_to_row(Task.from_dict(op["task"])))
+        elif kind == "update":
+            fields = {k: v for k, v in op["fields"].items() if k in self.COLUMNS and k != "id"}
+            if fields:
+                values = [int(bool(v)) if k in self.BOOL_COLUMNS else v for k, v in fields.items()]
+                assignments = ", ".join(f"{k} = ?" for k in fields)
+                rev, src = record_version(op["fields"])
+                conn.execute(f"UPDATE tasks SET {assignments} WHERE id = ? AND "
+                             + self._NOT_NEWER.format(rev="?", src="?"),
+                             values + [op["id"], rev, rev, src])
+        elif kind == "delete":
+            conn.execute("DELETE FROM tasks WHERE id = ?", (op["id"],))
+        elif kind == "archive":
+            revs = op.get("revs") or [None] * len(op["ids"])
+            conn.executemany(
+                "UPDATE tasks SET archive = 1, date = ?, rev = coalesce(?, rev), src = coalesce(?, src)"
+                " WHERE id = ?",
+                [(op["date"], rev, op.get("src"), task_id) for rev, task_id in zip(revs, op["ids"])])
+
+    def archive_months(self):
+        self.writer.flush()
+        rows = self.conn.execute(
+            "SELECT DISTINCT substr(date, 1, 7) FROM tasks WHERE archive = 1 ORDER BY 1 DESC")
+        return [row[0] or "undated" for row in rows]
+
+    def archived_tasks(self, months=None):
+        """Архивные таски, от новых к старым (индекс archive, date)"""
+        if months is None:
+            return self._select("WHERE archive = 1 ORDER BY date DESC")
+        result = []
+        for month in sorted(months, reverse=True):
+            if month == "undated":
+                result.extend(self._select("WHERE archive = 1 AND (date IS NULL OR date = '')"))
+            else:
+                result.extend(self._select(
+                    "WHERE archive = 1 AND date >= ? AND date < ? ORDER BY date DESC",
+                    (month, month + "-99")))
+        return result
+
+    def _range_where(self, date_from, date_to):
+        """WHERE для архива с датой в [date_from, date_to); без даты = самые старые"""
+        conditions, params = ["archive = 1"], []
+        if date_from is not None:
+            conditions.append("date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("(date < ? OR date IS NULL)")
+            params.append(date_to)
+        return " AND ".join(conditions), params
+
+    def archive_count(self, date_from=None, date_to=None):
+        self.writer.flush()
+        where, params = self._range_where(date_from, date_to)
+        return self.conn.execute(f"SELECT COUNT(*) FROM tasks WHERE {where}", params).fetchone()[0]
+
+    def archive_counts(self, ranges):
+        # Каждый COUNT - проход по индексу (archive, date) только внутри диапазона
+        return [self.archive_count(date_from, date_to) for date_from, date_to in ranges]
+
+    def archived_range(self, date_from=None, date_to=None, offset=0, limit=None):
+        where, params = self._range_where(date_from, date_to)
+        return self._select(f"WHERE {where} ORDER BY date DESC LIMIT ? OFFSET ?",
+                            params + [-1 if limit is None else limit, offset])
+
+    def get_archived(self, task_id):
+        rows = self._select("WHERE id = ? AND archive = 1", (task_id,))
+        return rows[0] if rows else None
+
+    def archived_by_ids(self, task_ids, months=()):
+        task_ids = list(task_ids)
+        found = {}
+        for i in range(0, len(task_ids), 500):   # Не упираемся в лимит параметров SQLite
+            chunk = task_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update((t.id, t) for t in self._select(f"WHERE archive = 1 AND id IN ({marks})", chunk))
+        return [found[task_id] for task_id in task_ids if task_id in found]
+
+    def update_archived(self, task_id, fields):
+        task = self.get_archived(task_id)
+        if task is None:
+            return None
+        task.update(fields)
+        self.persist({"op": "update", "id": task_id, "fields": fields}, None, None)
+        return task
+
+    def delete_archived(self, task_id):
+        if self.get_archived(task_id) is None:
+            return False
+        self.persist({"op": "delete", "id": task_id}, None, None)
+        return True
+
+    def apply_retention(self, cutoff, codec="xz"):
+        pass   # Старые строки не мешают: правка переписывает одну строку, архив читается по индексу
+
+    def compact(self):
+        pass
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        def close_write_conn():
+            if self.write_conn is not None:
+                self.write_conn.close()
+                self.write_conn = None
+        self.writer.call(close_write_conn)
+        self.writer.close()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+ENGINES = ("json", "sqlite")
+
+
+def make_engine(name, path, journal=False):
+    """Создаёт движок хранения по имени ("json" или "sqlite")"""
+    if name == "sqlite":
+        return SqliteEngine(path)
+    if name == "json":
+        return JsonEngine(path, journal=journal)
+    raise ValueError(f"Unknown storage engine: {name!r} (expected one of {ENGINES})")
+
+
+class TaskStore:
+    """Хранилище тасков в памяти.
+
+    Активные таски читаются один раз в load(), все чтения идут из памяти,
+    каждое изменение сразу сохраняется движком (JsonEngine/SqliteEngine)
+    и рассылается подписчикам. Архив движок отдаёт по запросу.
+
+    Внутри `with store.batch():` изменения применяются в памяти сразу,
+    а сохраняются одной операцией и рассылаются одним уведомлением на выходе.
+    """
+
+    def __init__(self, path, journal=False, engine="json"):
+        self.path = path
+        self.engine = make_engine(engine, path, journal=journal)
+        self._tasks = {}            # Только активные таски: {id: Task}, в порядке списка
+        self._checked = set()       # id отмеченных активных тасков (для авто-архивации)
+        self.loaded_mtime = None    # Время последней записи данных до load() (см. last_modified)
+        self.search_index = SearchIndex(path, self.engine.writer)   # Читается при первом поиске
+        self._listeners = []
+        self._closed = False
+
+        self._batch_depth = 0
+        self._batch_ops = []
+        self._batch_archived = {}   # id -> таск, ушедший в архив внутри batch()
+        self._batch_ids = {}        # id -> None в порядке изменений; None - нужна полная перерисовка
+
+    # --- Подписки ---
+
+    def subscribe(self, listener):
+        """listener(task_ids) - task_ids: изменённые id (set или dict.keys() в порядке
+        изменений: новые таски - в порядке списка) или None (всё)"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, task_ids):
+        if self._batch_depth:
+            if task_ids is None or self._batch_ids is None:
+                self._batch_ids = None
+            else:
+                self._batch_ids.update(dict.fromkeys(task_ids))
+            return
+        for listener in list(self._listeners):
+            listener(task_ids)
+
+    @contextmanager
+    def batch(self):
+        """Одна транзакция: одна запись на диск и одно уведомление на все изменения"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._end_batch()
+
+    def _end_batch(self):
+        ops, archived, task_ids = self._batch_ops, self._batch_archived, self._batch_ids
+        self._batch_ops, self._batch_archived, self._batch_ids = [], {}, {}
+
+        if ops:
+            op = ops[0] if len(ops) == 1 else {"op": "batch", "ops": ops}
+            self.engine.persist(op, self._tasks, list(archived.values()))
+        if task_ids is None or task_ids:
+            self._notify(None if task_ids is None else task_ids.keys())
+
+    # --- Чтение ---
+
+    def load(self):
+        """Читает активные таски с диска (один раз при старте)"""
+        with span("store.load") as sp:
+            self.loaded_mtime = self.engine.last_modified()
+            self._tasks = self.engine.load()
+            self._checked = {task_id for task_id, task in self._tasks.items() if task.checked}
+            sp.set(tasks=len(self._tasks))
+        self._notify(None)
+
+    def tasks(self):
+        """Все таски, включая весь архив"""
+        return self.active_tasks() + self.archived_tasks()
+
+    def active_tasks(self):
+        return list(self._tasks.values())
+
+    def archive_months(self):
+        """Ключи месяцев архива ("2025-03"), от новых к старым"""
+        return self.engine.archive_months()
+
+    def archived_tasks(self, months=None):
+        """Архивные таски из указанных месяцев (по умолчанию - из всех), от новых к старым"""
+        return self.engine.archived_tasks(months)
+
+    def archive_count(self, date_from=None, date_to=None):
+        """Число архивных тасков с датой в [date_from, date_to) (ISO-строки, None = без границы)"""
+        return self.engine.archive_count(date_from, date_to)
+
+    def archive_counts(self, ranges):
+        """archive_count() сразу для нескольких диапазонов [(date_from, date_to)] (периоды, годы, кварталы)"""
+        return self.engine.archive_counts(ranges)
+
+    def archived_range(self, date_from=None, date_to=None, offset=0, limit=None):
+        """Страница архивных тасков с датой в [date_from, date_to), от новых к старым"""
+        return self.engine.archived_range(date_from, date_to, offset, limit)
+
+    def get(self, task_id):
+        """Таск из памяти: активные и уже прочитанные месяцы архива (диск не читается)"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            task = self._batch_archived.get(task_id)
+        if task is None:
+            task = self.engine.get_archived(task_id)
+        return task
+
+    def find_archived(self, task_id):
+        """get(), но архивный таск ищется и в еще не прочитанных месяцах: месяц
+        берется из индекса поиска (id -> день архивации), читается только он.
+        Индекс при этом не перестраивается - для update/delete/import_json"""
+        task = self.get(task_id)
+        if task is not None or not self.engine.archive_on_demand:
+            return task
+        if not self.search_index.loaded:
+            self.search_index.load(self.archive_count())
+        day = self.search_index.day_of(task_id)
+        if day is None:
+            return None
+        found = self.engine.archived_by_ids([task_id], [month_of_day(day)])
+        return found[0] if found else None
+
+    # --- Изменения ---
+
+    def _commit(self, op):
+        """Применяет операцию в памяти, сохраняет её и уведомляет подписчиков"""
+        task_ids = apply_op(self._tasks, op)
+        if not task_ids:
+            return task_ids
+
+        archived = self._pop_archived(task_ids)
+        self._update_checked(task_ids)
+
+        if self._batch_depth:
+            self._batch_ops.append(op)
+            self._batch_archived.update(tasks_by_id(archived))
+        else:
+            self.engine.persist(op, self._tasks, archived)
+        self.search_index.add_tasks(archived)
+        self._notify(task_ids)
+        return task_ids
+
+    def _pop_archived(self, task_ids):
+        # Ушедшие в архив могут быть только среди затронутых
+        return [self._tasks.pop(task_id) for task_id in task_ids
+                if task_id in self._tasks and self._tasks[task_id].archive]
+
+    def _update_checked(self, task_ids):
+        for task_id in task_ids:
+            task = self._tasks.get(task_id)
+            if task is not None and task.checked:
+                self._checked.add(task_id)
+            else:
+                self._checked.discard(task_id)
+
+    def add(self, text):
+        """Добавляет новый таск и возвращает его"""
+        new_task = new_task_record(text)
+        self._commit({"op": "add", "task": new_task})
+        return self.get(new_task["id"])
+
+    def update(self, task_id, **fields):
+        """Меняет поля таска. Возвращает False, если таск не найден"""
+        task = self.find_archived(task_id)
+        if task is None:
+            return False
+
+        changed = {k: v for k, v in fields.items() if task.field(k) != v}
+        if not changed:
+            return True
+        changed["rev"] = task.rev + 1
+        changed["src"] = self.engine.instance_id
+
+        if not task.archive:
+            # Правка несет всю запись: при равном rev у двух экземпляров
+            # оба оставят одну и ту же версию целиком, а не смесь полей
+            fields = dict(task.to_dict(), **changed)
+            del fields["id"]
+            self._commit({"op": "update", "id": task_id, "fields": fields})
+            return True
+
+        task = self.engine.update_archived(task_id, changed)
+        if task is not None and not task.archive:
+            # Разархивирование: таск возвращается в активный список
+            self.search_index.remove([task_id])
+            self._commit({"op": "add", "task": task.to_dict()})
+        else:
+            if task is not None and ("text" in changed or "date" in changed):
+                self.search_index.add_tasks([task])
+            self._notify({task_id})
+        return True
+
+    def delete(self, task_id):
+        """Полностью удаляет таск. Возвращает False, если таск не найден"""
+        if self._commit({"op": "delete", "id": task_id}):
+            return True
+
+        # find_archived() прочитает месяц таска, если его еще не читали
+        if self.find_archived(task_id) is None or not self.engine.delete_archived(task_id):
+            return False
+        self.search_index.remove([task_id])
+        self._notify({task_id})
+        return True
+
+    def checked_ids(self):
+        """id отмеченных активных тасков (ведется на лету, без прохода по списку)"""
+        return set(self._checked)
+
+    def archive_done(self, date_iso):
+        """Архивирует все 'checked' таски с датой date_iso. Возвращает их id"""
+        return self.archive(list(self._checked), date_iso)
+
+    def archive(self, task_ids, date_iso):
+        """Архивирует указанные активные таски с датой date_iso. Возвращает их id"""
+        ids = [task_id for task_id in task_ids if task_id in self._tasks]
+        if not ids:
+            return set()
+        revs = [self._tasks[task_id].rev + 1 for task_id in ids]
+        return self._commit({"op": "archive", "ids": ids, "date": date_iso, "revs": revs,
+                             "src": self.engine.instance_id})
+
+    # --- Несколько экземпляров на одних файлах ---
+
+    def check_external(self, wait=True):
+        """Подхватывает изменения, которые в те же файлы записали другие экземпляры
+        (второй процесс, другая машина через общую папку).
+
+        Меняются и рассылаются подписчикам только затронутые таски; из двух
+        версий таска остается та, у которой больше (rev, src). Возвращает set
+        их id (None - менялся архив, подписчикам ушло полное обновление).
+        wait=False (GUI-поток) - не ждать записи на диск: если файлы сейчас
+        пишут, возвращает False, и проверку нужно повторить позже.
+        """
+        if self._closed or self._batch_depth:
+            return set()
+        with span("store.check_external") as sp:
+            changes = self.engine.poll_external(wait)
+            if changes is False:
+                sp.set(busy=True)
+                return False
+            if changes is None:
+                return set()
+            ops, fresh, archive_changed = changes
+            task_ids = self._merge_active(fresh) if fresh is not None else set()
+            for op in ops:
+                task_ids |= apply_op(self._tasks, op, newer_only=True)
+            if self._pop_archived(task_ids):
+                # Месяцы, куда их унес другой экземпляр, перечитаются с диска
+                self.engine.forget_archive()
+                archive_changed = True
+            self._update_checked(task_ids)
+            sp.set(tasks=len(task_ids), archive=archive_changed)
+        if archive_changed:
+            self.search_index.unload()   # Его журнал дописывал и другой экземпляр
+            self._notify(None)
+            return None
+        task_ids = self._in_list_order(task_ids)
+        if task_ids:
+            self._notify(task_ids)
+        return task_ids
+
+    def _in_list_order(self, task_ids):
+        """set id -> те же id в порядке списка (убранные из него - в конце):
+        новые строки подписчики добавляют в конец в порядке уведомления"""
+        if len(task_ids) < 2:
+            return task_ids
+        ordered = dict.fromkeys(task_id for task_id in self._tasks if task_id in task_ids)
+        ordered.update(dict.fromkeys(task_ids))
+        return ordered.keys()
+
+    def _merge_active(self, fresh):
+        """Активные таски с диска -> в память, на местах; -> id изменившихся"""
+        task_ids = {task_id for task_id in self._tasks if task_id not in fresh}
+        for task_id in task_ids:
+            del self._tasks[task_id]
+        for task_id, task in fresh.items():
+            mine = self._tasks.get(task_id)
+            if mine is None or (task.version >= mine.version and task.to_dict() != mine.to_dict()):
+                self._tasks[task_id] = task
+                task_ids.add(task_id)
+        return task_ids
+
+    def watch_paths(self):
+        """Файлы и папки, запись в которые может означать чужие изменения (для check_external)"""
+        return self.engine.watch_paths()
+
+    # --- Поиск по архиву ---
+
+    def search(self, query, limit=None):
+        """Полнотекстовый поиск по архиву -> (сколько найдено, id первых limit, от новых к старым)"""
+        if not self.search_index.loaded:
+            self.search_index.load(self.archive_count(), self.archived_tasks)
+        with span("search.query", query=query) as sp:
+            total, task_ids = self.search_index.search(query, limit)
+            sp.set(found=total)
+        return total, task_ids
+
+    def archived_by_ids(self, task_ids):
+        """Архивные таски по id (результаты search), в том же порядке"""
+        months = {month_of_day(day) for day in map(self.search_index.day_of, task_ids)
+                  if day is not None}
+        return self.engine.archived_by_ids(task_ids, months)
+
+    # --- Пакетные изменения (одна запись, одно уведомление) ---
+
+    def add_many(self, texts, date_iso=None):
+        """add() для многих тасков одной транзакцией; texts читается по одному
+        (можно генератор строк). Возвращает id новых тасков"""
+        added = []
+        with self.batch():
+            for text in texts:
+                new_task = new_task_record(text, date_iso)
+                self._commit({"op": "add", "task": new_task})
+                added.append(new_task["id"])
+        return added
+
+    def update_many(self, task_ids, **fields):
+        """update() для нескольких тасков одной транзакцией. Возвращает число найденных"""
+        with self.batch():
+            return sum(1 for task_id in task_ids if self.update(task_id, **fields))
+
+    def delete_many(self, task_ids):
+        """delete() для нескольких тасков одной транзакцией. Возвращает число удалённых"""
+        with self.batch():
+            return sum(1 for task_id in task_ids if self.delete(task_id))
+
+    # --- Импорт / экспорт ---
+
+    def export_json(self, path, pretty=False):
+        """Выгружает все таски (с архивом) одним файлом; pretty=True - с отступами"""
+        tasks_list = tasks_to_dicts(self.tasks())
+        write_tasks(path, tasks_list, pretty=pretty)
+        return len(tasks_list)
+
+    def import_json(self, path):
+        """Добавляет таски из файла любой версии формата (совпавшие id заменяются)"""
+        imported = read_tasks(path)
+        with self.batch():
+            for task in imported:
+                if not task.get("id"):
+                    continue
+                if self.find_archived(task["id"]) is not None:
+                    self.delete(task["id"])
+                # Архивные таски _commit сразу же унесёт в архив
+                self._commit({"op": "add", "task": task})
+        return len(imported)
+
+    def apply_retention(self, cold_after_months, codec="xz"):
+        """Архив старше cold_after_months месяцев сжимается в холодные сегменты (0 - не трогать).
+        codec - "xz" или "gz" (COLD_CODECS). Запись идет в фоне"""
+        if cold_after_months:
+            self.engine.apply_retention(cold_cutoff(cold_after_months), codec)
+
+    def compact(self):
+        self.engine.compact()
+
+    def flush(self):
+        """Дожидается, пока все изменения будут записаны на диск"""
+        self.engine.flush()
+
+    def close(self):
+        """Дописывает очередь записи и закрывает хранилище (вызывать при выходе).
+        Повторный вызов безопасен"""
+        if self._closed:
+            return
+        self._closed = True
+        self.engine.close()
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskstore import TaskStore
+
+
+@pytest.fixture
+def tasks_path(tmp_path, monkeypatch):
+    """Файл данных во временной папке; сокет экземпляра - тоже там (чужой traytodo не отвечает)"""
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    return str(tmp_path / "tasks_small.json")
+
+
+@pytest.fixture
+def open_store(tasks_path):
+    """open_store(**kwargs) -> загруженный TaskStore над tasks_path; все закрываются после теста"""
+    stores = []
+
+    def open_(**kwargs):
+        store = TaskStore(tasks_path, **kwargs)
+        store.load()
+        stores.append(store)
+        return store
+
+    yield open_
+    for store in stores:
+        store.close()
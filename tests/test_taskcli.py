@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import taskcli
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_add_then_list_json(tasks_path, capsys, engine):
+    assert taskcli.main(["add", "first", "  ", "second", "--date", "2026-10-18"], tasks_path, engine=engine) == 0
+    ids = capsys.readouterr().out.split()
+    assert len(ids) == 2
+
+    assert taskcli.main(["list", "--json"], tasks_path, engine=engine) == 0
+    listed = json.loads(capsys.readouterr().out)
+    assert [(d["id"], d["text"], d["date"]) for d in listed] == [
+        (ids[0], "first", "2026-10-18"), (ids[1], "second", "2026-10-18")]
+
+
+def test_archive_then_list_archived(tasks_path, open_store, capsys):
+    store = open_store()
+    done = store.add("done").id
+    store.update(done, checked=True)
+    store.close()
+
+    assert taskcli.main(["archive", "--date", "2026-10-17"], tasks_path) == 0
+    assert capsys.readouterr().out.strip() == "Archived 1 task(s)."
+    assert taskcli.main(["list", "--archived", "--json"], tasks_path) == 0
+    assert [d["id"] for d in json.loads(capsys.readouterr().out)] == [done]
+
+
+def test_window_command_without_instance(tasks_path, capsys):
+    assert taskcli.main(["show"], tasks_path) == 1
+    assert "not running" in capsys.readouterr().err
@@ -0,0 +1,170 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+
+import traytodo
+from traytodo import QtCore
+
+
+@pytest.fixture
+def model(open_store):
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    model = traytodo.TaskListModel(open_store(), QtWidgets.QApplication.font())
+    model.reload()
+    return model
+
+
+def rows(model):
+    return [model.data(model.index(row)) for row in range(model.rowCount())]
+
+
+def record_signals(model):
+    """-> список сигналов модели по мере прихода: ("insert", первая, последняя) и т.п."""
+    events = []
+    model.rowsInserted.connect(lambda parent, first, last: events.append(("insert", first, last)))
+    model.rowsRemoved.connect(lambda parent, first, last: events.append(("remove", first, last)))
+    model.dataChanged.connect(lambda top, bottom: events.append(("change", top.row(), bottom.row())))
+    model.modelReset.connect(lambda: events.append(("reset",)))
+    return events
+
+
+def test_rows_follow_store_by_id(model):
+    store = model.store
+    a, b, c = (store.add(text).id for text in "abc")
+    events = record_signals(model)
+
+    store.update(b, text="b2", important=True)
+    assert rows(model) == ["a", "b2", "c"]
+    assert model.data(model.index(1), QtCore.Qt.FontRole).bold()
+    store.delete(a)
+    store.update(c, checked=True)
+    store.archive_done("2026-10-01")
+    assert rows(model) == ["b2"]
+    # Трогаются только изменившиеся строки, без сброса модели
+    assert events == [("change", 1, 1), ("remove", 0, 0), ("change", 1, 1), ("remove", 1, 1)]
+
+
+def test_set_data_goes_to_store(model):
+    store = model.store
+    a = store.add("a").id
+    assert model.setData(model.index(0), "  a2 ", QtCore.Qt.EditRole)
+    assert not model.setData(model.index(0), "   ", QtCore.Qt.EditRole)   # Пустой текст не сохраняется
+    assert model.setData(model.index(0), QtCore.Qt.CheckState.Checked.value, QtCore.Qt.CheckStateRole)
+    assert store.get(a).text == "a2" and store.get(a).checked
+
+
+def test_full_reload_on_load(model):
+    store = model.store
+    for text in "abc":
+        store.add(text)
+    store.flush()
+    events = record_signals(model)
+    store.load()
+    assert rows(model) == ["a", "b", "c"]
+    assert events == [("reset",)]
+
+
+# --- Архив ---
+
+def archive_tree(model):
+    """[(заголовок периода, [тексты тасков])], с догрузкой строк, как при раскрытии"""
+    tree = []
+    for row in range(model.rowCount()):
+        header = model.index(row, 0)
+        while model.canFetchMore(header):
+            model.fetchMore(header)
+        tree.append((model.data(header),
+                     [model.data(model.index(i, 0, header), traytodo.TEXT_ROLE) for i in range(model.rowCount(header))]))
+    return tree
+
+
+def archive(store, text, date_iso):
+    task_id = store.add(text).id
+    store.update(task_id, checked=True)
+    store.archive_done(date_iso)
+    return task_id
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_archive_groups_by_period(open_store, engine):
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    store = open_store(engine=engine)
+    today = date.today()
+    archive(store, "old", "2020-01-05")
+    archive(store, "today", today.isoformat())
+    archive(store, "yesterday", (today - timedelta(days=1)).isoformat())
+    archive(store, "older", "2020-01-06")
+
+    model = traytodo.ArchiveTreeModel(store, QtWidgets.QApplication.font())
+    model.reload()
+    assert archive_tree(model) == [("Сегодня (1)", ["today"]), ("Вчера (1)", ["yesterday"]),
+                                   ("Позднее (2)", ["older", "old"])]
+
+
+def test_archive_period_is_fetched_in_chunks(open_store, monkeypatch):
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    monkeypatch.setattr(traytodo, "ARCHIVE_FETCH_CHUNK", 2)
+    store = open_store()
+    for day in range(1, 6):
+        archive(store, f"t{day}", f"2020-01-{day:02d}")
+
+    model = traytodo.ArchiveTreeModel(store, QtWidgets.QApplication.font())
+    model.reload()
+    header = model.index(0, 0)
+    assert model.rowCount(header) == 0 and model.hasChildren(header)
+    fetched = []
+    while model.canFetchMore(header):
+        model.fetchMore(header)
+        fetched.append(model.rowCount(header))
+    assert fetched == [2, 4, 5]
+    assert [model.data(model.index(i, 0, header), traytodo.TEXT_ROLE) for i in range(5)] == \
+        ["t5", "t4", "t3", "t2", "t1"]
+
+
+def test_row_index_after_removals(model):
+    store = model.store
+    ids = [store.add(f"t{i}").id for i in range(6)]
+    store.delete(ids[1])
+    store.delete(ids[3])
+    ids.append(store.add("t6").id)
+    store.update(ids[4], text="t4b")   # Ищет строку по недостроенному индексу
+    assert rows(model) == ["t0", "t2", "t4b", "t5", "t6"]
+    for row in range(model.rowCount()):
+        assert model.row_of(model.data(model.index(row), traytodo.TASK_ID_ROLE)) == row
+    assert model.row_of(ids[1]) == -1
+
+
+def test_batch_changes_rows_once(model, monkeypatch):
+    store = model.store
+    ids = [store.add(f"t{i}").id for i in range(5)]
+    events = record_signals(model)
+    assert store.update_many(ids[1:3], important=True) == 2
+    assert sorted(events) == [("change", 1, 1), ("change", 2, 2)]
+
+    monkeypatch.setattr(traytodo, "BULK_RESET_THRESHOLD", 2)
+    del events[:]
+    assert store.delete_many(ids[:3]) == 3
+    assert events == [("reset",)]   # Много изменений сразу - сброс вместо построчных сигналов
+    assert rows(model) == ["t3", "t4"]
+
+
+def test_new_rows_keep_store_order(model, open_store):
+    store = model.store
+    store.add("first")
+    events = record_signals(model)
+    texts = [f"t{i}" for i in range(20)]
+    store.add_many(texts, "2026-10-01")
+    assert rows(model) == ["first"] + texts
+    assert events == [("insert", row, row) for row in range(1, 21)]
+
+    # Таски, добавленные другим экземпляром, встают в том же порядке
+    other = open_store()
+    other_texts = [f"o{i}" for i in range(20)]
+    other.add_many(other_texts, "2026-10-01")
+    other.flush()
+    store.check_external()
+    assert rows(model) == [task.text for task in store.active_tasks()] == ["first"] + texts + other_texts
@@ -0,0 +1,546 @@
+import os
+import json
+
+import pytest
+
+import serializer
+import taskstore
+from searchindex import search_index_path
+from taskstore import DiskWriter, FileLock, journal_path, archive_dir, cold_dir, write_tasks
+
+
+def texts(tasks_list):
+    return sorted(task.text for task in tasks_list)
+
+
+def reopen(store, open_store, **kwargs):
+    store.close()
+    return open_store(**kwargs)
+
+
+# --- Журнал ---
+
+def test_journal_replay_after_archive_delete_edit(open_store):
+    store = open_store(journal=True)
+    a, b, c, d = (store.add(text).id for text in "abcd")
+    store.update(a, checked=True)
+    store.archive_done("2026-10-02")
+    store.delete(b)
+    store.update(c, text="c2", important=True)
+
+    store = reopen(store, open_store, journal=True)
+    assert [task.id for task in store.active_tasks()] == [c, d]
+    assert store.get(c).text == "c2" and store.get(c).important
+    assert store.get(b) is None
+    assert [task.id for task in store.archived_tasks()] == [a]
+    assert store.get(a).date == "2026-10-02"
+
+
+def test_journal_replay_after_compact(open_store, tasks_path):
+    store = open_store(journal=True)
+    a, b = store.add("a").id, store.add("b").id
+    store.update(a, checked=True)
+    store.archive_done("2026-10-03")
+    store.compact()
+    store.delete(b)
+    store.add("c")
+
+    store = reopen(store, open_store, journal=True)
+    assert os.path.exists(tasks_path)
+    assert texts(store.active_tasks()) == ["c"]
+    assert texts(store.archived_tasks()) == ["a"]
+
+
+def test_journal_replays_interrupted_compaction(open_store, tasks_path):
+    store = open_store(journal=True)
+    store.add("a")
+    store.close()
+    # Сжатие упало после переименования журнала, а потом пришли новые операции
+    os.replace(journal_path(tasks_path), journal_path(tasks_path) + ".compacting")
+    store = open_store(journal=True)
+    store.add("b")
+
+    store = reopen(store, open_store, journal=True)
+    assert texts(store.active_tasks()) == ["a", "b"]
+    assert not os.path.exists(journal_path(tasks_path) + ".compacting")
+
+
+def test_journal_ignores_torn_last_line(open_store, tasks_path):
+    store = open_store(journal=True)
+    store.add("a")
+    store.close()
+    with open(journal_path(tasks_path), "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "task": {"id": "x", "te')
+
+    store = open_store(journal=True)
+    assert texts(store.active_tasks()) == ["a"]
+
+
+# --- Архив по месяцам ---
+
+def test_archived_task_in_unread_month(open_store):
+    store = open_store()
+    a, b = store.add_many(["a", "b"], "2026-10-01")
+    store.archive([a], "2026-08-05")
+    store.archive([b], "2026-09-05")
+
+    store = reopen(store, open_store)
+    assert store.get(a) is None   # get() не читает диск
+    assert store.find_archived(a).text == "a"
+    assert store.update(b, text="b2")
+    assert store.delete(a)
+
+    store = reopen(store, open_store)
+    assert store.find_archived(a) is None
+    assert texts(store.archived_tasks()) == ["b2"]
+
+
+def test_lookup_never_rebuilds_search_index(open_store, tasks_path):
+    store = open_store()
+    a, b = store.add_many(["a", "b"], "2026-10-01")
+    store.archive([a], "2026-08-05")
+    store.delete(b)
+    assert store.get(b) is None
+    assert not store.search_index.loaded   # Промах get() индекс не трогает
+
+    store.close()
+    os.remove(search_index_path(tasks_path) + "l")   # Индекс отстал от архива
+    store = open_store()
+    assert store.find_archived(a) is None
+    assert not store.search_index.loaded
+    assert not os.path.exists(search_index_path(tasks_path))
+    assert store.search("a") == (1, [a])      # Поиск перестраивает
+    assert store.find_archived(a).text == "a"
+
+
+def read_tasks(path):
+    return list(serializer.iter_tasks(path))
+
+
+def test_archive_lives_in_month_files(open_store, tasks_path):
+    store = open_store()
+    a, b, c = (store.add(text).id for text in "abc")
+    store.update(a, checked=True)
+    store.archive_done("2026-09-30")
+    store.update(b, checked=True)
+    store.archive_done("2026-10-01")
+    store.flush()
+
+    assert [t["id"] for t in read_tasks(tasks_path)] == [c]
+    assert [t["id"] for t in read_tasks(os.path.join(archive_dir(tasks_path), "2026-09.json"))] == [a]
+
+    store = reopen(store, open_store)
+    assert store.archive_months() == ["2026-10", "2026-09"]
+    assert texts(store.archived_tasks(["2026-09"])) == ["a"]
+    assert store.update(a, text="a2")
+    store = reopen(store, open_store)
+    assert texts(store.archived_tasks()) == ["a2", "b"]
+
+
+def test_single_file_archive_is_migrated(open_store, tasks_path):
+    old = [
+        {"id": "1", "text": "active", "date": "2026-10-01", "checked": False, "archive": False, "important": False},
+        {"id": "2", "text": "old", "date": "2026-08-15", "checked": True, "archive": True, "important": False},
+    ]
+    with open(tasks_path, "w", encoding="utf-8") as f:
+        json.dump(old, f)
+
+    store = open_store()
+    store.flush()
+    assert texts(store.active_tasks()) == ["active"]
+    assert [t["id"] for t in read_tasks(tasks_path)] == ["1"]
+    assert [t["id"] for t in read_tasks(os.path.join(archive_dir(tasks_path), "2026-08.json"))] == ["2"]
+
+
+def test_journal_replay_keeps_archived_edits(open_store):
+    store = open_store(journal=True)
+    a, b = store.add("a").id, store.add("b").id
+    store.update(a, checked=True)
+    store.update(b, checked=True)
+    store.archive_done("2026-10-02")
+    store.update(a, text="a2")
+    store.delete(b)
+
+    store = reopen(store, open_store, journal=True)
+    assert texts(store.archived_tasks()) == ["a2"]
+    assert store.active_tasks() == []
+
+
+def test_migration_replaces_copies_left_in_month(open_store, tasks_path):
+    # Падение между записью месяца и активного файла: таск в двух местах
+    task = {"id": "2", "text": "new", "date": "2026-08-15", "checked": True, "archive": True, "important": False}
+    os.makedirs(archive_dir(tasks_path))
+    with open(os.path.join(archive_dir(tasks_path), "2026-08.json"), "w", encoding="utf-8") as f:
+        json.dump([dict(task, text="old"), dict(task, id="3", text="other")], f)
+    with open(tasks_path, "w", encoding="utf-8") as f:
+        json.dump([task], f)
+
+    store = open_store()
+    assert texts(store.archived_tasks()) == ["new", "other"]
+
+
+# --- Два экземпляра на одних файлах ---
+
+@pytest.mark.parametrize("journal", [True, False])
+def test_two_instances_merge(open_store, journal):
+    first = open_store(journal=journal)
+    second = open_store(journal=journal)
+
+    a = first.add("a").id
+    first.flush()
+    assert a in second.check_external()
+    assert second.get(a).text == "a"
+
+    second.update(a, text="a2")
+    second.add("b")
+    second.flush()
+    first.check_external()
+    assert first.get(a).text == "a2"
+    assert texts(first.active_tasks()) == ["a2", "b"]
+
+    # Устаревшая правка (меньший rev) не затирает свежую
+    first.update(a, text="stale")
+    second.update(a, text="a3")
+    second.update(a, text="a4")
+    first.flush()
+    second.flush()
+    second.check_external()
+    first.check_external()
+    assert second.get(a).text == "a4"
+    assert first.get(a).text == "a4"
+
+
+@pytest.mark.parametrize("engine, journal", [("json", True), ("json", False), ("sqlite", False)])
+def test_two_instances_break_rev_ties_the_same_way(open_store, engine, journal):
+    first = open_store(engine=engine, journal=journal)
+    second = open_store(engine=engine, journal=journal)
+    a = first.add("a").id
+    first.flush()
+    second.check_external()
+
+    # Обе правки - rev 1: побеждает одна и та же у обоих, целиком
+    first.update(a, text="first")
+    second.update(a, important=True)
+    first.flush()
+    second.flush()
+    first.check_external()
+    second.check_external()
+    assert first.get(a).to_dict() == second.get(a).to_dict()
+    winner = max(first, second, key=lambda store: store.engine.instance_id)
+    assert first.get(a).src == winner.engine.instance_id
+    assert (first.get(a).text, first.get(a).important) == (("first", False) if winner is first else ("a", True))
+
+    third = open_store(engine=engine, journal=journal)
+    assert third.get(a).to_dict() == first.get(a).to_dict()
+
+
+def test_check_external_does_not_wait_for_writers(open_store):
+    first = open_store(journal=True)
+    second = open_store(journal=True)
+    a = first.add("a").id
+    assert first.check_external(wait=False) is False   # Свое еще в очереди записи
+    first.flush()
+
+    other = FileLock(first.engine.lock.path)   # Другой процесс пишет файлы
+    assert other.acquire(blocking=False)
+    try:
+        assert not second.engine.lock.acquire(blocking=False)
+        assert second.check_external(wait=False) is False
+    finally:
+        other.release()
+    assert a in second.check_external(wait=False)
+
+
+def test_two_instances_archive(open_store):
+    first = open_store(journal=True)
+    second = open_store(journal=True)
+    a = first.add("a").id
+    first.add("b")
+    first.flush()
+    second.check_external()
+
+    first.archive([a], "2026-10-02")
+    first.flush()
+    assert second.check_external() is None   # Менялся архив - полное обновление
+    assert texts(second.active_tasks()) == ["b"]
+    assert texts(second.archived_tasks()) == ["a"]
+
+
+# --- Холодные сегменты ---
+
+def test_cold_segment_edit_then_retention(open_store, tasks_path):
+    store = open_store()
+    ids = store.add_many([f"t{i}" for i in range(6)], "2020-01-10")
+    store.archive(ids[:3], "2020-01-15")
+    store.archive(ids[3:], "2020-02-15")
+    store.apply_retention(12)
+    store.flush()
+    assert not any(name.startswith("2020-") for name in os.listdir(archive_dir(tasks_path)))
+    assert os.listdir(cold_dir(tasks_path))
+
+    # Правка возвращает месяц из холодного сегмента в обычный файл
+    store = reopen(store, open_store)
+    assert store.update(ids[0], text="edited")
+    assert store.delete(ids[4])
+    store.flush()
+    assert os.path.exists(os.path.join(archive_dir(tasks_path), "2020-01.json"))
+
+    store.apply_retention(12, codec="gz")
+    store.flush()
+    store = reopen(store, open_store)
+    assert texts(store.archived_tasks()) == ["edited", "t1", "t2", "t3", "t5"]
+    assert store.get(ids[0]).text == "edited"
+    assert store.archive_count() == 5
+
+
+# --- Движки хранения ---
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_engines_keep_the_same_tasks(open_store, engine):
+    store = open_store(engine=engine)
+    a, b, c = (store.add(text).id for text in "abc")
+    store.update(a, checked=True)
+    store.archive_done("2026-09-30")
+    store.update(a, text="a2")
+    store.update(b, important=True)
+    store.delete(c)
+
+    store = reopen(store, open_store, engine=engine)
+    assert [t.id for t in store.active_tasks()] == [b]
+    assert store.get(b).important
+    assert store.archive_months() == ["2026-09"]
+    assert [(t.text, t.archive) for t in store.archived_tasks()] == [("a2", True)]
+    assert store.get(c) is None
+
+
+def test_sqlite_imports_json_data_on_first_run(open_store):
+    store = open_store(journal=True)
+    a = store.add("a").id
+    store.add("b")
+    store.update(a, checked=True)
+    store.archive_done("2026-09-30")
+
+    store = reopen(store, open_store, engine="sqlite")
+    assert texts(store.active_tasks()) == ["b"]
+    assert texts(store.archived_tasks()) == ["a"]
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_export_import_round_trip(open_store, tmp_path, engine):
+    store = open_store(engine=engine)
+    a = store.add("a").id
+    store.add("b")
+    store.update(a, checked=True)
+    store.archive_done("2026-09-30")
+    export_path = str(tmp_path / "export.json")
+    assert store.export_json(export_path) == 2
+
+    store.update(a, text="changed")
+    store.add("c")
+    assert store.import_json(export_path) == 2
+    assert texts(store.active_tasks()) == ["b", "c"]
+    assert texts(store.archived_tasks()) == ["a"]
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_archive_count_and_pages(open_store, engine):
+    store = open_store(engine=engine)
+    for date_iso in ["2026-08-31", "2026-09-01", "2026-09-15", "2026-09-30", "2026-10-01"]:
+        task_id = store.add(date_iso).id
+        store.update(task_id, checked=True)
+        store.archive_done(date_iso)
+
+    store = reopen(store, open_store, engine=engine)
+    assert store.archive_count() == 5
+    assert store.archive_count("2026-09-01", "2026-10-01") == 3
+    assert store.archive_count("2026-09-02", "2026-09-30") == 1
+    page = store.archived_range("2026-09-01", None, offset=1, limit=2)
+    assert [t.text for t in page] == ["2026-09-30", "2026-09-15"]
+    assert [t.text for t in store.archived_range(offset=4)] == ["2026-08-31"]
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_archive_counts_match_period_contents(open_store, engine):
+    store = open_store(engine=engine)
+    dates = ["2025-12-31", "2026-01-01", "2026-01-01", "2026-02-28", "2026-03-01", "2026-03-15", "2026-03-31"]
+    ids = [store.add(date_iso).id for date_iso in dates]
+    for task_id, date_iso in zip(ids, dates):
+        store.archive([task_id], date_iso)
+    store.update(ids[3], date="2026-01-15")   # Переезд в другой месяц
+    store.delete(ids[5])
+
+    ranges = [("2026-03-01", None), ("2026-01-01", "2026-03-01"), ("2026-01-01", "2026-01-02"),
+              (None, "2026-01-01"), ("2026-03-16", "2026-03-31"), (None, None)]
+    expected = [2, 3, 2, 1, 0, 6]
+    assert store.archive_counts(ranges) == expected
+    store = reopen(store, open_store, engine=engine)   # Размеры месяцев - из index.json
+    assert store.archive_counts(ranges) == expected
+    # Страница на стыке месяцев, от новых к старым
+    page = store.archived_range("2026-01-01", "2026-03-16", offset=1, limit=3)
+    assert [t.date for t in page] == ["2026-01-15", "2026-01-01", "2026-01-01"]
+
+
+# --- Запись в фоне ---
+
+def test_disk_writer_coalesces_replaces(tmp_path, monkeypatch):
+    written = []
+    write = taskstore.write_json_atomic
+    monkeypatch.setattr(taskstore, "write_json_atomic",
+                        lambda path, data, **kwargs: (written.append(data), write(path, data, **kwargs)))
+    path = str(tmp_path / "file.json")
+    journal = str(tmp_path / "file.jsonl")
+    writer = DiskWriter(delay=10)
+    for i in range(3):
+        writer.replace(path, [i])
+        writer.append(journal, f"{i}\n".encode())
+    writer.flush()   # Не ждет окна склейки
+    assert written == [[2]]
+    with open(journal, encoding="utf-8") as f:
+        assert f.read() == "0\n1\n2\n"
+    writer.close()
+
+
+def test_corrupt_file_is_moved_aside(open_store, tasks_path):
+    with open(tasks_path, "w", encoding="utf-8") as f:
+        f.write('[{"id": "1", "text": ')
+    store = open_store()
+    assert store.active_tasks() == []
+    assert os.path.exists(tasks_path + ".corrupt")
+
+
+def test_disk_writer_does_not_merge_replace_across_call(tmp_path):
+    path = str(tmp_path / "file.json")
+    writer = DiskWriter(delay=10)
+    writer.replace(path, ["old"])
+    writer.call(lambda: os.remove(path))
+    writer.replace(path, ["new"])
+    writer.flush()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == ["new"]
+    writer.close()
+
+
+# --- Поиск по архиву ---
+
+def archived(store, text, date_iso):
+    task_id = store.add(text).id
+    store.archive([task_id], date_iso)
+    return task_id
+
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_archive_search_by_word_prefixes(open_store, engine):
+    store = open_store(engine=engine)
+    old = archived(store, "Отчёт за январь", "2026-08-01")
+    new = archived(store, "отчет, январь и февраль", "2026-10-01")
+    archived(store, "отчет за март", "2026-09-01")
+    archived(store, "я в январе", "2026-09-02")
+
+    assert store.search("отч янв") == (2, [new, old])   # ё = е, от новых к старым
+    assert store.search("ОТЧЕТ ЯНВАРЬ", limit=1) == (2, [new])
+    assert store.search("я")[0] == 1                    # Одна буква - только целое слово
+    assert store.search("отчетность") == (0, [])
+    assert [t.text for t in store.archived_by_ids([new, old])] == ["отчет, январь и февраль", "Отчёт за январь"]
+
+
+def test_search_index_follows_changes(open_store, tasks_path):
+    store = open_store()
+    a = archived(store, "alpha one", "2026-10-01")
+    b = archived(store, "alpha two", "2026-10-02")
+    assert store.search("alpha")[0] == 2
+
+    store.update(a, text="beta one")
+    store.delete(b)
+    c = archived(store, "alpha three", "2026-10-03")
+    assert store.search("alpha") == (1, [c])
+    assert store.search("beta") == (1, [a])
+
+    # Изменения после снимка - в журнале индекса, он проигрывается при следующем чтении
+    store = reopen(store, open_store)
+    assert store.search("alpha") == (1, [c])
+    assert store.search("one") == (1, [a])
+
+    # Индекс потерян - строится заново по архиву
+    store.close()
+    os.remove(search_index_path(tasks_path))
+    store = open_store()
+    assert store.search("alpha") == (1, [c])
+
+
+# --- Отмеченные таски ---
+
+@pytest.mark.parametrize("engine", ["json", "sqlite"])
+def test_archive_done_takes_checked_tasks(open_store, engine):
+    store = open_store(engine=engine)
+    a, b, c = (store.add(text).id for text in ["a", "b", "c"])
+    store.update_many([a, b], checked=True)
+    store.update(b, checked=False)
+    store.delete(a)
+    store.update(c, checked=True)
+    store.add("d")
+
+    store = reopen(store, open_store, engine=engine)
+    assert store.archive_done("2026-10-02") == {c}
+    assert store.archive_done("2026-10-02") == set()
+    assert texts(store.active_tasks()) == ["b", "d"]
+    assert store.loaded_mtime is not None
+
+
+# --- Пакетные изменения ---
+
+def test_batch_is_one_record_and_one_notification(open_store, tasks_path):
+    store = open_store(journal=True)
+    a, b, c = (store.add(text).id for text in "abc")
+    store.flush()
+    with open(journal_path(tasks_path), "rb") as f:
+        lines_before = len(f.readlines())
+    notified = []
+    store.subscribe(notified.append)
+
+    with store.batch():
+        assert store.update_many([a, b, "missing"], important=True) == 2
+        store.delete(c)
+    store.flush()
+
+    assert notified == [{a, b, c}]
+    with open(journal_path(tasks_path), "rb") as f:
+        assert len(f.readlines()) == lines_before + 1
+    store = reopen(store, open_store, journal=True)
+    assert [(t.text, t.important) for t in store.active_tasks()] == [("a", True), ("b", True)]
+
+
+# --- Потоковое чтение ---
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_streaming_read_matches_full_read(tmp_path, monkeypatch, version):
+    tasks_list = [
+        {"id": f"id{i}", "text": "строка \"с\" кавычками\n" * (i % 4) + "x" * i, "date": "2026-10-18",
+         "checked": i % 2 == 0, "important": i % 3 == 0}
+        for i in range(200)
+    ]
+    path = str(tmp_path / "tasks.json")
+    if version == 1:
+        with open(path, "wb") as f:
+            f.write(serializer.dumps(tasks_list, pretty=True))
+    else:
+        write_tasks(path, tasks_list)
+
+    full = list(serializer.iter_tasks(path))
+    # Маленькие куски: значения и числа рвутся на границах
+    monkeypatch.setattr(serializer, "STREAM_READ_BYTES", 0)
+    monkeypatch.setattr(serializer, "STREAM_CHUNK", 7)
+    streamed = list(serializer.iter_tasks(path))
+    assert streamed == full == tasks_list
+
+
+def test_streaming_read_rejects_truncated_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "tasks.json")
+    write_tasks(path, [{"id": "a", "text": "a"}, {"id": "b", "text": "b"}])
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:-10])
+    monkeypatch.setattr(serializer, "STREAM_READ_BYTES", 0)
+    monkeypatch.setattr(serializer, "STREAM_CHUNK", 5)
+    with pytest.raises(serializer.DECODE_ERRORS):
+        list(serializer.iter_tasks(path))
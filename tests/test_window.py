@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+
+import traytodo
+
+
+@pytest.mark.parametrize("mode", traytodo.WINDOW_SHADOWS + ("cached", "bogus"))
+def test_any_shadow_setting_paints(mode):
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = QtWidgets.QWidget()
+    window.base_widget = QtWidgets.QWidget(window)
+    window.resize(200, 100)
+    window.show()
+    traytodo.set_window_shadow(window, mode)   # Неизвестный режим - "effect", не исключение
+    window.repaint()
+    assert window.shadow_mode == (mode if mode in traytodo.WINDOW_SHADOWS else "effect")
+    effect = window.base_widget.graphicsEffect()
+    assert (effect is not None and effect.isEnabled()) == (window.shadow_mode == "effect")
+    window.close()
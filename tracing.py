@@ -0,0 +1,176 @@
+"""Трассировка горячих путей и лог вместо print().
+
+Выключено по умолчанию: span() возвращает общий пустой контекст, count() -
+сразу return, так что в обычной сборке цена - один вызов функции.
+
+Включается переменной окружения TRAYTODO_TRACE (1 или путь к папке) или
+флагом --trace [папка]. Тогда:
+    traytodo.trace.json - Chrome trace / Perfetto (chrome://tracing, ui.perfetto.dev)
+    traytodo.log        - лог с ротацией (в оконной сборке print уходит в никуда)
+Без папки файлы кладутся рядом с tasks_small.json.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+TRACE_ENV = "TRAYTODO_TRACE"
+TRACE_FLAG = "--trace"
+TRACE_FILE_NAME = "traytodo.trace.json"
+LOG_FILE_NAME = "traytodo.log"
+LOG_MAX_BYTES = 512 * 1024
+LOG_BACKUP_COUNT = 3
+MAX_EVENTS = 200000     # Старые события выбрасываются, файл трейса не растет бесконечно
+
+log = logging.getLogger("traytodo")
+
+_enabled = False
+_trace_path = None
+_events = deque(maxlen=MAX_EVENTS)
+_counters = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+_t0 = time.perf_counter()
+
+
+def enabled():
+    return _enabled
+
+
+def _now_us():
+    return (time.perf_counter() - _t0) * 1e6
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, *exc):
+        end = _now_us()
+        event = {"name": self.name, "ph": "X", "ts": self.start, "dur": end - self.start,
+                 "pid": _pid, "tid": threading.get_ident()}
+        if self.args:
+            event["args"] = self.args
+        _events.append(event)
+        return False
+
+    def set(self, **args):
+        """Дописать аргументы, известные только к концу (сколько строк, сколько байт)"""
+        self.args.update(args)
+
+
+def span(name, **args):
+    """with span("store.load", path=...): ... - интервал в трейсе"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def count(name, value=1):
+    """Счетчик (байты записи, перестроенные строки): копится и пишется в трейс"""
+    if not _enabled:
+        return
+    with _lock:
+        total = _counters[name] = _counters.get(name, 0) + value
+    _events.append({"name": name, "ph": "C", "ts": _now_us(), "pid": _pid,
+                    "args": {name: total}})
+
+
+def instant(name, **args):
+    """Точечное событие (этапы запуска и т.п.)"""
+    if not _enabled:
+        return
+    event = {"name": name, "ph": "i", "s": "p", "ts": _now_us(), "pid": _pid,
+             "tid": threading.get_ident()}
+    if args:
+        event["args"] = args
+    _events.append(event)
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def pop_trace_arg(argv):
+    """Убирает --trace [папка] из argv (Qt его не знает). Возвращает папку, "" или None"""
+    if TRACE_FLAG not in argv:
+        return None
+    i = argv.index(TRACE_FLAG)
+    del argv[i]
+    if i < len(argv) and not argv[i].startswith("-"):
+        return argv.pop(i)
+    return ""
+
+
+def setup(default_dir, trace_arg=None, stream=None):
+    """Настраивает лог и (если просили) трассировку. Вызывается один раз при запуске.
+    stream - куда писать лог в консоль (по умолчанию stdout)"""
+    global _enabled, _trace_path
+
+    log.setLevel(logging.INFO)
+    stream = stream or sys.stdout
+    if stream is not None and not log.handlers:
+        console = logging.StreamHandler(stream)
+        console.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(console)
+
+    if trace_arg is None:
+        trace_arg = os.environ.get(TRACE_ENV)
+    if trace_arg is None or trace_arg == "0":
+        return False
+
+    trace_dir = trace_arg if trace_arg not in ("", "1") else default_dir
+    os.makedirs(trace_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(os.path.join(trace_dir, LOG_FILE_NAME),
+                                       maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                       encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(threadName)s] %(message)s"))
+    log.addHandler(file_handler)
+
+    _trace_path = os.path.join(trace_dir, TRACE_FILE_NAME)
+    _enabled = True
+    log.info(f"Tracing enabled: {_trace_path}")
+    return True
+
+
+def export(path=None):
+    """Пишет накопленные события в Chrome trace JSON (перезаписывает файл)"""
+    path = path or _trace_path
+    if not path:
+        return
+    events = list(_events)
+    events.append({"name": "process_name", "ph": "M", "pid": _pid, "args": {"name": "traytodo"}})
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                   "otherData": {"counters": counters()}}, f)
+    os.replace(tmp_path, path)
+    log.info(f"Trace written: {path} ({len(events)} events)")
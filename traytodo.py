@@ -1,9 +1,42 @@
+import time
+STARTUP_T0 = time.perf_counter()  # Отсчет для отчета о запуске (до импорта Qt)
+
 import sys
 import os
-import json
-import uuid
+
+try:
+    SCRIPT_DIR = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    SCRIPT_DIR = os.getcwd()
+
+TASKS_FILE = os.path.join(SCRIPT_DIR, "tasks_small.json")
+# Движок хранения: "json" (tasks_small.json + архив по месяцам) или "sqlite" (tasks_small.db)
+STORAGE_ENGINE = "json"
+# Для "json": изменения пишутся в журнал (tasks_small.journal.jsonl), а не перезаписью всего файла
+USE_JOURNAL = True
+# Для "json": месяцы архива старше стольких месяцев сжимаются в холодные сегменты
+# (tasks_small.archive/cold/) и распаковываются, только когда их открывают. 0 - не сжимать
+ARCHIVE_COLD_AFTER_MONTHS = 12
+ARCHIVE_COLD_CODEC = "xz"   # "xz" (lzma, плотнее) или "gz" (gzip, быстрее)
+
+if __name__ == "__main__":
+    # traytodo.py add/bulk-add/list/... - команды для скриптов, без Qt (см. taskcli.py)
+    import taskcli
+    if taskcli.is_cli(sys.argv[1:]):
+        sys.exit(taskcli.main(sys.argv[1:], TASKS_FILE, engine=STORAGE_ENGINE, journal=USE_JOURNAL))
+    # Уже запущен: показываем его окно и выходим - второй процесс с теми же файлами не нужен
+    import singleinstance
+    if singleinstance.send(TASKS_FILE, {"cmd": "show"}) is not None:
+        sys.exit(0)
+
 from PySide6 import QtWidgets, QtGui, QtCore
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time as dtime
+from taskstore import TaskStore, FileLock
+import serializer
+import singleinstance
+import taskcli
+import tracing
+from tracing import log, span, count
 
 # --- ИСПРАВЛЕНИЕ ДЛЯ ПЛАГИНА (для PySide6) ---
 import PySide6
@@ -12,16 +45,505 @@ os.environ['QT_QPA_PLATFORM_PLUGIN_PATH'] = plugin_path
 # --- КОНЕЦ ИСПРАВЛЕНИЯ ---
 
 
-try:
-    SCRIPT_DIR = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
-except NameError:
-    SCRIPT_DIR = os.getcwd()
-
-TASKS_FILE = os.path.join(SCRIPT_DIR, "tasks_small.json")
-
 GLOBAL_FONT_SIZE = 11
 GLOBAL_TEXT_COLOR = "#555"
 CHECKBOX_SIZE = 10 
+STARTUP_IDLE_BUILD_MS = 1500  # Окно строится в простое после появления иконки (или по первому клику)
+MIDNIGHT_SLACK_MS = 1000  # Таймер полуночи срабатывает чуть позже 00:00, чтобы дата уже сменилась
+MIDNIGHT_RECHECK_MS = 60 * 60 * 1000  # Но не реже раза в час: после сна/смены пояса таймер мог "уехать"
+ARCHIVE_FETCH_CHUNK = 200  # Сколько тасков архива подгружать за раз при раскрытии/прокрутке
+ARCHIVE_SEARCH_DELAY_MS = 150  # Поиск по архиву запускается, когда ввод на столько затих
+EXTERNAL_CHECK_DELAY_MS = 300  # Чужие изменения файлов данных читаются, когда события на столько затихли
+# Тень окна: "effect" - QGraphicsDropShadowEffect (окно рисуется в буфер и размывается при
+# каждой перерисовке, даже одной строки: 14-20 мс на кадр без GPU), "none" - без тени
+# (кадр строки ~1 мс). "none" - режим для слабых машин и удаленного рабочего стола
+WINDOW_SHADOW = "effect"
+WINDOW_SHADOWS = ("effect", "none")
+SHADOW_BLUR_RADIUS = 15
+SHADOW_COLOR = (0, 0, 0, 100)
+
+# Роли данных моделей (TASK_ID_ROLE совпадает с прежним QtCore.Qt.UserRole)
+TASK_ID_ROLE = QtCore.Qt.UserRole
+TEXT_ROLE = QtCore.Qt.UserRole + 1
+CHECKED_ROLE = QtCore.Qt.UserRole + 2
+IMPORTANT_ROLE = QtCore.Qt.UserRole + 3
+
+
+ROW_SIZE_WIDTHS = 4  # Сколько ширин строки помнит RowHeightCache (вьюпорт, строка вида со скроллбаром и без)
+BULK_RESET_THRESHOLD = 50  # Больше изменений за раз - модель сбрасывается целиком
+
+
+def selected_task_ids(view, clicked_index):
+    """id выделенных тасков для меню. Клик вне выделения - выделяем только его"""
+    selection = view.selectionModel()
+    if not selection.isSelected(clicked_index):
+        selection.select(clicked_index, QtCore.QItemSelectionModel.SelectionFlag.ClearAndSelect)
+    task_ids = [index.data(TASK_ID_ROLE) for index in selection.selectedIndexes()]
+    return [task_id for task_id in task_ids if task_id]
+
+
+def set_window_shadow(window, mode):
+    """Тень вокруг window.base_widget в режиме mode (см. WINDOW_SHADOW); можно менять на ходу"""
+    if mode not in WINDOW_SHADOWS:
+        log.warning(f"Unknown shadow mode {mode!r}, using {WINDOW_SHADOWS[0]!r}.")
+        mode = WINDOW_SHADOWS[0]
+    window.shadow_mode = mode
+    shadow = window.base_widget.graphicsEffect()
+    if mode == "effect" and shadow is None:
+        shadow = QtWidgets.QGraphicsDropShadowEffect(window)
+        shadow.setBlurRadius(SHADOW_BLUR_RADIUS)
+        shadow.setXOffset(0)
+        shadow.setYOffset(0)
+        shadow.setColor(QtGui.QColor(*SHADOW_COLOR))
+        window.base_widget.setGraphicsEffect(shadow)
+    if shadow is not None:
+        # Выключенный эффект не рисуется совсем; замена (setGraphicsEffect) удалила бы его
+        # в Qt, пока на него еще ссылается Python
+        shadow.setEnabled(mode == "effect")
+    window.update()
+
+
+def timed_frame(window, event, handle):
+    """window.event(): UpdateRequest - это кадр окна (вся перерисовка, тень-эффект тоже);
+    с трассировкой его время уходит в трейс (span "paint.frame")"""
+    if event.type() != QtCore.QEvent.Type.UpdateRequest:
+        return handle(event)
+    with span("paint.frame", window=type(window).__name__, shadow=window.shadow_mode):
+        return handle(event)
+
+
+class TaskListModel(QtCore.QAbstractListModel):
+    """Модель активных тасков поверх TaskStore (для QListView).
+
+    Строки - это ссылки на записи Task из хранилища, виджетов на строку нет:
+    QListView рисует только видимые строки.
+    """
+
+    def __init__(self, store, font, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.base_font = QtGui.QFont(font)
+        self._fonts = {}   # (important, checked) -> общий QFont
+        self._tasks = []
+        self._rows = {}        # id -> строка; верно для строк < _rows_valid_to
+        self._rows_valid_to = 0
+        self.store.subscribe(self.on_store_changed)
+
+    def reload(self):
+        with span("list.reload") as sp:
+            self.beginResetModel()
+            self._tasks = self.store.active_tasks()
+            self._rows = {}
+            self._rows_valid_to = 0
+            self.endResetModel()
+            sp.set(rows=len(self._tasks))
+        count("list.rows_rebuilt", len(self._tasks))
+
+    def task_font(self, important, checked):
+        key = (important, checked)
+        font = self._fonts.get(key)
+        if font is None:
+            font = QtGui.QFont(self.base_font)
+            font.setBold(important)
+            font.setStrikeOut(checked)
+            self._fonts[key] = font
+        return font
+
+    def row_of(self, task_id):
+        """Строка таска по id (-1, если нет). Индекс строк после удаления
+        достраивается лениво, только начиная с удалённой строки"""
+        row = self._rows.get(task_id)
+        if row is not None and row < self._rows_valid_to:
+            return row
+        if self._rows_valid_to < len(self._tasks):
+            for row in range(self._rows_valid_to, len(self._tasks)):
+                self._rows[self._tasks[row].id] = row
+            self._rows_valid_to = len(self._tasks)
+            return self._rows.get(task_id, -1)
+        return -1
+
+    def on_store_changed(self, task_ids):
+        """Сверка по id: вставляем, удаляем или обновляем только изменившиеся строки"""
+        if task_ids is None or len(task_ids) > BULK_RESET_THRESHOLD:
+            self.reload()
+            return
+
+        count("list.rows_rebuilt", len(task_ids))
+        for task_id in task_ids:
+            task = self.store.get(task_id)
+            row = self.row_of(task_id)
+
+            if task is None or task.archive:
+                # Удалён или ушёл в архив
+                if row >= 0:
+                    self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+                    del self._tasks[row]
+                    del self._rows[task_id]
+                    self._rows_valid_to = min(self._rows_valid_to, row)
+                    self.endRemoveRows()
+            elif row < 0:
+                # Новый таск (или вернулся из архива) - новые всегда в конце
+                row = len(self._tasks)
+                self.beginInsertRows(QtCore.QModelIndex(), row, row)
+                self._tasks.append(task)
+                self._rows[task_id] = row
+                if self._rows_valid_to == row:
+                    self._rows_valid_to = row + 1
+                self.endInsertRows()
+            else:
+                self._tasks[row] = task
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._tasks)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        task = self._tasks[index.row()]
+
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole, TEXT_ROLE):
+            return task.text
+        if role == QtCore.Qt.CheckStateRole:
+            return (QtCore.Qt.CheckState.Checked if task.checked
+                    else QtCore.Qt.CheckState.Unchecked)
+        if role == QtCore.Qt.FontRole:
+            return self.task_font(task.important, task.checked)
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignmentFlag.AlignTop
+        if role == TASK_ID_ROLE:
+            return task.id
+        if role == CHECKED_ROLE:
+            return task.checked
+        if role == IMPORTANT_ROLE:
+            return task.important
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        """Галочка или конец редактирования -> изменение в TaskStore"""
+        if not index.isValid():
+            return False
+        task_id = self._tasks[index.row()].id
+
+        if role == QtCore.Qt.CheckStateRole:
+            checked = QtCore.Qt.CheckState(value) == QtCore.Qt.CheckState.Checked
+            return self.store.update(task_id, checked=checked)
+
+        if role == QtCore.Qt.EditRole:
+            new_text = str(value).strip()
+            if not new_text:
+                return False  # Пустой текст не сохраняем - остаётся старый
+            return self.store.update(task_id, text=new_text)
+
+        return False
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.ItemFlag.NoItemFlags
+        return (QtCore.Qt.ItemFlag.ItemIsEnabled |
+                QtCore.Qt.ItemFlag.ItemIsSelectable |
+                QtCore.Qt.ItemFlag.ItemIsUserCheckable |
+                QtCore.Qt.ItemFlag.ItemIsEditable)
+
+
+class RowSizeDelegate(QtWidgets.QStyledItemDelegate):
+    """Стандартный делегат; sizeHint берется из кеша RowHeightCache"""
+
+    def __init__(self, view, cache):
+        super().__init__(view)
+        self.cache = cache
+
+    def sizeHint(self, option, index):
+        return self.cache.size_hint(option, index, super().sizeHint)
+
+
+class RowHeightCache(QtCore.QObject):
+    """Размеры строк QListView и высота содержимого без раскладки всего списка.
+
+    Размер строки - sizeHint стандартного делегата (с переносом слов). Он
+    кешируется по id вместе с (текст, важный, отмечен) и шириной и
+    пересчитывается только для строк, у которых это поменялось. Тот же кеш
+    отдает sizeHint делегату списка (RowSizeDelegate), так что и раскладка
+    вида не переносит текст заново. Ширин у строки бывает несколько (окно
+    меряет по вьюпорту, вид - по своему прямоугольнику строки), хранятся
+    последние ROW_SIZE_WIDTHS. Сумма высот при ширине вьюпорта ведется на
+    лету по сигналам модели.
+    """
+
+    def __init__(self, view, model):
+        super().__init__(view)
+        self.view = view
+        self.model = model
+        self._sizes = {}   # id -> ((текст, важный, отмечен), {ширина: QSize})
+        self._total = 0
+        self._width = None
+        self._option = None
+        self._valid = False
+        self.delegate = RowSizeDelegate(view, self)
+        view.setItemDelegate(self.delegate)
+        model.modelReset.connect(self.invalidate)
+        model.rowsInserted.connect(self._on_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._on_rows_removed)
+        model.dataChanged.connect(self._on_data_changed)
+
+    def invalidate(self):
+        """Полный пересчет при следующем запросе (строки с прежним текстом берутся из кеша)"""
+        self._valid = False
+
+    def _style_option(self):
+        if self._option is None:
+            option = QtWidgets.QStyleOptionViewItem()
+            option.initFrom(self.view)
+            # Высота 1, а не 0: для пустого rect стиль не переносит текст по ширине
+            option.rect = QtCore.QRect(0, 0, self._width, 1)
+            option.features |= QtWidgets.QStyleOptionViewItem.ViewItemFeature.WrapText
+            option.font = self.view.font()
+            option.fontMetrics = self.view.fontMetrics()
+            option.decorationSize = QtCore.QSize(16, 16)
+            option.showDecorationSelected = True
+            self._option = option
+        return self._option
+
+    def size_hint(self, option, index, measure):
+        """Размер строки index при ширине option.rect: из кеша или measure(option, index)"""
+        task_id = index.data(TASK_ID_ROLE)
+        key = (index.data(TEXT_ROLE), index.data(IMPORTANT_ROLE), index.data(CHECKED_ROLE))
+        width = option.rect.width()
+        cached = self._sizes.get(task_id)
+        if cached is None or cached[0] != key or (len(cached[1]) >= ROW_SIZE_WIDTHS and width not in cached[1]):
+            cached = self._sizes[task_id] = (key, {})
+        size = cached[1].get(width)
+        if size is None:
+            size = cached[1][width] = measure(option, index)
+            count("list.rows_measured")
+        return size
+
+    def _cached_height(self, task_id):
+        """Высота строки при ширине вьюпорта из кеша (0 - еще не мерили)"""
+        cached = self._sizes.get(task_id)
+        size = cached[1].get(self._width) if cached is not None else None
+        return 0 if size is None else size.height()
+
+    def _measure(self, row):
+        return self.delegate.sizeHint(self._style_option(), self.model.index(row)).height()
+
+    def content_height(self):
+        width = self.view.viewport().width()
+        if width != self._width:
+            self._width = width
+            self._option = None
+            self._valid = False
+        if not self._valid:
+            rows = self.model.rowCount()
+            total = 0
+            for row in range(rows):
+                total += self._measure(row)
+            if len(self._sizes) > rows:
+                alive = {self.model.index(row).data(TASK_ID_ROLE) for row in range(rows)}
+                self._sizes = {k: v for k, v in self._sizes.items() if k in alive}
+            self._total = total
+            self._valid = True
+        return self._total
+
+    def _on_rows_inserted(self, parent, first, last):
+        if self._valid:
+            for row in range(first, last + 1):
+                self._total += self._measure(row)
+
+    def _on_rows_removed(self, parent, first, last):
+        for row in range(first, last + 1):
+            task_id = self.model.index(row).data(TASK_ID_ROLE)
+            if self._valid:
+                self._total -= self._cached_height(task_id)
+            self._sizes.pop(task_id, None)
+
+    def _on_data_changed(self, top_left, bottom_right, roles=()):
+        if self._valid:
+            for row in range(top_left.row(), bottom_right.row() + 1):
+                old = self._cached_height(self.model.index(row).data(TASK_ID_ROLE))
+                self._total += self._measure(row) - old
+
+
+class ArchiveTreeModel(QtCore.QAbstractItemModel):
+    """Модель архива: заголовки периодов и таски под ними (для QTreeView).
+
+    Заголовки создаются сразу, с числом тасков в периоде. Сами таски
+    подгружаются порциями по ARCHIVE_FETCH_CHUNK, когда заголовок раскрывают
+    или прокручивают до конца (canFetchMore/fetchMore), так что открытие
+    архива не зависит от его размера.
+
+    В режиме поиска (search) вместо периодов одна группа "Найдено" с
+    результатами от новых к старым, подгружаемыми так же порциями.
+
+    internalId индекса: 0 - заголовок, N > 0 - таск в группе N-1.
+    """
+
+    def __init__(self, store, font, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.header_font = QtGui.QFont(font)
+        self.header_font.setBold(False)                   # Убираем жирность
+        self.header_font.setPointSize(GLOBAL_FONT_SIZE - 1) # Делаем шрифт меньше (10)
+        self.header_color = QtGui.QColor(GLOBAL_TEXT_COLOR)
+        self.groups = []   # [{"key", "name", "date_from", "date_to", "count", "tasks"}]
+        self._loaded_ids = set()
+
+    def has_task(self, task_id):
+        """Показан ли (подгружен ли) таск в дереве"""
+        return task_id in self._loaded_ids
+
+    def reload(self):
+        """Пересчитывает периоды и их размеры; таски не читаются"""
+        today = datetime.now().date()
+        yesterday = today - timedelta(days=1)
+        start_of_week = today - timedelta(days=today.weekday())
+        start_of_month = today.replace(day=1)
+
+        # Те же правила, что и раньше: сегодня, вчера, с начала недели,
+        # с начала месяца, остальное (и таски без даты) - "Позднее"
+        week_to = yesterday
+        month_to = min(start_of_week, yesterday)
+        later_to = min(start_of_month, month_to)
+
+        periods = [
+            ("today", "Сегодня", today, None),
+            ("yesterday", "Вчера", yesterday, today),
+            ("week", "На этой неделе", start_of_week, week_to),
+            ("month", "В этом месяце", start_of_month, month_to),
+            ("later", "Позднее", None, later_to),
+        ]
+
+        groups = []
+        with span("archive.reload") as sp:
+            ranges = []
+            for key, name, date_from, date_to in periods:
+                if date_from is not None and date_to is not None and date_from >= date_to:
+                    continue
+                date_from = date_from.isoformat() if date_from else None
+                date_to = date_to.isoformat() if date_to else None
+                ranges.append((key, name, date_from, date_to))
+
+            # Размеры всех периодов одним запросом: у хранилища это бинарный поиск по границам
+            group_counts = self.store.archive_counts([(r[2], r[3]) for r in ranges])
+            for (key, name, date_from, date_to), group_count in zip(ranges, group_counts):
+                if group_count:
+                    groups.append({"key": key, "name": name, "date_from": date_from,
+                                   "date_to": date_to, "count": group_count, "tasks": []})
+
+            self.beginResetModel()
+            self.groups = groups
+            self._loaded_ids = set()
+            self.endResetModel()
+            sp.set(groups=len(groups))
+
+    def search(self, query):
+        """Режим поиска: одна группа с найденными тасками (сами таски - в fetchMore)"""
+        with span("archive.search") as sp:
+            total, _ = self.store.search(query, ARCHIVE_FETCH_CHUNK)
+            groups = []
+            if total:
+                groups.append({"key": "search", "name": "Найдено", "date_from": None,
+                               "date_to": None, "count": total, "tasks": [], "query": query})
+
+            self.beginResetModel()
+            self.groups = groups
+            self._loaded_ids = set()
+            self.endResetModel()
+            sp.set(found=total)
+
+    def canFetchMore(self, parent):
+        if not parent.isValid() or parent.internalId() != 0:
+            return False
+        group = self.groups[parent.row()]
+        return len(group["tasks"]) < group["count"]
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        group = self.groups[parent.row()]
+        loaded = len(group["tasks"])
+        with span("archive.fetch", group=group["key"], offset=loaded):
+            if "query" in group:
+                _, task_ids = self.store.search(group["query"], loaded + ARCHIVE_FETCH_CHUNK)
+                chunk = self.store.archived_by_ids(task_ids[loaded:])
+            else:
+                chunk = self.store.archived_range(group["date_from"], group["date_to"],
+                                                  offset=loaded, limit=ARCHIVE_FETCH_CHUNK)
+        if len(chunk) < ARCHIVE_FETCH_CHUNK:
+            # Архив поменялся с момента подсчёта - больше не просим
+            group["count"] = loaded + len(chunk)
+        if not chunk:
+            return
+        self.beginInsertRows(parent, loaded, loaded + len(chunk) - 1)
+        group["tasks"].extend(chunk)
+        self._loaded_ids.update(t.id for t in chunk)
+        self.endInsertRows()
+        count("archive.rows_loaded", len(chunk))
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return bool(self.groups)
+        if parent.internalId() == 0:
+            return self.groups[parent.row()]["count"] > 0
+        return False
+
+    def index(self, row, column=0, parent=QtCore.QModelIndex()):
+        if column != 0 or row < 0:
+            return QtCore.QModelIndex()
+        if not parent.isValid():
+            if row >= len(self.groups):
+                return QtCore.QModelIndex()
+            return self.createIndex(row, 0, 0)
+        if parent.internalId() != 0:
+            return QtCore.QModelIndex()
+        group = parent.row()
+        if row >= len(self.groups[group]["tasks"]):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, 0, group + 1)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QtCore.QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, 0)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return len(self.groups)
+        if parent.internalId() == 0:
+            return len(self.groups[parent.row()]["tasks"])
+        return 0
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        if index.internalId() == 0:
+            group = self.groups[index.row()]
+            if role == QtCore.Qt.DisplayRole:
+                return f"{group['name']} ({group['count']})"
+            if role == QtCore.Qt.FontRole:
+                return self.header_font
+            if role == QtCore.Qt.ForegroundRole:
+                return self.header_color
+            return None
+
+        task = self.groups[index.internalId() - 1]["tasks"][index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return f"• {task.text}"
+        if role == TEXT_ROLE:
+            return task.text
+        if role == TASK_ID_ROLE:
+            return task.id
+        if role == CHECKED_ROLE:
+            return task.checked
+        if role == IMPORTANT_ROLE:
+            return task.important
+        return None
+
 
 class ArchiveWindow(QtWidgets.QWidget):
     """Новое окно для показа архива"""
@@ -29,12 +551,14 @@ class ArchiveWindow(QtWidgets.QWidget):
     def __init__(self, main_app):
         super().__init__()
         self.main_app = main_app  # Ссылка на главное окно (SimpleTodo)
+        self.collapsed_keys = set()  # Периоды, которые пользователь свернул
         
         # Получаем глобальный шрифт
         self.app_font = QtWidgets.QApplication.font()
         self.app_font.setPointSize(GLOBAL_FONT_SIZE)
         
         self.initUI()
+        self.main_app.store.subscribe(self.on_store_changed)
         self.load_archive()
 
     def initUI(self):
@@ -52,17 +576,17 @@ class ArchiveWindow(QtWidgets.QWidget):
                 background-color: #f0e891; 
                 border-radius: 0px; 
             }}
-            QTreeWidget {{
+            QTreeView {{
                 background-color: transparent;
                 border: none;
                 color: {GLOBAL_TEXT_COLOR}; 
                 outline: 0px; 
             }}
-            QTreeWidget::item:selected {{
-                background-color: transparent; 
+            QTreeView::item:selected {{
+                background-color: #D4CC7D; /* Выделение для пакетных действий */
                 color: {GLOBAL_TEXT_COLOR}; 
             }}
-            QTreeWidget::item:focus {{
+            QTreeView::item:focus {{
                 border: none;
                 outline: none;
             }}
@@ -90,12 +614,7 @@ class ArchiveWindow(QtWidgets.QWidget):
             }}
         """)
         
-        shadow = QtWidgets.QGraphicsDropShadowEffect(self)
-        shadow.setBlurRadius(15)
-        shadow.setXOffset(0)
-        shadow.setYOffset(0)
-        shadow.setColor(QtGui.QColor(0, 0, 0, 100))
-        self.base_widget.setGraphicsEffect(shadow)
+        set_window_shadow(self, WINDOW_SHADOW)
         
         self.layout = QtWidgets.QVBoxLayout(self.base_widget)   
         self.layout.setContentsMargins(10, 10, 10, 10)
@@ -111,11 +630,37 @@ class ArchiveWindow(QtWidgets.QWidget):
         self.title_label.setAlignment(QtCore.Qt.AlignmentFlag.AlignRight | QtCore.Qt.AlignmentFlag.AlignTop)
         self.layout.addWidget(self.title_label) 
         
-        self.list_widget = QtWidgets.QTreeWidget()
+        # Поиск по архиву (индекс - SearchIndex в TaskStore)
+        self.search_field = QtWidgets.QLineEdit()
+        self.search_field.setPlaceholderText("search")
+        self.search_field.setFont(self.app_font)
+        self.search_field.setClearButtonEnabled(True)
+        self.search_field.setStyleSheet(f"""
+            background-color: #FFFFFF; 
+            border: none; 
+            border-radius: 0px;
+            padding: 3px; 
+            color: {GLOBAL_TEXT_COLOR}; 
+        """)
+        self.layout.addWidget(self.search_field)
+        
+        # Ввод не ищет на каждую букву: ждем паузу
+        self.search_timer = QtCore.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(ARCHIVE_SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.load_archive)
+        self.search_field.textChanged.connect(self.search_timer.start)
+        
+        self.model = ArchiveTreeModel(self.main_app.store, self.app_font, self)
+        
+        self.list_widget = QtWidgets.QTreeView()
+        self.list_widget.setModel(self.model)
         
         self.list_widget.setFont(self.app_font) 
         
         self.list_widget.setHeaderHidden(True)
+        self.list_widget.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.list_widget.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
         self.list_widget.setWordWrap(True)
         self.list_widget.setIndentation(5) # Отступ
 
@@ -123,96 +668,95 @@ class ArchiveWindow(QtWidgets.QWidget):
         
         self.list_widget.setContextMenuPolicy(QtCore.Qt.ContextMenuPolicy.CustomContextMenu)
         self.list_widget.customContextMenuRequested.connect(self.show_archive_menu)
-
-    def style_header_item(self, item):
-        """Стилизует родительский элемент (заголовок)"""
-        font = item.font(0)
-        font.setBold(False)                 # Убираем жирность
-        font.setPointSize(GLOBAL_FONT_SIZE - 1) # Делаем шрифт меньше (10)
-        item.setFont(0, font)
-        
-        item.setForeground(0, QtGui.QColor(GLOBAL_TEXT_COLOR))
-        item.setExpanded(True) 
-        
-    def load_archive(self):
-        """Читает файл, сортирует, группирует по датам и показывает в QTreeWidget"""
-        self.list_widget.clear()
-        
-        today = datetime.now().date()
-        yesterday = today - timedelta(days=1)
-        start_of_week = today - timedelta(days=today.weekday())
-        start_of_month = today.replace(day=1)
-        
-        tasks_list = self.main_app.read_tasks()
-        archived_tasks = [t for t in tasks_list if t.get("archive", False)]
-        
-        archived_tasks.sort(key=lambda x: x.get("date", "0000-01-01"), reverse=True)
         
-        headers = {}
+        self.list_widget.collapsed.connect(self.on_header_toggled)
+        self.list_widget.expanded.connect(self.on_header_toggled)
 
-        for task in archived_tasks:
-            task_text = task.get("text", "---")
-            task_id = task.get("id")
-            task_date_str = task.get("date")
-
-            task_date = None
-            if task_date_str:
-                try:
-                    task_date = datetime.fromisoformat(task_date_str).date()
-                except ValueError:
-                    task_date = None 
+    def on_header_toggled(self, index):
+        """Запоминаем свёрнутые периоды, чтобы перезагрузка их не раскрывала"""
+        if not index.isValid() or index.parent().isValid():
+            return
+        key = self.model.groups[index.row()]["key"]
+        if self.list_widget.isExpanded(index):
+            self.collapsed_keys.discard(key)
+        else:
+            self.collapsed_keys.add(key)
 
-            category_key = ""
-            category_name = ""
-            
-            if task_date == today:
-                category_key = "today"
-                category_name = "Сегодня"
-            elif task_date == yesterday:
-                category_key = "yesterday"
-                category_name = "Вчера"
-            elif task_date and task_date >= start_of_week:
-                category_key = "week"
-                category_name = "На этой неделе"
-            elif task_date and task_date >= start_of_month:
-                category_key = "month"
-                category_name = "В этом месяце"
+    def load_archive(self):
+        """Пересчитывает периоды архива (или результаты поиска); таски подгрузятся при раскрытии"""
+        with span("archive.load"):
+            query = self.search_field.text().strip()
+            if query:
+                self.model.search(query)
             else:
-                category_key = "later"
-                category_name = "Позднее"
-
-            if category_key not in headers:
-                header_item = QtWidgets.QTreeWidgetItem(self.list_widget, [category_name])
-                self.style_header_item(header_item)
-                headers[category_key] = header_item 
+                self.model.reload()
             
-            parent_header = headers[category_key]
+            # Заголовки периодов раскрыты (кроме свёрнутых пользователем),
+            # раскрытие подгружает первую порцию тасков
+            self.list_widget.blockSignals(True)
+            for row, group in enumerate(self.model.groups):
+                if group["key"] not in self.collapsed_keys:
+                    self.list_widget.setExpanded(self.model.index(row, 0), True)
+            self.list_widget.blockSignals(False)
 
-            task_item = QtWidgets.QTreeWidgetItem(parent_header, [f"• {task_text}"])
-            task_item.setData(0, QtCore.Qt.UserRole, task_id) 
+    def on_store_changed(self, task_ids):
+        """Подписка на TaskStore: перерисовываем архив, только если он открыт
+        и изменился состав архива (а не, например, галочка в главном списке)"""
+        if not self.isVisible():
+            return
+        
+        if task_ids is not None:
+            store = self.main_app.store
+            archive_touched = False
+            for task_id in task_ids:
+                if self.model.has_task(task_id):
+                    archive_touched = True
+                    break
+                task = store.get(task_id)
+                if task and task.archive:
+                    archive_touched = True
+                    break
+            if not archive_touched:
+                return
+        
+        self.load_archive()
             
     def show_archive_menu(self, position):
-        """Меню для удаления"""
+        """Меню для восстановления и удаления (действует на все выделенные)"""
         
-        item = self.list_widget.itemAt(position)
-        if not item:
+        index = self.list_widget.indexAt(position)
+        if not index.isValid():
             return
             
-        task_id = item.data(0, QtCore.Qt.UserRole)
+        task_id = index.data(TASK_ID_ROLE)
         if not task_id:
             return
+        
+        task_ids = selected_task_ids(self.list_widget, index)
+        many = len(task_ids) > 1
 
         menu = QtWidgets.QMenu()
         
-        delete_action = menu.addAction("Delete permanently")
+        restore_action = menu.addAction(f"Restore ({len(task_ids)})" if many else "Restore")
+        delete_action = menu.addAction(f"Delete permanently ({len(task_ids)})" if many else "Delete permanently")
         
         action = menu.exec(self.list_widget.mapToGlobal(position))
         
+        if action is None:
+            return
         if action == delete_action:
-            self.main_app.delete_task(task_id)
+            self.main_app.delete_tasks(task_ids)
+        elif action == restore_action:
+            self.main_app.unarchive_tasks(task_ids)
 
     def show_and_position(self):
         """Показывает окно СЛЕВА от главного, ВЫРАВНИВАЯ ПО НИЖНЕМU КРАЮ"""
+        self.reposition()
+        self.show()
+        self.activateWindow()
+
+    def reposition(self):
+        """Двигает окно к главному, только если место действительно изменилось"""
         main_window_geom = self.main_app.geometry()
         main_x = main_window_geom.x()
         main_y = main_window_geom.y()
@@ -224,40 +768,188 @@ class ArchiveWindow(QtWidgets.QWidget):
         # Окно архива всегда привязано к НИЗУ главного окна.
         new_y = (main_y + main_height) - self.height()
         
-        self.move(new_x, new_y)
-        self.show()
-        self.activateWindow()
+        if self.pos() != QtCore.QPoint(new_x, new_y):
+            self.move(new_x, new_y)
+
+    def event(self, event):
+        return timed_frame(self, event, super().event)
 
     def closeEvent(self, event):
         event.ignore()
         self.hide()
 
 
+class CommandServer(QtCore.QObject):
+    """Принимает команды следующих запусков и taskcli (протокол - в singleinstance.py):
+    строка JSON запроса -> handler(запрос) -> строка JSON ответа, соединение закрывается"""
+
+    def __init__(self, handler, parent=None):
+        super().__init__(parent)
+        from PySide6 import QtNetwork   # Только для первого экземпляра и не на пути к иконке в трее
+        self.handler = handler
+        self.server = QtNetwork.QLocalServer(self)
+        self.server.setSocketOptions(QtNetwork.QLocalServer.SocketOption.UserAccessOption)
+        self.server.newConnection.connect(self.on_new_connection)
+
+    def listen(self, name, path):
+        """Слушает канал name (файла данных path). -> False, если его уже слушает
+        другой живой экземпляр (ему отправлено "show"): этому процессу надо выйти"""
+        # Проверка в начале модуля прошла до импорта Qt и построения окна. Два
+        # одновременных запуска (автозапуск и клик) оба видят свободный канал, а
+        # listen на Unix молча забирает сокет у уже слушающего. Поэтому проверка
+        # и listen - под одной блокировкой: второй запуск ждет, пока первый начнет
+        # слушать, и подключается к нему (ответ придет, когда у него пойдет цикл событий)
+        with FileLock(singleinstance.lock_path(path)):
+            channel = singleinstance.connect(path)
+            if channel is None:
+                self.server.removeServer(name)   # Сокет остался от упавшего процесса (или его нет)
+                if not self.server.listen(name):
+                    log.warning(f"Cannot listen for commands on {name}: {self.server.errorString()}")
+                return True
+        channel.call({"cmd": "show"})
+        return False
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            conn = self.server.nextPendingConnection()
+            received = bytearray()
+            conn.readyRead.connect(lambda conn=conn, received=received: self.on_ready_read(conn, received))
+            conn.disconnected.connect(conn.deleteLater)
+            if conn.bytesAvailable():
+                self.on_ready_read(conn, received)
+
+    def on_ready_read(self, conn, received):
+        received += bytes(conn.readAll())
+        if not received.endswith(b"\n"):
+            return   # Запрос пришел не целиком (большой bulk-add)
+        try:
+            request = serializer.loads(bytes(received))
+            with span("ipc.command", cmd=request.get("cmd")):
+                response = self.handler(request)
+        except Exception as e:
+            log.error(f"Command failed: {e}")
+            response = {"error": str(e)}
+        received.clear()
+        conn.write(serializer.dumps(response) + b"\n")
+        conn.flush()
+        conn.disconnectFromServer()
+
+
 class SimpleTodo(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
         
         self.archive_window = None
+        self.ui_ready = False       # Окно (виджеты, стили, тень) строится лениво - ensure_ui()
+        self.shadow_mode = None     # WINDOW_SHADOW, когда окно построено
+        self._resize_scheduled = False
+        self._chrome_height = None
+        self.tasks_loaded = False
+        self.startup_marks = {}     # Этап запуска -> мс от STARTUP_T0
         
         self.app_font = QtWidgets.QApplication.font()
         self.app_font.setPointSize(GLOBAL_FONT_SIZE)
         
         self.current_display_date = datetime.now().date()
         
+        # Один таймер до ближайшей полуночи (а не проверка каждую минуту)
         self.date_timer = QtCore.QTimer(self)
+        self.date_timer.setSingleShot(True)
+        self.date_timer.setTimerType(QtCore.Qt.TimerType.VeryCoarseTimer)
         self.date_timer.timeout.connect(self.check_date_change)
-        self.date_timer.start(60000) # Проверка каждую минуту
+        self.arm_midnight_timer()
         
-        print("############################################################")
-        print(f"### Using data file: {TASKS_FILE}")
-        print("############################################################")
+        log.info("############################################################")
+        log.info(f"### Using data file: {TASKS_FILE}")
+        log.info("############################################################")
 
-        self.initUI()
+        self.store = TaskStore(TASKS_FILE, journal=USE_JOURNAL, engine=STORAGE_ENGINE)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.store.close)
+
+        self.store.subscribe(self.on_store_changed)
+
+        # Сначала иконка в трее; таски и окно - когда цикл событий уже запущен
         self.create_tray_icon()
-        self.load_tasks()
-        
-        self.setWindowFlags(QtCore.Qt.WindowType.Tool | QtCore.Qt.WindowType.FramelessWindowHint)
-        self.setAttribute(QtCore.Qt.WidgetAttribute.WA_TranslucentBackground)
+        self.mark_startup("tray")
+        QtCore.QTimer.singleShot(0, self.load_store)
+
+    def mark_startup(self, stage):
+        """Отчет о запуске: время этапа от старта процесса (импорта модуля)"""
+        if stage in self.startup_marks:
+            return
+        elapsed_ms = (time.perf_counter() - STARTUP_T0) * 1000
+        self.startup_marks[stage] = round(elapsed_ms, 1)
+        tracing.instant("startup." + stage, ms=self.startup_marks[stage])
+        log.info(f"Startup: {stage} at {elapsed_ms:.0f} ms")
+
+    def load_store(self):
+        """Читает таски после появления иконки; окно строится позже, в простое"""
+        if self.tasks_loaded:
+            return
+        self.tasks_loaded = True
+        self.store.load()
+        self.catch_up_archive()
+        self.store.apply_retention(ARCHIVE_COLD_AFTER_MONTHS, ARCHIVE_COLD_CODEC)
+        self.watch_data_files()
+        self.mark_startup("tasks")
+        QtCore.QTimer.singleShot(STARTUP_IDLE_BUILD_MS, self.ensure_ui)
+
+    def watch_data_files(self):
+        """Следит за файлами данных: их может менять другой экземпляр (второй процесс,
+        другая машина через общую папку). Одна проверка на пачку событий"""
+        self.file_watcher = QtCore.QFileSystemWatcher(self)
+        self.external_timer = QtCore.QTimer(self)
+        self.external_timer.setSingleShot(True)
+        self.external_timer.setInterval(EXTERNAL_CHECK_DELAY_MS)
+        self.external_timer.timeout.connect(self.check_external_changes)
+        self.file_watcher.fileChanged.connect(lambda path: self.external_timer.start())
+        self.file_watcher.directoryChanged.connect(lambda path: self.external_timer.start())
+        self.update_watched_paths()
+
+    def update_watched_paths(self):
+        # Файлы, замененные через os.replace, выпадают из наблюдения - добавляем заново
+        watched = set(self.file_watcher.files()) | set(self.file_watcher.directories())
+        missing = [p for p in self.store.watch_paths() if p not in watched and os.path.exists(p)]
+        if missing:
+            self.file_watcher.addPaths(missing)
+
+    def check_external_changes(self):
+        """Перечитывает только то, что поменял другой экземпляр; модели обновят свои строки.
+        Файлы сейчас пишут (мы или другой экземпляр) - не ждем, а проверяем еще раз позже"""
+        self.update_watched_paths()
+        if self.store.check_external(wait=False) is False:
+            self.external_timer.start()
+
+    def listen_for_commands(self):
+        """Первый экземпляр: принимает команды следующих запусков (show, add, ...).
+        -> False, если первым оказался другой, одновременно запущенный экземпляр"""
+        self.command_server = CommandServer(self.handle_command, self)
+        return self.command_server.listen(singleinstance.server_name(TASKS_FILE), TASKS_FILE)
+
+    def handle_command(self, request):
+        """Команда от другого запуска: окно - здесь, таски - taskcli.execute() над нашим store"""
+        cmd = request.get("cmd")
+        if cmd == "show":
+            self.show_and_position()
+            return {}
+        if cmd == "open-archive":
+            self.show_archive_window()
+            return {}
+        self.load_store()   # Команда могла прийти раньше, чем таски прочитаны
+        return taskcli.execute(self.store, request)
+
+    def ensure_ui(self):
+        """Строит окно при первом показе (или в простое после запуска)"""
+        if self.ui_ready:
+            return
+        self.load_store()   # Окно открыли раньше, чем дошла очередь до чтения тасков
+        self.ui_ready = True
+        with span("startup.build_ui"):
+            self.initUI()
+            self.model.reload()
+            self.setWindowFlags(QtCore.Qt.WindowType.Tool | QtCore.Qt.WindowType.FramelessWindowHint)
+            self.setAttribute(QtCore.Qt.WidgetAttribute.WA_TranslucentBackground)
+        self.mark_startup("ui")
 
 
     def initUI(self):
@@ -289,12 +981,7 @@ class SimpleTodo(QtWidgets.QWidget):
             }
         """)
         
-        shadow = QtWidgets.QGraphicsDropShadowEffect(self)
-        shadow.setBlurRadius(15)
-        shadow.setXOffset(0)
-        shadow.setYOffset(0)
-        shadow.setColor(QtGui.QColor(0, 0, 0, 100))
-        self.base_widget.setGraphicsEffect(shadow)
+        set_window_shadow(self, WINDOW_SHADOW)
         
         # "внутренний" layout (с отступами) для base_widget
         self.layout = QtWidgets.QVBoxLayout(self.base_widget)   
@@ -312,30 +999,37 @@ class SimpleTodo(QtWidgets.QWidget):
         
         self.update_header() 
         
-        self.list_widget = QtWidgets.QListWidget()
+        self.model = TaskListModel(self.store, self.app_font, self)
+        
+        self.list_widget = QtWidgets.QListView()
+        self.list_widget.setModel(self.model)
         
         self.list_widget.setFont(self.app_font) 
         
         self.list_widget.setWordWrap(True)
+        # Раскладка строк порциями - длинный список не подвешивает окно
+        self.list_widget.setLayoutMode(QtWidgets.QListView.LayoutMode.Batched)
+        self.row_heights = RowHeightCache(self.list_widget, self.model)
+        self.list_widget.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
 
         self.list_widget.setStyleSheet(f"""
-            QListWidget {{
+            QListView {{
                 color: {GLOBAL_TEXT_COLOR};
                 background-color: transparent; /* Фон списка прозрачный */
                 border: none;
                 outline: 0px; /* Убирает рамку фокуса */
             }}
-            QListWidget::item:selected {{
-                background-color: transparent; /* Убирает фон выделения */
+            QListView::item:selected {{
+                background-color: #83B7D0; /* Выделение для пакетных действий */
                 color: {GLOBAL_TEXT_COLOR}; /* Оставляет обычный цвет текста */
             }}
-            QListWidget::item:focus {{
+            QListView::item:focus {{
                 border: none;
                 outline: none;
             }}
             
             /* VVVVVV (ИЗМЕНЕНИЕ: Убран border) VVVVVV */
-            QListWidget QLineEdit {{
+            QListView QLineEdit {{
                 background-color: white;
                 border: none; 
                 border-radius: 0px;
@@ -344,16 +1038,16 @@ class SimpleTodo(QtWidgets.QWidget):
             }}
             /* ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^ */
             
-            QListWidget::indicator {{
+            QListView::indicator {{
                 width: {CHECKBOX_SIZE}px;
                 height: {CHECKBOX_SIZE}px;
                 border: 1px solid {GLOBAL_TEXT_COLOR}; 
                 border-radius: 0px; 
             }}
-            QListWidget::indicator:unchecked {{
+            QListView::indicator:unchecked {{
                 background-color: #FFFFFF; 
             }}
-            QListWidget::indicator:checked {{
+            QListView::indicator:checked {{
                 background-color: {GLOBAL_TEXT_COLOR}; 
                 border: 1px solid {GLOBAL_TEXT_COLOR}; 
             }}
@@ -400,65 +1094,56 @@ class SimpleTodo(QtWidgets.QWidget):
         
         self.input_field.returnPressed.connect(self.add_task)
         
-        self.list_widget.itemChanged.connect(self.on_item_changed)
-        self.list_widget.itemDoubleClicked.connect(self.on_item_double_clicked)
+        self.list_widget.doubleClicked.connect(self.on_item_double_clicked)
         
         self.list_widget.setContextMenuPolicy(QtCore.Qt.ContextMenuPolicy.CustomContextMenu)
         self.list_widget.customContextMenuRequested.connect(self.show_main_list_menu)
 
+    def schedule_resize(self):
+        """Пересчет высоты не чаще раза за проход цикла событий, сколько бы его ни просили"""
+        if self._resize_scheduled:
+            return
+        self._resize_scheduled = True
+        QtCore.QTimer.singleShot(0, self._run_scheduled_resize)
+
+    def _run_scheduled_resize(self):
+        self._resize_scheduled = False
+        self.resize_window_to_content()
+
+    def chrome_height(self):
+        """Высота всего, кроме списка (заголовок, поле ввода, отступы) - считается один раз"""
+        if self._chrome_height is None:
+            margins = self.layout.contentsMargins()
+            self._chrome_height = (self.title_label.sizeHint().height()
+                                   + self.input_field.sizeHint().height()
+                                   + margins.top() + margins.bottom()
+                                   + self.layout.spacing() * 2)
+        return self._chrome_height
+
     def resize_window_to_content(self):
         """Пересчитывает высоту окна на основе контента"""
-        
-        # 1. Рассчитываем высоту "не-списка" (заголовок, поле ввода, отступы)
-        non_list_height = 0
-        non_list_height += self.title_label.sizeHint().height()
-        non_list_height += self.input_field.sizeHint().height()
-        
-        margins = self.layout.contentsMargins()
-        non_list_height += margins.top() + margins.bottom()
-        
-        non_list_height += self.layout.spacing() * 2 
+        with span("resize"):
+            # Высота списка - сумма закешированных высот строк, без раскладки QListView
+            list_content_height = self.row_heights.content_height() or 20
 
-        # 2. Рассчитываем высоту контента списка
-        list_content_height = 0
-        count = self.list_widget.count()
-        
-        if count == 0:
-            list_content_height = 20 
-        else:
-            # Измеряем реальное положение низа последнего элемента.
-            last_item = self.list_widget.item(count - 1)
-            rect = self.list_widget.visualItemRect(last_item)
-            list_content_height = rect.y() + rect.height()
+            # Считаем и "зажимаем" (clamp) итоговую высоту
+            final_height = self.chrome_height() + list_content_height
+            final_height = max(self.min_height, min(final_height, self.max_height))
 
-        # 3. Считаем и "зажимаем" (clamp) итоговую высоту
-        
-        total_content_height = non_list_height + list_content_height
-        
-        final_height = total_content_height
-        
-        if final_height < self.min_height:
-            final_height = self.min_height
-            
-        if final_height > self.max_height:
-            final_height = self.max_height
-            
-        # 4. Применяем высоту и корректируем позицию Y
-        
-        old_height = self.height()
-        
-        if old_height == final_height:
-            return 
+            # Применяем высоту и корректируем позицию Y
+            old_height = self.height()
+            if old_height == final_height:
+                return
 
-        self.setFixedHeight(final_height)
-        
-        if self.isVisible():
-            current_pos = self.pos()
-            new_y = current_pos.y() - (final_height - old_height)
-            self.move(current_pos.x(), new_y)
-            
-            if self.archive_window and self.archive_window.isVisible():
-                self.archive_window.show_and_position()
+            self.setFixedHeight(final_height)
+
+            if self.isVisible():
+                current_pos = self.pos()
+                new_y = current_pos.y() - (final_height - old_height)
+                self.move(current_pos.x(), new_y)
+
+                if self.archive_window and self.archive_window.isVisible():
+                    self.archive_window.reposition()
 
     def update_header(self):
         """Обновляет заголовок с датой (вызывается при запуске и в 00:00)"""
@@ -469,121 +1154,64 @@ class SimpleTodo(QtWidgets.QWidget):
         date_title = f"{date_str}, {day_str}"
         self.title_label.setText(date_title)
 
+    def arm_midnight_timer(self):
+        """Заводит таймер на ближайшую локальную полночь.
+
+        Интервал считается по aware-времени, так что переход на летнее/зимнее
+        время учитывается. QTimer идет по монотонным часам, которые во сне
+        стоят, поэтому ждем не дольше MIDNIGHT_RECHECK_MS и перепроверяем
+        дату при каждом показе окна.
+        """
+        now = datetime.now().astimezone()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), dtime.min).astimezone()
+        wait_ms = int((next_midnight - now).total_seconds() * 1000) + MIDNIGHT_SLACK_MS
+        self.date_timer.start(max(MIDNIGHT_SLACK_MS, min(wait_ms, MIDNIGHT_RECHECK_MS)))
+
+    def catch_up_archive(self):
+        """При запуске: архивирует отмеченные таски, если с последней записи сменился день"""
+        if not self.store.checked_ids() or self.store.loaded_mtime is None:
+            return
+        last_date = datetime.fromtimestamp(self.store.loaded_mtime).date()
+        if last_date < self.current_display_date:
+            # Отметить таск могли не позже последней записи данных
+            self.run_midnight_archive(last_date.isoformat())
+
     def check_date_change(self):
-        """Вызывается таймером каждую минуту."""
+        """Вызывается таймером в полночь (и при показе окна)."""
+        self.arm_midnight_timer()
         new_date = datetime.now().date()
         
         if new_date != self.current_display_date:
-            print(f"--- Обнаружена смена даты! {self.current_display_date} -> {new_date} ---")
+            log.info(f"--- Обнаружена смена даты! {self.current_display_date} -> {new_date} ---")
             
             yesterday_date_iso = self.current_display_date.isoformat()
             
             self.current_display_date = new_date
-            self.update_header()
+            if self.ui_ready:
+                self.update_header()
             
             self.run_midnight_archive(yesterday_date_iso)
 
     def run_midnight_archive(self, yesterday_date_iso):
         """Архивирует выполненные таски, устанавливая вчерашнюю дату."""
-        print(f"Запуск авто-архивации. Установка даты на: {yesterday_date_iso}")
-        
-        tasks_list = self.read_tasks()
-        tasks_changed = False
-        
-        for task in tasks_list:
-            if task.get("checked") and not task.get("archive", False):
-                task["archive"] = True
-                task["date"] = yesterday_date_iso 
-                tasks_changed = True
-                print(f" -> Авто-архивация таска {task.get('id')[:4]}...")
-
-        if tasks_changed:
-            print("Сохранение архивированных тасков...")
-            self.write_tasks(tasks_list)
-            self.load_tasks() 
-        else:
-            print("Нет тасков для авто-архивации.")
-
-    def read_tasks(self):
-        """Просто читает файл и возвращает список [..]"""
-        if not os.path.exists(TASKS_FILE):
-            return []   
-        try:
-            with open(TASKS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-        except (json.JSONDecodeError, UnicodeDecodeError, TypeError):
-            print(f"Error reading {TASKS_FILE}. File will be overwritten.")
-            return []
-
-    def write_tasks(self, tasks_list):
-        """Просто перезаписывает файл списком [..]"""
-        try:
-            with open(TASKS_FILE, "w", encoding="utf-8") as f:
-                json.dump(tasks_list, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"---!!! CRITICAL WRITE ERROR in {TASKS_FILE} !!!---")
-            print(f"---!!! Error: {e} !!!---")
-
-    def load_tasks(self):
-        """Читает файл и "рисует" QListWidget (ТОЛЬКО НЕ АРХИВНЫЕ)"""
-        
-        # VVVVVV [ ИСПРАВЛЕНИЕ МИГАНИЯ v2 ] VVVVVV
-        # "Замораживаем" весь синий виджет
-        self.base_widget.setUpdatesEnabled(False)
-        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-        
-        tasks_list = self.read_tasks() 
-        
-        self.list_widget.blockSignals(True)
-        
-        self.list_widget.clear()
+        log.info(f"Запуск авто-архивации. Установка даты на: {yesterday_date_iso}")
         
-        active_tasks = [t for t in tasks_list if not t.get("archive", False)]
-        
-        for task in active_tasks: 
-            item = QtWidgets.QListWidgetItem(task.get("text", "---"))
-            
-            font = item.font() 
-            
-            if task.get("important", False):
-                font.setBold(True)
-            
-            if task.get("checked", False):
-                font.setStrikeOut(True)
-                
-            item.setFont(font) 
-            
-            item.setFlags(
-                item.flags() | 
-                QtCore.Qt.ItemFlag.ItemIsUserCheckable |
-                QtCore.Qt.ItemFlag.ItemIsEditable 
-            )
-            
-            item.setTextAlignment(QtCore.Qt.AlignmentFlag.AlignTop)
-            
-            if task.get("checked", False):
-                item.setCheckState(QtCore.Qt.CheckState.Checked)
-            else:
-                item.setCheckState(QtCore.Qt.CheckState.Unchecked)
-            
-            item.setData(QtCore.Qt.UserRole, task.get("id"))
-            self.list_widget.addItem(item)
-            
-        self.list_widget.blockSignals(False)
-        
-        if self.archive_window and self.archive_window.isVisible():
-            self.archive_window.load_archive()
-
-        # [ ОСТАВЛЯЕМ QTimer.singleShot ]
-        # Вызов пересчета высоты (с задержкой в 0 мс)
-        QtCore.QTimer.singleShot(0, self.resize_window_to_content)
+        # Только отмеченные (store ведет их набор сам), одной операцией записи
+        with span("midnight_archive", date=yesterday_date_iso) as sp:
+            archived_ids = self.store.archive_done(yesterday_date_iso)
+            sp.set(archived=len(archived_ids))
+        # Раз в день: месяц, ставший старше срока, уходит в холодный архив
+        self.store.apply_retention(ARCHIVE_COLD_AFTER_MONTHS, ARCHIVE_COLD_CODEC)
 
-        # VVVVVV [ ИСПРАВЛЕНИЕ МИГАНИЯ v2 ] VVVVVV
-        # "Размораживаем" виджет
-        self.base_widget.setUpdatesEnabled(True)
-        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+        if archived_ids:
+            log.info(f"Авто-архивация: {len(archived_ids)} таск(ов) сохранено.")
+        else:
+            log.info("Нет тасков для авто-архивации.")
 
+    def on_store_changed(self, task_ids):
+        """Подписка на TaskStore: строки обновляет сама модель, здесь - только высота окна"""
+        if self.ui_ready:
+            self.schedule_resize()
 
     def add_task(self):
         """Добавляет новый таск"""
@@ -591,103 +1219,53 @@ class SimpleTodo(QtWidgets.QWidget):
         if not text:
             return
 
-        new_task = {
-            "id": str(uuid.uuid4()),
-            "text": text,
-            "date": datetime.now().date().isoformat(), 
-            "checked": False,
-            "archive": False,
-            "important": False 
-        }
-        
-        tasks_list = self.read_tasks()
-        tasks_list.append(new_task)
-        self.write_tasks(tasks_list)
-        
-        self.load_tasks() 
+        self.store.add(text)
         self.input_field.clear()
 
-    def on_item_changed(self, item):
-        """Срабатывает, когда мы ставим/убираем галочку ИЛИ заканчиваем редактирование."""
-        
-        task_id = item.data(QtCore.Qt.UserRole)
-        if not task_id:
-            return
-
-        tasks_list = self.read_tasks()
-        task_to_update = next((t for t in tasks_list if t.get("id") == task_id), None)
-        if not task_to_update:
-            return
-
-        new_text = item.text().strip()
-        new_checked = (item.checkState() == QtCore.Qt.CheckState.Checked)
-
-        current_text = task_to_update.get("text")
-        current_checked = task_to_update.get("checked", False)
-
-        data_changed = False
-        reload_needed = False
-
-        if new_text != current_text and new_text:
-            task_to_update["text"] = new_text
-            data_changed = True
-            
-            # [ ОСТАВЛЯЕМ QTimer.singleShot ]
-            # Нужен пересчет высоты, но без полной перезагрузки
-            reload_needed = False
-            QtCore.QTimer.singleShot(0, self.resize_window_to_content)
-
-        elif not new_text:
-            self.list_widget.blockSignals(True)
-            item.setText(current_text) 
-            self.list_widget.blockSignals(False)
-            
-        if new_checked != current_checked:
-            task_to_update["checked"] = new_checked
-            data_changed = True
-            reload_needed = True # Перезагрузка НУЖНА (для зачеркивания)
-
-        if data_changed:
-            self.write_tasks(tasks_list)
-            if reload_needed:
-                self.load_tasks() 
-
-    def on_item_double_clicked(self, item):
+    def on_item_double_clicked(self, index):
         """Срабатывает по дабл-клику на элементе списка."""
-        self.list_widget.editItem(item)
+        self.list_widget.edit(index)
 
     def show_main_list_menu(self, position):
-        """Меню для удаления и важности"""
-        item = self.list_widget.itemAt(position)
-        if not item:
+        """Меню для удаления и важности (действует на все выделенные таски)"""
+        index = self.list_widget.indexAt(position)
+        if not index.isValid():
             return
         
-        task_id = item.data(QtCore.Qt.UserRole)
+        task_id = index.data(TASK_ID_ROLE)
         if not task_id:
             return
             
-        
-        tasks_list = self.read_tasks()
-        current_task = next((t for t in tasks_list if t.get("id") == task_id), None)
-        if not current_task:
+        task_ids = selected_task_ids(self.list_widget, index)
+        tasks = [t for t in (self.store.get(i) for i in task_ids) if t]
+        if not tasks:
             return 
             
-        is_important = current_task.get("important", False)
+        is_important = all(t.important for t in tasks)
+        many = len(tasks) > 1
 
         menu = QtWidgets.QMenu()
         
         # 1. Edit
         edit_icon = self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_FileIcon)
         edit_action = menu.addAction(edit_icon, "Edit")
+        edit_action.setEnabled(not many)
         
         # 2. Important
         important_action = menu.addAction("Important") 
         important_action.setCheckable(True)
         important_action.setChecked(is_important)
         
+        # 2a. Только для нескольких выделенных
+        check_action = uncheck_action = archive_action = None
+        if many:
+            check_action = menu.addAction("Check")
+            uncheck_action = menu.addAction("Uncheck")
+            archive_action = menu.addAction("Archive")
+        
         # 3. Delete
         delete_icon = self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DialogCloseButton)
-        delete_action = menu.addAction(delete_icon, "Delete") 
+        delete_action = menu.addAction(delete_icon, f"Delete ({len(tasks)})" if many else "Delete") 
         
         # 4. Разделитель
         menu.addSeparator()
@@ -699,69 +1277,61 @@ class SimpleTodo(QtWidgets.QWidget):
         
         action = menu.exec(self.list_widget.mapToGlobal(position))
         
+        if action is None:
+            return
         if action == delete_action:
-            self.delete_task(task_id)
+            self.delete_tasks(task_ids)
         elif action == important_action:
-            self.toggle_important(task_id)
+            self.set_important(task_ids, not is_important)
         elif action == edit_action:
-            self.list_widget.editItem(item)
+            self.list_widget.edit(index)
+        elif action == check_action:
+            self.set_checked(task_ids, True)
+        elif action == uncheck_action:
+            self.set_checked(task_ids, False)
+        elif action == archive_action:
+            self.archive_tasks(task_ids)
         elif action == archive_all_action:
             self.archive_all_done_tasks() 
     
-    def toggle_important(self, task_id):
-        """Переключает статус 'important' для таска"""
-        print(f"Toggling 'important' for task {task_id[:4]}...")
-        tasks_list = self.read_tasks()
-        
-        task_found = False
-        for task in tasks_list:
-            if task.get("id") == task_id:
-                task["important"] = not task.get("important", False) 
-                task_found = True
-                break
-        
-        if task_found:
-            self.write_tasks(tasks_list)
-            self.load_tasks() 
-        else:
-            print(f"Error: Could not find {task_id} to toggle important.")
+    # --- Пакетные действия: одна запись на диск и одно обновление списков ---
 
+    def delete_tasks(self, task_ids):
+        """Полностью удаляет несколько тасков"""
+        deleted = self.store.delete_many(task_ids)
+        log.info(f"Deleted {deleted} task(s).")
 
-    def delete_task(self, task_id):
-        """Полностью удаляет таск из файла"""
-        print(f"Deleting task {task_id[:4]}...")
-        tasks_list = self.read_tasks()
-        
-        new_tasks_list = [t for t in tasks_list if t.get("id") != task_id]
-        
-        if len(new_tasks_list) < len(tasks_list):
-            self.write_tasks(new_tasks_list)
-            self.load_tasks() 
-        else:
-            print(f"Error: Could not find {task_id} to delete.")
+    def set_important(self, task_ids, important):
+        self.store.update_many(task_ids, important=important)
+
+    def set_checked(self, task_ids, checked):
+        self.store.update_many(task_ids, checked=checked)
+
+    def archive_tasks(self, task_ids):
+        """Архивирует выделенные таски сегодняшней датой (отмечены они или нет)"""
+        today_date_iso = datetime.now().date().isoformat()
+        with self.store.batch():
+            self.store.update_many(task_ids, checked=True)
+            archived_ids = self.store.archive(task_ids, today_date_iso)
+        log.info(f"Archived {len(archived_ids)} task(s).")
+
+    def unarchive_tasks(self, task_ids):
+        """Возвращает таски из архива в список (неотмеченными)"""
+        restored = self.store.update_many(task_ids, archive=False, checked=False)
+        log.info(f"Restored {restored} task(s) from archive.")
 
     def archive_all_done_tasks(self):
         """Перемещает все 'checked' таски в архив"""
-        print("Running 'Archive all done'...")
-        tasks_list = self.read_tasks()
-        tasks_changed = False
-        
+        log.info("Running 'Archive all done'...")
         today_date_iso = datetime.now().date().isoformat()
         
-        for task in tasks_list:
-            # Ищем все, что "checked" и "not archive"
-            if task.get("checked") and not task.get("archive", False):
-                task["archive"] = True
-                task["date"] = today_date_iso 
-                tasks_changed = True
-                print(f" -> Archiving task {task.get('id')[:4]}...")
-
-        if tasks_changed:
-            print("Saving changes and refreshing lists...")
-            self.write_tasks(tasks_list)
-            self.load_tasks() # Обновляем, чтобы они исчезли
+        # Ищем все, что "checked" и "not archive"; подписчики обновятся сами
+        archived_ids = self.store.archive_done(today_date_iso)
+
+        if archived_ids:
+            log.info(f"Archived {len(archived_ids)} task(s).")
         else:
-            print("No 'done' tasks to archive.")
+            log.info("No 'done' tasks to archive.")
 
     def create_tray_icon(self):
         self.tray_icon = QtWidgets.QSystemTrayIcon(self)
@@ -770,12 +1340,12 @@ class SimpleTodo(QtWidgets.QWidget):
         icon_path = os.path.join(SCRIPT_DIR, "traytodo.ico")
         
         if os.path.exists(icon_path):
-            print(f"Loading custom icon from: {icon_path}")
+            log.info(f"Loading custom icon from: {icon_path}")
             icon = QtGui.QIcon(icon_path)
         else:
             # Если не нашли, используем стандартную "Yes" (галочку)
-            print(f"Warning: traytodo.ico not found at {icon_path}.")
-            print("Falling back to default system icon.")
+            log.warning(f"Warning: traytodo.ico not found at {icon_path}.")
+            log.warning("Falling back to default system icon.")
             icon = self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DialogYesButton)
         
         self.tray_icon.setIcon(icon)
@@ -793,14 +1363,20 @@ class SimpleTodo(QtWidgets.QWidget):
         exit_icon = self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DialogCloseButton)
         exit_action = self.tray_menu.addAction(exit_icon, "Exit")
         
-        exit_action.triggered.connect(QtWidgets.QApplication.instance().quit)
+        exit_action.triggered.connect(self.quit_app)
         
         self.tray_icon.setContextMenu(self.tray_menu)
         
         self.tray_icon.activated.connect(self.on_tray_clicked)
 
+    def quit_app(self):
+        """Exit из трея: дописываем очередь записи на диск и выходим"""
+        self.store.close()
+        QtWidgets.QApplication.instance().quit()
+
     def show_archive_window(self):
         """Создает (если нет) и показывает окно архива"""
+        self.ensure_ui()
         if not self.archive_window:
             self.archive_window = ArchiveWindow(self)
         
@@ -813,6 +1389,8 @@ class SimpleTodo(QtWidgets.QWidget):
 
     def show_and_position(self):
         """Вычисляет позицию и показывает окно"""
+        self.ensure_ui()
+        self.check_date_change()   # После сна таймер полуночи мог еще не сработать
         screen = QtWidgets.QApplication.primaryScreen()
         if not screen:
             screen = self.screen()   
@@ -834,7 +1412,8 @@ class SimpleTodo(QtWidgets.QWidget):
         
         # [ ОСТАВЛЯЕМ ФИНАЛЬНОЕ ИСПРАВЛЕНИЕ ]
         # Гарантированно вызываем ресайз ПОСЛЕ того, как окно стало видимым.
-        QtCore.QTimer.singleShot(0, self.resize_window_to_content)
+        self.schedule_resize()
+        self.mark_startup("first_window")
 
     def on_tray_clicked(self, reason):
         if reason == QtWidgets.QSystemTrayIcon.ActivationReason.Trigger:   
@@ -845,6 +1424,9 @@ class SimpleTodo(QtWidgets.QWidget):
             else:
                 self.show_and_position()
 
+    def event(self, event):
+        return timed_frame(self, event, super().event)
+
     def closeEvent(self, event):
         event.ignore()
         self.hide()
@@ -853,10 +1435,18 @@ class SimpleTodo(QtWidgets.QWidget):
 
 # --- Запуск приложения ---
 if __name__ == "__main__":
+    # --trace [папка] или TRAYTODO_TRACE=1: трейс и лог в файлы (см. tracing.py)
+    tracing.setup(SCRIPT_DIR, tracing.pop_trace_arg(sys.argv))
+
     app = QtWidgets.QApplication(sys.argv)
     
     app.setQuitOnLastWindowClosed(False)   
     
     main_window = SimpleTodo()
+    if not main_window.listen_for_commands():
+        sys.exit(0)   # Таски еще не читались (load_store - уже в цикле событий), писать нечего
+    if tracing.enabled():
+        # После store.close (подключен в SimpleTodo) - в трейс попадет последняя запись
+        app.aboutToQuit.connect(tracing.export)
     
     sys.exit(app.exec())
\ No newline at end of file